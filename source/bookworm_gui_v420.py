@@ -5,16 +5,36 @@ import hashlib
 import base64
 import os
 import subprocess
+import sys
 import re
 import time
 import datetime
 import json
+import csv
+import itertools
+import zlib
 
 SETTINGS_FILE = "settings.json"
 THEMES_FOLDER = "themes"
 DEFAULT_SETTINGS = {
     "default_language": None,
     "theme": "classic_blue",
+    "log_retention_days": 365,
+    # Removed books are purged this long after removal (0 keeps them forever)
+    "deleted_book_retention_days": 365,
+    # Loan length in days; genre rules win over grade rules, then the default
+    "loan_periods": {"default": 14, "grades": {}, "genres": {}},
+    # One of STORAGE_PROFILES, or a profile defined under "storage_profiles"
+    "storage_profile": "desktop",
+    "storage_profiles": {},
+    # Per-task overrides of MAINTENANCE_TASKS
+    "maintenance": {},
+    # Deduplicated backup sets; "dir" is the store folder
+    "backup_store": {
+        "dir": None,
+        "daily_at_close": False,
+        "retention": {"daily": 7, "weekly": 4, "monthly": 12},
+    },
 }
 
 DEFAULT_THEMES = {
@@ -30,6 +50,290 @@ DEFAULT_THEMES = {
 
 MAX_LOGIN_ATTEMPTS = 5
 LOGIN_LOCKOUT_SECONDS = 60
+LOG_FLUSH_SIZE = 100
+LOG_FLUSH_INTERVAL_MS = 2000
+PAGE_SIZE = 200
+IMPORT_BATCH_SIZE = 5000
+EXPORT_FETCH_SIZE = 1000
+# Unreleased ID reservations (e.g. after a crash) expire after this long
+ID_RESERVATION_HOURS = 12
+
+# Connection PRAGMAs per storage profile; page_size only applies to a new file
+STORAGE_PRAGMAS = (
+    "page_size",
+    "journal_mode",
+    "synchronous",
+    "cache_size",
+    "mmap_size",
+    "temp_store",
+)
+STORAGE_PROFILES = {
+    # Local disk: WAL, 64 MB of cache and mmap
+    "desktop": {
+        "page_size": 4096,
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -65536,
+        "mmap_size": 268435456,
+        "temp_store": "MEMORY",
+    },
+    # Old lab PCs: 2 MB of cache, no mmap, sorts spill to disk
+    "low-memory": {
+        "page_size": 4096,
+        "journal_mode": "DELETE",
+        "synchronous": "NORMAL",
+        "cache_size": -2048,
+        "mmap_size": 0,
+        "temp_store": "FILE",
+    },
+    # Database on a USB stick: no -wal/-shm files, full fsync, no mmap
+    "usb-portable": {
+        "page_size": 8192,
+        "journal_mode": "TRUNCATE",
+        "synchronous": "FULL",
+        "cache_size": -16384,
+        "mmap_size": 0,
+        "temp_store": "MEMORY",
+    },
+}
+# Rows seeded into each scratch database by benchmark_storage_profiles()
+STORAGE_BENCHMARK_SCALE = {
+    "books": 5000,
+    "readers": 500,
+    "loans": 20000,
+    "logs": 20000,
+}
+# Maintenance tasks: how often each is due and its time budget
+MAINTENANCE_TASKS = {
+    "optimize": {"interval_hours": 24, "budget_seconds": 2},
+    "analyze": {"interval_hours": 168, "budget_seconds": 10},
+    "incremental_vacuum": {"interval_hours": 24, "budget_seconds": 5},
+    "quick_check": {"interval_hours": 168, "budget_seconds": 10},
+    "consistency_check": {"interval_hours": 168, "budget_seconds": 2},
+}
+MAINTENANCE_IDLE_SECONDS = 300
+MAINTENANCE_POLL_MS = 60000
+# Pages copied per step of an online backup
+BACKUP_STEP_PAGES = 256
+BACKUP_STEP_SLEEP = 0.01
+# Full backups are encrypted in blocks of this size
+ENCRYPTED_BLOCKS_MAGIC = b"bookworm-blocks-1\n"
+ENCRYPTED_BLOCK_SIZE = 4 * 1048576
+# Backup set chunks: MIN..MAX pages, cut after a page whose CRC has the mask bits clear
+BACKUP_CHUNK_MIN_PAGES = 4
+BACKUP_CHUNK_MAX_PAGES = 64
+BACKUP_CHUNK_MASK = 0xF
+# A new set is written at close when the newest one is older than this
+BACKUP_SET_INTERVAL_HOURS = 20
+# Rows ANALYZE samples per index, so statistics stay cheap on big tables
+MAINTENANCE_ANALYSIS_LIMIT = 1000
+VACUUM_STEP_PAGES = 256
+# Consistency check: rows per foreign key step, retries, messages kept
+CONSISTENCY_SCAN_ROWS = 5000
+CONSISTENCY_RETRIES = 4
+CONSISTENCY_MAX_PROBLEMS = 100
+STORAGE_BENCHMARK_READ_ROUNDS = 20
+STORAGE_BENCHMARK_LOANS = 200
+
+# Action codes stored in logs.action_code, with their EN/PL labels
+LOG_ACTION_KINDS = {
+    "login": ("Login", "Logowanie"),
+    "failed_login": ("Failed login", "Nieudane logowanie"),
+    "user_created": ("User created", "Utworzenie użytkownika"),
+    "admin_created": ("Admin created", "Utworzenie admina"),
+    "user_promoted": ("Promoted", "Awans"),
+    "user_demoted": ("Demoted", "Degradacja"),
+    "user_deleted": ("User deleted", "Usunięcie użytkownika"),
+    "privilege_granted": ("Privilege granted", "Nadanie uprawnień"),
+    "privilege_revoked": ("Privilege revoked", "Odebranie uprawnień"),
+    "reader_added": ("Reader added", "Dodanie czytelnika"),
+    "book_assigned": ("Book assigned", "Przypisanie książki"),
+    "loan_returned": ("Loan returned", "Zwrot"),
+    "loan_lost": ("Loan lost", "Zagubienie"),
+    "books_imported": ("Import", "Import"),
+    "books_migrated": ("Excel migration", "Migracja z Excela"),
+    "data_exported": ("Export", "Eksport"),
+    "storage_changed": ("Storage profile", "Profil przechowywania"),
+    "db_backup": ("Backup", "Kopia zapasowa"),
+    "db_restored": ("Restore", "Przywrócenie"),
+    "orphans_fixed": ("Orphans fixed", "Naprawa osieroconych"),
+    "other": ("Other", "Inne"),
+}
+
+# Display text of a coded log row; logs.action only stores {detail}
+LOG_ACTION_TEMPLATES = {
+    "login": "login (user: {detail})",
+    "failed_login": "failed_login (user: {detail})",
+    "admin_created": "admin_created (user: {detail})",
+    "user_created": "user_created (user: {detail})",
+    "user_promoted": "promoted user_id={target_user_id} to admin",
+    "user_demoted": "demoted user_id={target_user_id} from admin",
+    "user_deleted": "deleted user_id={target_user_id}",
+    "privilege_granted": "granted {detail} to user_id={target_user_id}",
+    "privilege_revoked": "revoked {detail} from user_id={target_user_id}",
+    "reader_added": "added reader: {detail}",
+    "book_assigned": "assigned book_id={book_id} to reader_id={reader_id}",
+    "loan_returned": "marked loan_id={loan_id} as returned",
+    "loan_lost": "marked loan_id={loan_id} as lost",
+    "books_imported": "imported {detail}",
+    "books_migrated": "migrated {detail}",
+    "data_exported": "exported {detail}",
+    "storage_changed": "storage profile set to {detail}",
+    "db_restored": "database restored from {detail}",
+    "orphans_fixed": "fixed {detail}",
+}
+
+# Free-text actions written before logs had typed columns, used by the migration
+LEGACY_LOG_PATTERNS = [
+    ("login", re.compile(r"^login \(user: .*\)$"), ()),
+    ("failed_login", re.compile(r"^failed_login \(user: .*\)$"), ()),
+    ("admin_created", re.compile(r"^admin_created \(user: .*\)$"), ()),
+    ("user_created", re.compile(r"^user_created \(user: .*\)$"), ()),
+    (
+        "user_promoted",
+        re.compile(r"^promoted user_id=(\d+) to admin$"),
+        ("target_user_id",),
+    ),
+    (
+        "user_demoted",
+        re.compile(r"^demoted user_id=(\d+) from admin$"),
+        ("target_user_id",),
+    ),
+    ("user_deleted", re.compile(r"^deleted user_id=(\d+)$"), ("target_user_id",)),
+    (
+        "privilege_granted",
+        re.compile(r"^granted \w+ to user_id=(\d+)$"),
+        ("target_user_id",),
+    ),
+    (
+        "privilege_revoked",
+        re.compile(r"^revoked \w+ from user_id=(\d+)$"),
+        ("target_user_id",),
+    ),
+    ("reader_added", re.compile(r"^added reader: "), ()),
+    (
+        "book_assigned",
+        re.compile(r"^assigned book_id=(\d+) to reader_id=(\d+)$"),
+        ("book_id", "reader_id"),
+    ),
+    ("loan_returned", re.compile(r"^marked loan_id=(\d+) as returned$"), ("loan_id",)),
+    ("loan_lost", re.compile(r"^marked loan_id=(\d+) as lost$"), ("loan_id",)),
+    ("books_imported", re.compile(r"^imported \d+ books"), ()),
+    ("books_migrated", re.compile(r"^migrated \d+ books"), ()),
+    ("data_exported", re.compile(r"^exported "), ()),
+]
+
+LOG_REF_COLUMNS = ("book_id", "reader_id", "loan_id", "target_user_id")
+
+# Books.Status values (EN and PL) grouped into the dashboard counters
+STATUS_COUNTERS = {
+    "books_available": ("available", "dostępna", "returned", "zwrócona"),
+    "books_borrowed": ("borrowed", "wypożyczona"),
+    "books_lost": ("lost", "zagubiona", "missing", "brak"),
+}
+AVAILABLE_STATUSES_SQL = "({})".format(
+    ", ".join(f"'{v}'" for v in STATUS_COUNTERS["books_available"])
+)
+# Lendable copies by ID; likely() keeps the planner on idx_books_live_available
+AVAILABLE_BOOKS_WHERE = [
+    f"likely(Status IN {AVAILABLE_STATUSES_SQL})",
+    "deleted_at IS NULL",
+]
+EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+# Loan history panes: (tables, columns) for one reader or one book
+LOAN_HISTORY_BY_READER = (
+    "borrowed_books b LEFT JOIN Books k ON k.ID = b.book_id "
+    "LEFT JOIN titles t ON t.id = k.title_id",
+    "b.id, b.book_id, COALESCE(t.Title, ''), b.borrow_date, "
+    "COALESCE(b.return_date, ''), b.status, b.due_day",
+)
+LOAN_HISTORY_BY_BOOK = (
+    "borrowed_books b LEFT JOIN readers r ON r.id = b.reader_id",
+    "b.id, b.reader_id, COALESCE(r.name || ' ' || r.surname, ''), "
+    "b.borrow_date, COALESCE(b.return_date, ''), b.status, b.due_day",
+)
+# Manage Loans view: loans with the book title and reader name in one query
+LOANS_VIEW_TABLES = (
+    "borrowed_books b LEFT JOIN Books k ON k.ID = b.book_id "
+    "LEFT JOIN titles t ON t.id = k.title_id "
+    "LEFT JOIN readers r ON r.id = b.reader_id"
+)
+LOANS_VIEW_COLUMNS = (
+    "b.id, b.book_id, COALESCE(t.Title, ''), b.reader_id, "
+    "COALESCE(r.name || ' ' || r.surname, ''), b.borrow_date, "
+    "COALESCE(b.return_date, ''), b.status, b.due_day"
+)
+STATS_COUNTERS = (
+    "books_total",
+    "books_available",
+    "books_borrowed",
+    "books_lost",
+    "books_other",
+    "readers_total",
+    "loans_active",
+)
+
+# The archive folder sits beside its database (bookworm.log_archive)
+LOG_ARCHIVE_FOLDER = "log_archive"
+LOG_ARCHIVE_INDEX = "index.json"
+LOG_SEGMENT_ROWS = 20000
+
+# Catalog stores used by bookworm_cli_v010 and bookworm_gui_v100-v310
+LEGACY_WORKBOOKS = ("books_en.xlsx", "books_pl.xlsx")
+
+EXPORT_QUERIES = {
+    "books": (
+        "SELECT ID, Title, Author, Year, Genre, Status, BookRow FROM book_catalog WHERE deleted_at IS NULL ORDER BY ID",
+        ["ID", "Title", "Author", "Year", "Genre", "Status", "BookRow"],
+    ),
+    "readers": (
+        "SELECT id, name, surname, grade FROM readers ORDER BY id",
+        ["id", "name", "surname", "grade"],
+    ),
+    "loans": (
+        "SELECT id, book_id, reader_id, borrow_date, return_date, status FROM borrowed_books ORDER BY id",
+        ["id", "book_id", "reader_id", "borrow_date", "return_date", "status"],
+    ),
+    "logs": (
+        "SELECT id, user_id, action, timestamp, action_code, book_id, reader_id, loan_id, target_user_id FROM logs ORDER BY id",
+        [
+            "id",
+            "user_id",
+            "action",
+            "timestamp",
+            "action_code",
+            "book_id",
+            "reader_id",
+            "loan_id",
+            "target_user_id",
+        ],
+    ),
+}
+
+# Books.Status values with their Polish labels
+BOOK_STATUS_LABELS = {
+    "available": "dostępna",
+    "borrowed": "wypożyczona",
+    "missing": "brak",
+    "returned": "zwrócona",
+    "lost": "zagubiona",
+    "other": "inne",
+}
+BOOK_STATUSES = [name for pair in BOOK_STATUS_LABELS.items() for name in pair]
+BOOK_STATUS_OPTIONS = {
+    "EN": list(BOOK_STATUS_LABELS),
+    "PL": list(BOOK_STATUS_LABELS.values()),
+}
+
+IMPORT_HEADER_NAMES = {
+    "ID": {"id"},
+    "Title": {"title", "tytuł", "tytul"},
+    "Author": {"author", "autor"},
+    "Year": {"year", "rok"},
+    "Genre": {"genre", "gatunek"},
+    "Status": {"status"},
+    "BookRow": {"bookrow", "book row", "row", "regał", "regał książkowy", "regal"},
+}
 
 
 def generate_key(username: str, password: str) -> bytes:
@@ -49,24 +353,345 @@ def encrypt_file(input_path: str, output_path: str, key: bytes):
         file.write(encrypted)
 
 
+def encrypt_file_blocks(
+    input_path, output_path, key, block_size=ENCRYPTED_BLOCK_SIZE
+):
+    # One Fernet token per block; the last token holds the total size
+    from cryptography.fernet import Fernet
+
+    fernet = Fernet(key)
+    index = size = 0
+    with open(input_path, "rb") as src, open(output_path, "wb") as out:
+        out.write(ENCRYPTED_BLOCKS_MAGIC)
+        while True:
+            block = src.read(block_size)
+            if not block:
+                break
+            out.write(fernet.encrypt(index.to_bytes(4, "big") + block) + b"\n")
+            index += 1
+            size += len(block)
+        out.write(fernet.encrypt(b"\xff" * 4 + size.to_bytes(8, "big")) + b"\n")
+
+
 def decrypt_file(input_path: str, output_path: str, key: bytes) -> bool:
+    # Reads both bookworm.db.enc and the block container of encrypt_file_blocks()
     from cryptography.fernet import Fernet, InvalidToken
 
     try:
+        fernet = Fernet(key)
         with open(input_path, "rb") as file:
+            if file.read(len(ENCRYPTED_BLOCKS_MAGIC)) == ENCRYPTED_BLOCKS_MAGIC:
+                tmp_path = output_path + ".tmp"
+                with open(tmp_path, "wb") as out:
+                    index = size = 0
+                    for line in file:
+                        block = fernet.decrypt(line.rstrip(b"\n"))
+                        number = int.from_bytes(block[:4], "big")
+                        if number == 0xFFFFFFFF:
+                            if int.from_bytes(block[4:], "big") != size:
+                                raise InvalidToken
+                            break
+                        if number != index:
+                            raise InvalidToken
+                        out.write(block[4:])
+                        index += 1
+                        size += len(block) - 4
+                    else:
+                        raise InvalidToken
+                os.replace(tmp_path, output_path)
+                return True
+            file.seek(0)
             encrypted = file.read()
-        fernet = Fernet(key)
         data = fernet.decrypt(encrypted)
         with open(output_path, "wb") as file:
             file.write(data)
         return True
     except (InvalidToken, FileNotFoundError):
+        if os.path.exists(output_path + ".tmp"):
+            os.remove(output_path + ".tmp")
+        return False
+
+
+def snapshot_database(db_path, progress=None, pages=BACKUP_STEP_PAGES):
+    # Runs on a worker thread; returns the path of a plaintext copy beside the database
+    import tempfile
+
+    fd, path = tempfile.mkstemp(
+        suffix=".snapshot", dir=os.path.dirname(os.path.abspath(db_path))
+    )
+    os.close(fd)
+    source = sqlite3.connect(
+        f"file:{os.path.abspath(db_path)}?mode=ro", uri=True, isolation_level=None
+    )
+    target = sqlite3.connect(path)
+    try:
+        try:
+            cur = source.cursor()
+            cur.execute("PRAGMA journal_mode")
+            if cur.fetchone()[0] == "wal":
+                # A read transaction pins one WAL snapshot, so the backup never restarts
+                cur.execute("BEGIN")
+                cur.execute("SELECT COUNT(*) FROM sqlite_master")
+            source.backup(
+                target, pages=pages, progress=progress, sleep=BACKUP_STEP_SLEEP
+            )
+        finally:
+            target.close()
+            source.close()
+    except BaseException:
+        remove_database_files(path)
+        raise
+    return path
+
+
+def backup_database(
+    db_path, dest_path, key, progress=None, pages=BACKUP_STEP_PAGES
+):
+    # Full backup, encrypted in blocks; returns the image size in bytes
+    image = snapshot_database(db_path, progress, pages)
+    try:
+        tmp_path = dest_path + ".tmp"
+        encrypt_file_blocks(image, tmp_path, key)
+        os.replace(tmp_path, dest_path)
+        return os.path.getsize(image)
+    finally:
+        remove_database_files(image)
+
+
+def database_image_chunks(path):
+    with open(path, "rb") as file:
+        header = file.read(100)
+        page_size = int.from_bytes(header[16:18], "big") if len(header) >= 100 else 0
+        page_size = 65536 if page_size == 1 else page_size or 4096
+        file.seek(0)
+        chunk = bytearray()
+        pages = 0
+        for page in iter(lambda: file.read(page_size), b""):
+            chunk += page
+            pages += 1
+            if pages >= BACKUP_CHUNK_MAX_PAGES or (
+                pages >= BACKUP_CHUNK_MIN_PAGES
+                and zlib.crc32(page) & BACKUP_CHUNK_MASK == 0
+            ):
+                yield bytes(chunk)
+                chunk.clear()
+                pages = 0
+        if chunk:
+            yield bytes(chunk)
+
+
+def backup_store_ciphers(key):
+    # (Fernet, chunk id key); chunk ids are keyed hashes
+    from cryptography.fernet import Fernet
+
+    return Fernet(key), hashlib.sha256(b"bookworm-chunk-id:" + key).digest()
+
+
+def open_backup_store(conn, store_dir, user_key):
+    # Keys that read the store's sets, the one new sets use first. The store key
+    # lives in app_meta; keys/ holds it wrapped with each user's key
+    from cryptography.fernet import Fernet, InvalidToken
+
+    wrapper = Fernet(user_key)
+    slot = os.path.join(
+        store_dir,
+        "keys",
+        hashlib.sha256(b"bookworm-key-slot:" + user_key).hexdigest()[:32] + ".key",
+    )
+    wrapped = None
+    if os.path.exists(slot):
+        with open(slot, "rb") as file:
+            try:
+                wrapped = wrapper.decrypt(file.read())
+            except InvalidToken:
+                pass
+    store_key = get_meta_value(conn, "backup_store_key")
+    if wrapped and wrapped.decode("ascii") != store_key:
+        store_key = wrapped.decode("ascii")
+        set_meta_value(conn, "backup_store_key", store_key)
+        conn.commit()
+    elif store_key is None:
+        store_key = Fernet.generate_key().decode("ascii")
+        set_meta_value(conn, "backup_store_key", store_key)
+        conn.commit()
+    store_key = store_key.encode("ascii")
+    if wrapped != store_key:
+        write_store_file(slot, wrapper.encrypt(store_key))
+    return [store_key, user_key]
+
+
+def write_store_file(path, payload):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as file:
+        file.write(payload)
+    os.replace(tmp_path, path)
+
+
+def write_backup_set(store_dir, image, key, created=None):
+    # Stores the new chunks, then the manifest; returns the manifest summary
+    import hmac
+
+    fernet, id_key = backup_store_ciphers(key)
+    created = created or datetime.datetime.now()
+    chunks = []
+    new_chunks = new_bytes = 0
+    for chunk in database_image_chunks(image):
+        chunk_id = hmac.new(id_key, chunk, hashlib.sha256).hexdigest()
+        path = os.path.join(store_dir, "chunks", chunk_id[:2], chunk_id)
+        if not os.path.exists(path):
+            write_store_file(path, fernet.encrypt(zlib.compress(chunk)))
+            new_chunks += 1
+            new_bytes += len(chunk)
+        chunks.append([chunk_id, len(chunk)])
+    manifest = {
+        "version": 1,
+        "created": created.isoformat(timespec="seconds"),
+        "size": os.path.getsize(image),
+        "chunks": chunks,
+        "new_chunks": new_chunks,
+        "new_bytes": new_bytes,
+    }
+    name = created.strftime("%Y%m%d-%H%M%S") + ".manifest"
+    write_store_file(
+        os.path.join(store_dir, "manifests", name),
+        fernet.encrypt(json.dumps(manifest).encode("utf-8")),
+    )
+    manifest["name"] = name
+    return manifest
+
+
+def read_backup_manifests(store_dir, keys):
+    # ([manifest], unreadable names), newest first
+    from cryptography.fernet import InvalidToken
+
+    fernets = [(key, backup_store_ciphers(key)[0]) for key in keys]
+    folder = os.path.join(store_dir, "manifests")
+    manifests = []
+    unreadable = []
+    names = os.listdir(folder) if os.path.isdir(folder) else []
+    for name in sorted(names, reverse=True):
+        if not name.endswith(".manifest"):
+            continue
+        with open(os.path.join(folder, name), "rb") as file:
+            payload = file.read()
+        for key, fernet in fernets:
+            try:
+                manifest = json.loads(fernet.decrypt(payload))
+            except InvalidToken:
+                continue
+            manifest["name"] = name
+            manifest["key"] = key
+            manifests.append(manifest)
+            break
+        else:
+            unreadable.append(name)
+    return manifests, unreadable
+
+
+def restore_backup_set(store_dir, name, keys, dest_path):
+    from cryptography.fernet import InvalidToken
+
+    try:
+        with open(os.path.join(store_dir, "manifests", name), "rb") as file:
+            payload = file.read()
+        for key in keys:
+            fernet, _ = backup_store_ciphers(key)
+            try:
+                manifest = json.loads(fernet.decrypt(payload))
+                break
+            except InvalidToken:
+                continue
+        else:
+            raise InvalidToken
+        with open(dest_path, "wb") as out:
+            for chunk_id, length in manifest["chunks"]:
+                path = os.path.join(store_dir, "chunks", chunk_id[:2], chunk_id)
+                with open(path, "rb") as file:
+                    chunk = zlib.decompress(fernet.decrypt(file.read()))
+                if len(chunk) != length:
+                    return [f"chunk {chunk_id} is damaged"]
+                out.write(chunk)
+    except InvalidToken:
+        return ["cannot be decrypted with the current credentials"]
+    except (OSError, ValueError, zlib.error) as e:
+        return [f"backup set is incomplete: {e}"]
+    return []
+
+
+def backup_sets_to_keep(manifests, retention):
+    # Newest set of each of the last N days, weeks and months, plus the newest
+    keep = set()
+    for period, count in (
+        ("daily", retention.get("daily", 0)),
+        ("weekly", retention.get("weekly", 0)),
+        ("monthly", retention.get("monthly", 0)),
+    ):
+        seen = []
+        for manifest in manifests:
+            created = datetime.datetime.fromisoformat(manifest["created"])
+            bucket = {
+                "daily": created.date(),
+                "weekly": created.isocalendar()[:2],
+                "monthly": (created.year, created.month),
+            }[period]
+            if bucket in seen:
+                continue
+            if len(seen) >= count:
+                break
+            seen.append(bucket)
+            keep.add(manifest["name"])
+    if manifests:
+        keep.add(manifests[0]["name"])
+    return keep
+
+
+def prune_backup_store(store_dir, keys, retention):
+    # Deletes the manifests retention drops, then the unreferenced chunks;
+    # returns (manifests removed, chunks removed, bytes freed)
+    from cryptography.fernet import InvalidToken
+
+    manifests, unreadable = read_backup_manifests(store_dir, keys)
+    keep = backup_sets_to_keep(manifests, retention)
+    removed_sets = 0
+    for manifest in manifests:
+        if manifest["name"] not in keep:
+            os.remove(os.path.join(store_dir, "manifests", manifest["name"]))
+            removed_sets += 1
+    fernets = [backup_store_ciphers(key)[0] for key in keys]
+
+    def ours(path):
+        with open(path, "rb") as file:
+            payload = file.read()
+        for fernet in fernets:
+            try:
+                fernet.decrypt(payload)
+                return True
+            except InvalidToken:
+                continue
         return False
 
+    referenced = {
+        chunk_id
+        for manifest in manifests
+        if manifest["name"] in keep
+        for chunk_id, length in manifest["chunks"]
+    }
+    removed_chunks = freed = 0
+    chunk_root = os.path.join(store_dir, "chunks")
+    for folder, dirs, files in os.walk(chunk_root):
+        for name in files:
+            path = os.path.join(folder, name)
+            if name not in referenced and (not unreadable or ours(path)):
+                freed += os.path.getsize(path)
+                os.remove(path)
+                removed_chunks += 1
+    return removed_sets, removed_chunks, freed
+
 
 def find_book_by_id_sql(conn, book_id):
     cur = conn.cursor()
-    cur.execute("SELECT rowid, * FROM Books WHERE ID = ?", (book_id,))
+    cur.execute("SELECT ID, * FROM book_catalog WHERE ID = ?", (book_id,))
     row = cur.fetchone()
     if row:
         rowid = row[0]
@@ -75,6 +700,1486 @@ def find_book_by_id_sql(conn, book_id):
     return None, None
 
 
+def keyset_page(
+    conn,
+    table,
+    columns,
+    key_col,
+    sort_col=None,
+    ascending=True,
+    where=None,
+    params=None,
+    token=None,
+    limit=PAGE_SIZE,
+):
+    # Keyset paging instead of OFFSET; returns (rows, next_token)
+    query, args = keyset_query(
+        table, columns, key_col, sort_col, ascending, where, params, token, limit
+    )
+    cur = conn.cursor()
+    cur.execute(query, args)
+    rows = cur.fetchall()
+    if (
+        len(rows) <= limit
+        and sort_col
+        and not ascending
+        and token is not None
+        and token[0] is not None
+    ):
+        query, args = keyset_query(
+            table,
+            columns,
+            key_col,
+            sort_col,
+            ascending,
+            list(where or []) + [f"{sort_col} IS NULL"],
+            params,
+            None,
+            limit - len(rows),
+        )
+        cur.execute(query, args)
+        rows += cur.fetchall()
+    next_token = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_token = (rows[-1][-2], rows[-1][-1])
+    return [row[:-2] for row in rows], next_token
+
+
+def keyset_query(
+    table,
+    columns,
+    key_col,
+    sort_col=None,
+    ascending=True,
+    where=None,
+    params=None,
+    token=None,
+    limit=PAGE_SIZE,
+):
+    clauses = list(where or [])
+    args = list(params or [])
+    op = ">" if ascending else "<"
+    direction = "ASC" if ascending else "DESC"
+    if token is not None:
+        last_sort, last_key = token
+        if sort_col is None:
+            clauses.append(f"{key_col} {op} ?")
+            args.append(last_key)
+        elif last_sort is None:
+            # SQLite sorts NULLs first
+            if ascending:
+                clauses.append(
+                    f"(({sort_col} IS NULL AND {key_col} > ?) OR {sort_col} IS NOT NULL)"
+                )
+            else:
+                clauses.append(f"({sort_col} IS NULL AND {key_col} < ?)")
+            args.append(last_key)
+        else:
+            clauses.append(f"{sort_col} {op}= ?")
+            clauses.append(
+                f"({sort_col} {op} ? OR ({sort_col} = ? AND {key_col} {op} ?))"
+            )
+            args.extend([last_sort, last_sort, last_sort, last_key])
+    sort_expr = sort_col if sort_col else "NULL"
+    query = f"SELECT {columns}, {sort_expr}, {key_col} FROM {table}"
+    if clauses:
+        query += " WHERE " + " AND ".join(clauses)
+    if sort_col:
+        query += f" ORDER BY {sort_col} {direction}, {key_col} {direction}"
+    else:
+        query += f" ORDER BY {key_col} {direction}"
+    query += " LIMIT ?"
+    return query, args + [limit + 1]
+
+
+def loans_filter_sql(active_only=True, overdue_only=False, text=None):
+    where = []
+    params = []
+    if active_only or overdue_only:
+        where.append("b.status = 'borrowed'")
+    if overdue_only:
+        where.append("b.due_day < ?")
+        params.append(epoch_day())
+    text = (text or "").strip()
+    if text:
+        pattern = f"%{text}%"
+        where.append(
+            "(t.Title LIKE ? OR r.name LIKE ? OR r.surname LIKE ? OR r.name || ' ' || r.surname LIKE ?)"
+        )
+        params.extend([pattern] * 4)
+    return where, params
+
+
+def books_filter_sql(filter_criteria):
+    where = ["deleted_at IS NULL"]
+    params = []
+    for key, val in (filter_criteria or {}).items():
+        # For ID and Year exact match, others LIKE match insensitive
+        if key in ("ID", "Year"):
+            where.append(f"{key} = ?")
+            params.append(val)
+        else:
+            where.append(f"{key} LIKE ?")
+            params.append(f"%{val}%")
+    return where, params
+
+
+def iter_sheet_rows(path):
+    if path.lower().endswith((".xlsx", ".xlsm")):
+        from openpyxl import load_workbook
+
+        wb = load_workbook(path, read_only=True, data_only=True)
+        try:
+            ws = wb["Books"] if "Books" in wb.sheetnames else wb.active
+            for row in ws.iter_rows(values_only=True):
+                yield row
+        finally:
+            wb.close()
+    else:
+        with open(path, "r", newline="", encoding="utf-8-sig") as f:
+            sample = f.read(4096)
+            f.seek(0)
+            try:
+                dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+            except csv.Error:
+                dialect = csv.excel
+            for row in csv.reader(f, dialect):
+                yield row
+
+
+def read_sheet_header(path):
+    rows = iter_sheet_rows(path)
+    try:
+        header = next(rows, None)
+    finally:
+        rows.close()
+    return [str(h).strip() if h is not None else "" for h in (header or [])]
+
+
+def guess_column_map(header):
+    normalized = [h.strip().casefold() for h in header]
+    column_map = {}
+    for field, names in IMPORT_HEADER_NAMES.items():
+        for idx, name in enumerate(normalized):
+            if name in names:
+                column_map[field] = idx
+                break
+    return column_map
+
+
+def isbn13_check_sum(digits):
+    return sum(int(c) * (3 if i % 2 else 1) for i, c in enumerate(digits))
+
+
+def normalize_isbn(value):
+    # ISBN-13 form of an ISBN-10/13, None if empty; raises ValueError
+    code = re.sub(r"[\s-]", "", str(value or "")).upper()
+    if not code:
+        return None
+    if re.fullmatch(r"\d{9}[\dX]", code):
+        digits = [int(c) for c in code[:9]] + [10 if code[9] == "X" else int(code[9])]
+        if sum((10 - i) * d for i, d in enumerate(digits)) % 11:
+            raise ValueError(f"invalid ISBN-10 checksum: {value}")
+        code = "978" + code[:9]
+        return code + str(-isbn13_check_sum(code) % 10)
+    if re.fullmatch(r"\d{13}", code):
+        if isbn13_check_sum(code) % 10:
+            raise ValueError(f"invalid ISBN-13 checksum: {value}")
+        return code
+    raise ValueError(f"not an ISBN: {value}")
+
+
+def normalize_barcode(value):
+    code = re.sub(r"\s", "", str(value or ""))
+    return code or None
+
+
+def find_book_by_code(conn, code):
+    cur = conn.cursor()
+    try:
+        isbn = normalize_isbn(code)
+    except ValueError:
+        isbn = None
+    if isbn:
+        # Copies of one title share the ISBN; prefer one that can be lent
+        cur.execute(
+            f"SELECT ID, Title FROM book_catalog WHERE ISBN = ? AND deleted_at IS NULL ORDER BY Status IN {AVAILABLE_STATUSES_SQL} DESC, ID LIMIT 1",
+            (isbn,),
+        )
+        row = cur.fetchone()
+        if row:
+            return row
+    barcode = normalize_barcode(code)
+    if barcode:
+        cur.execute(
+            "SELECT ID, Title FROM book_catalog WHERE Barcode = ? AND deleted_at IS NULL",
+            (barcode,),
+        )
+        row = cur.fetchone()
+        if row:
+            return row
+        if barcode.isdigit():
+            cur.execute(
+                "SELECT ID, Title FROM book_catalog WHERE ID = ? AND deleted_at IS NULL",
+                (int(barcode),),
+            )
+            return cur.fetchone()
+    return None
+
+
+def find_code_owner(conn, isbn, barcode, exclude_id=None, title_id=None):
+    # ID of another book already holding this ISBN or barcode, if any
+    cur = conn.cursor()
+    if isbn is not None and title_id is not None:
+        cur.execute(
+            "SELECT ID FROM book_catalog WHERE ISBN = ? AND title_id <> ? LIMIT 1",
+            (isbn, title_id),
+        )
+        row = cur.fetchone()
+        if row:
+            return row[0]
+    if barcode is not None:
+        cur.execute(
+            "SELECT ID FROM Books WHERE Barcode = ? AND deleted_at IS NULL", (barcode,)
+        )
+        row = cur.fetchone()
+        if row and row[0] != exclude_id:
+            return row[0]
+    return None
+
+
+def add_titles_model(conn):
+    cur = conn.cursor()
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS titles (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            Title TEXT,
+            Author TEXT,
+            Year INTEGER,
+            Genre TEXT,
+            ISBN TEXT
+        )
+    """)
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_titles_match ON titles (Title, Author, Year, Genre)"
+    )
+    cur.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_titles_isbn ON titles (ISBN) WHERE ISBN IS NOT NULL"
+    )
+    for column in ("Author", "Year", "Genre"):
+        cur.execute(
+            f"CREATE INDEX IF NOT EXISTS idx_titles_{column.lower()} ON titles ({column})"
+        )
+
+
+def split_titles_from_copies(conn):
+    # Part of migrate_baseline_schema(): Books keeps only the copy columns
+    link_titles(conn)
+    cur = conn.cursor()
+    cur.execute("""
+        CREATE TABLE books_copies (
+            ID INTEGER PRIMARY KEY,
+            title_id INTEGER NOT NULL REFERENCES titles (id),
+            Status TEXT,
+            BookRow TEXT,
+            Barcode TEXT,
+            deleted_at TEXT
+        )
+    """)
+    cur.execute(
+        "INSERT INTO books_copies (ID, title_id, Status, BookRow, Barcode, deleted_at) "
+        "SELECT ID, title_id, Status, BookRow, Barcode, deleted_at FROM Books"
+    )
+    cur.execute("DROP TABLE Books")
+    cur.execute("ALTER TABLE books_copies RENAME TO Books")
+
+
+def add_book_indexes(conn):
+    cur = conn.cursor()
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_books_live_status ON Books (Status) WHERE deleted_at IS NULL"
+    )
+    # Not partial, so it also serves foreign key enforcement
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_books_title_copies ON Books (title_id, deleted_at, Status)"
+    )
+    cur.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_books_barcode ON Books (Barcode) WHERE Barcode IS NOT NULL AND deleted_at IS NULL"
+    )
+    cur.execute(
+        f"CREATE INDEX IF NOT EXISTS idx_books_live_available ON Books (ID) WHERE Status IN {AVAILABLE_STATUSES_SQL} AND deleted_at IS NULL"
+    )
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_books_deleted ON Books (deleted_at) WHERE deleted_at IS NOT NULL"
+    )
+    # The old Books shape, title fields included, for the screens and exports
+    cur.execute("""
+        CREATE VIEW IF NOT EXISTS book_catalog AS
+        SELECT c.ID, t.Title, t.Author, t.Year, t.Genre, c.Status, c.BookRow,
+            t.ISBN, c.Barcode, c.deleted_at, c.title_id
+        FROM Books c JOIN titles t ON t.id = c.title_id
+    """)
+
+
+def move_removed_books(conn):
+    # Part of migrate_baseline_schema(): RemovedBooks rows become removed Books
+    # rows, and a reused ID is replaced and logged. Returns [(old_id, new_id)]
+    now = datetime.datetime.now().isoformat()
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT ID, Title, Author, Year, Genre, lower(Status) FROM RemovedBooks r "
+        "WHERE EXISTS (SELECT 1 FROM Books b WHERE b.ID = r.ID)"
+    )
+    reused = cur.fetchall()
+    cur.execute(
+        "INSERT INTO Books (ID, Title, Author, Year, Genre, Status, deleted_at) "
+        "SELECT ID, Title, Author, Year, Genre, lower(Status), ? FROM RemovedBooks r "
+        "WHERE NOT EXISTS (SELECT 1 FROM Books b WHERE b.ID = r.ID)",
+        (now,),
+    )
+    moved = []
+    for old_id, *values in reused:
+        new_id = next_free_book_id(conn)
+        cur.execute(
+            "INSERT INTO Books (ID, Title, Author, Year, Genre, Status, deleted_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (new_id, *values, now),
+        )
+        cur.execute(
+            "INSERT INTO logs (action, timestamp, action_code, book_id) "
+            "VALUES (?, ?, 'other', ?)",
+            (
+                f"removed book ID {old_id} kept as ID {new_id}, its ID was reused",
+                now,
+                new_id,
+            ),
+        )
+        moved.append((old_id, new_id))
+    cur.execute("DROP TABLE RemovedBooks")
+    return moved
+
+
+def soft_delete_book(conn, book_id):
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT 1 FROM borrowed_books WHERE book_id = ? AND status = 'borrowed'",
+        (book_id,),
+    )
+    if cur.fetchone():
+        raise LoanError(f"book {book_id} is on loan")
+    cur.execute(
+        "UPDATE Books SET deleted_at = ? WHERE ID = ? AND deleted_at IS NULL",
+        (datetime.datetime.now().isoformat(), book_id),
+    )
+    return cur.rowcount
+
+
+def restore_book(conn, book_id):
+    cur = conn.cursor()
+    cur.execute(
+        "UPDATE Books SET Barcode = NULL WHERE ID = ? AND deleted_at IS NOT NULL "
+        "AND Barcode IN (SELECT Barcode FROM Books WHERE deleted_at IS NULL)",
+        (book_id,),
+    )
+    cur.execute(
+        "UPDATE Books SET deleted_at = NULL WHERE ID = ? AND deleted_at IS NOT NULL",
+        (book_id,),
+    )
+    return cur.rowcount
+
+
+def purge_deleted_books(conn, retention_days, batch_size=500):
+    cutoff = (
+        datetime.datetime.now() - datetime.timedelta(days=retention_days)
+    ).isoformat()
+    cur = conn.cursor()
+    purged = 0
+    while True:
+        cur.execute(
+            """DELETE FROM Books WHERE ID IN (
+                   SELECT ID FROM Books b WHERE deleted_at < ?
+                   AND NOT EXISTS (
+                       SELECT 1 FROM borrowed_books l WHERE l.book_id = b.ID
+                   )
+                   LIMIT ?)""",
+            (cutoff, batch_size),
+        )
+        conn.commit()
+        purged += cur.rowcount
+        if cur.rowcount < batch_size:
+            return purged
+
+
+def ensure_title(conn, title, author, year, genre, isbn=None):
+    # id of the title with this ISBN or these details, created when missing
+    cur = conn.cursor()
+    if isbn:
+        cur.execute("SELECT id FROM titles WHERE ISBN = ?", (isbn,))
+        row = cur.fetchone()
+        if row:
+            return row[0]
+    cur.execute(
+        "SELECT id FROM titles WHERE Title IS ? AND Author IS ? AND Year IS ? AND Genre IS ? "
+        "AND (ISBN IS NULL OR ? IS NULL) LIMIT 1",
+        (title, author, year, genre, isbn),
+    )
+    row = cur.fetchone()
+    if row:
+        if isbn:
+            cur.execute("UPDATE titles SET ISBN = ? WHERE id = ?", (isbn, row[0]))
+        return row[0]
+    cur.execute(
+        "INSERT INTO titles (Title, Author, Year, Genre, ISBN) VALUES (?, ?, ?, ?, ?)",
+        (title, author, year, genre, isbn),
+    )
+    return cur.lastrowid
+
+
+def link_titles(conn):
+    # Part of split_titles_from_copies(): gives every copy its title
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT ID, Title, Author, Year, Genre, ISBN FROM Books WHERE title_id IS NULL"
+    )
+    known = {}
+    updates = []
+    for book_id, title, author, year, genre, isbn in cur.fetchall():
+        key = (title, author, year, genre, isbn)
+        if key not in known:
+            known[key] = ensure_title(conn, title, author, year, genre, isbn)
+        updates.append((known[key], book_id))
+    cur.executemany("UPDATE Books SET title_id = ? WHERE ID = ?", updates)
+    return len(updates)
+
+
+BOOK_COPY_COLUMNS = (
+    "ID",
+    "Title",
+    "Author",
+    "Year",
+    "Genre",
+    "Status",
+    "BookRow",
+    "ISBN",
+    "Barcode",
+    "deleted_at",
+)
+
+
+def add_copies(conn, rows):
+    # Inserts copies given in the old Books shape; returns the number of copies
+    rows = [
+        row if not row[5] or row[5].islower() else (*row[:5], row[5].lower(), *row[6:])
+        for row in rows
+    ]
+    if not rows:
+        return 0
+    cur = conn.cursor()
+    cur.execute(
+        "CREATE TEMP TABLE IF NOT EXISTS copy_rows "
+        f"({', '.join(BOOK_COPY_COLUMNS)}, title_id INTEGER)"
+    )
+    # Emptied, so the staged rows get rowids 1..n in order
+    cur.execute("DELETE FROM temp.copy_rows")
+    for width, group in itertools.groupby(rows, len):
+        cur.executemany(
+            f"INSERT INTO temp.copy_rows ({', '.join(BOOK_COPY_COLUMNS[:width])}) "
+            f"VALUES ({', '.join('?' * width)})",
+            group,
+        )
+    cur.execute("SELECT COUNT(*) - COUNT(ID), MAX(ID) FROM temp.copy_rows")
+    missing, top = cur.fetchone()
+    if missing:
+        # Past every reserved block, which SQLite's next rowid is not
+        first = max(next_free_book_id(conn), (top or 0) + 1)
+        cur.execute(
+            "UPDATE temp.copy_rows AS k SET ID = ? + q.n FROM (SELECT rowid AS r, "
+            "row_number() OVER (ORDER BY rowid) - 1 AS n "
+            "FROM temp.copy_rows WHERE ID IS NULL) AS q WHERE k.rowid = q.r",
+            (first,),
+        )
+    known = {}
+    with_isbn = []
+    for rowid, row in enumerate(rows, start=1):
+        if len(row) > 7 and row[7] is not None:
+            key = (*row[1:5], row[7])
+            if key not in known:
+                known[key] = ensure_title(conn, *key)
+            with_isbn.append((known[key], rowid))
+    cur.executemany("UPDATE temp.copy_rows SET title_id = ? WHERE rowid = ?", with_isbn)
+    match = (
+        "SELECT id FROM titles t WHERE t.Title IS k.Title AND t.Author IS k.Author "
+        "AND t.Year IS k.Year AND t.Genre IS k.Genre LIMIT 1"
+    )
+    cur.execute(
+        f"UPDATE temp.copy_rows AS k SET title_id = ({match}) WHERE title_id IS NULL"
+    )
+    cur.execute(
+        "INSERT INTO titles (Title, Author, Year, Genre) "
+        "SELECT Title, Author, Year, Genre FROM temp.copy_rows "
+        "WHERE title_id IS NULL GROUP BY Title, Author, Year, Genre ORDER BY MIN(rowid)"
+    )
+    if cur.rowcount:
+        cur.execute(
+            f"UPDATE temp.copy_rows AS k SET title_id = ({match}) "
+            "WHERE title_id IS NULL"
+        )
+    insert = (
+        "INSERT INTO Books (ID, title_id, Status, BookRow, Barcode, deleted_at) "
+        "SELECT ID, title_id, Status, BookRow, Barcode, deleted_at "
+        "FROM temp.copy_rows ORDER BY rowid"
+    )
+    if len(rows) == 1:
+        cur.execute(insert)
+        return 1
+    if not conn.in_transaction:
+        cur.execute("BEGIN")
+    # Dropping the trigger is undone with the rows if the insert fails
+    cur.execute("SAVEPOINT add_copies")
+    try:
+        cur.execute("DROP TRIGGER IF EXISTS trg_stats_books_insert")
+        cur.execute(insert)
+        cur.execute(
+            f"SELECT {status_counter_sql('Status')}, COUNT(*) FROM temp.copy_rows "
+            "WHERE deleted_at IS NULL GROUP BY 1"
+        )
+        counts = cur.fetchall()
+        counts.append(("books_total", sum(count for _, count in counts)))
+        cur.executemany(
+            "UPDATE stats SET value = value + ? WHERE name = ?",
+            [(count, name) for name, count in counts],
+        )
+        install_stats_triggers(conn)
+    except Exception:
+        try:
+            cur.execute("ROLLBACK TO add_copies")
+            cur.execute("RELEASE add_copies")
+        except sqlite3.Error:
+            pass
+        raise
+    cur.execute("RELEASE add_copies")
+    return len(rows)
+
+
+def add_copy(conn, row):
+    # add_copies() for one row; returns the copy's ID (allocated when None)
+    add_copies(conn, [row])
+    return conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+
+
+def title_availability(conn, title_id):
+    # (copies, available copies) of one title, counted on idx_books_title_copies
+    cur = conn.cursor()
+    cur.execute(
+        f"SELECT COUNT(*), COUNT(CASE WHEN Status IN {AVAILABLE_STATUSES_SQL} THEN 1 END) "
+        "FROM Books WHERE title_id = ? AND deleted_at IS NULL",
+        (title_id,),
+    )
+    return cur.fetchone()
+
+
+def book_id_exists(conn, book_id):
+    cur = conn.cursor()
+    cur.execute("SELECT 1 FROM Books WHERE ID = ?", (book_id,))
+    return cur.fetchone() is not None
+
+
+def next_free_book_id(conn):
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT MAX(COALESCE((SELECT MAX(ID) FROM Books), 0), "
+        "COALESCE((SELECT MAX(last_id) FROM id_reservations), 0))"
+    )
+    return cur.fetchone()[0] + 1
+
+
+def reserve_book_ids(conn, count, user_id=None):
+    # Sets aside a block of IDs; returns (reservation_id, first_id, last_id)
+    cutoff = (
+        datetime.datetime.now() - datetime.timedelta(hours=ID_RESERVATION_HOURS)
+    ).isoformat()
+    cur = conn.cursor()
+    cur.execute("DELETE FROM id_reservations WHERE created_at < ?", (cutoff,))
+    first_id = next_free_book_id(conn)
+    last_id = first_id + count - 1
+    cur.execute(
+        "INSERT INTO id_reservations (first_id, last_id, user_id, created_at) VALUES (?, ?, ?, ?)",
+        (first_id, last_id, user_id, datetime.datetime.now().isoformat()),
+    )
+    return cur.lastrowid, first_id, last_id
+
+
+def release_book_ids(conn, reservation_id):
+    conn.execute("DELETE FROM id_reservations WHERE id = ?", (reservation_id,))
+
+
+def book_id_reservation(conn, book_id):
+    # ID of the reservation covering book_id, or None
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT id FROM id_reservations WHERE last_id >= ? AND first_id <= ? LIMIT 1",
+        (book_id, book_id),
+    )
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def next_reserved_book_id(conn, first_id, last_id):
+    # Next unused ID of a reservation, or None when the block is used up
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT MAX(ID) FROM Books WHERE ID BETWEEN ? AND ?", (first_id, last_id)
+    )
+    used = cur.fetchone()[0]
+    next_id = first_id if used is None else used + 1
+    return next_id if next_id <= last_id else None
+
+
+def parse_whole_number(text):
+    # "12" or "12.0" (spreadsheet floats); raises ValueError on a fraction
+    try:
+        return int(text)
+    except ValueError:
+        value = float(text)
+    if not value.is_integer():
+        raise ValueError(text)
+    return int(value)
+
+
+def validate_book_row(row, column_map):
+    def cell(field):
+        idx = column_map.get(field)
+        if idx is None or idx >= len(row) or row[idx] is None:
+            return ""
+        return str(row[idx]).strip()
+
+    id_text = cell("ID")
+    book_id = None
+    if id_text:
+        try:
+            book_id = parse_whole_number(id_text)
+        except ValueError:
+            return None, f"invalid ID '{id_text}'"
+        if book_id < 0:
+            return None, f"invalid ID '{id_text}'"
+        if book_id == 0:
+            # 0 means "no ID", let SQLite allocate one instead of overwriting
+            book_id = None
+    title = cell("Title")
+    if not title:
+        return None, "missing title"
+    year_text = cell("Year")
+    year = None
+    if year_text:
+        try:
+            year = parse_whole_number(year_text)
+        except ValueError:
+            return None, f"invalid year '{year_text}'"
+    status = cell("Status").lower()
+    if status not in BOOK_STATUSES:
+        status = "available"
+    return (
+        book_id,
+        title,
+        cell("Author"),
+        year,
+        cell("Genre"),
+        status,
+        cell("BookRow"),
+    ), None
+
+
+def import_books(
+    conn, path, column_map, progress=None, batch_size=IMPORT_BATCH_SIZE
+):
+    # Validates and inserts rows in batches; returns (imported, rejects)
+    if "Title" not in column_map:
+        raise ValueError("Title column is not mapped")
+    cur = conn.cursor()
+    imported = 0
+    processed = 0
+    rejects = []
+    batch = []
+    batch_rejects = []
+
+    def flush():
+        nonlocal imported
+        explicit_ids = [values[0] for _, values in batch if values[0] is not None]
+        taken = set()
+        for start in range(0, len(explicit_ids), 500):
+            chunk = explicit_ids[start : start + 500]
+            cur.execute(
+                f"SELECT ID FROM Books WHERE ID IN ({','.join('?' * len(chunk))})",
+                chunk,
+            )
+            taken.update(r[0] for r in cur.fetchall())
+        accepted = []
+        for line_no, values in batch:
+            if values[0] is not None:
+                if values[0] in taken:
+                    batch_rejects.append((line_no, f"ID {values[0]} already exists"))
+                    continue
+                taken.add(values[0])
+            accepted.append(values)
+        add_copies(conn, accepted)
+        imported += len(accepted)
+        rejects.extend(batch_rejects)
+        if progress:
+            progress(processed, imported, list(batch_rejects))
+        batch.clear()
+        batch_rejects.clear()
+
+    rows = iter_sheet_rows(path)
+    try:
+        next(rows, None)  # header
+        for line_no, row in enumerate(rows, start=2):
+            if not any(v not in (None, "") for v in row):
+                continue
+            processed += 1
+            values, error = validate_book_row(row, column_map)
+            if error:
+                batch_rejects.append((line_no, error))
+            else:
+                batch.append((line_no, values))
+            if len(batch) + len(batch_rejects) >= batch_size:
+                flush()
+        flush()
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        rows.close()
+    return imported, rejects
+
+
+def migrate_legacy_workbooks(
+    conn, paths=LEGACY_WORKBOOKS, progress=None, batch_size=IMPORT_BATCH_SIZE
+):
+    # Streams the v100-v310 Excel stores into Books, one commit per batch. Rows
+    # needing a new ID go in a second pass; app_meta keeps each workbook's progress
+    column_map = {field: idx for idx, field in enumerate(IMPORT_HEADER_NAMES)}
+    summary = {
+        "imported": 0,
+        "duplicates": 0,
+        "reassigned": [],
+        "rejects": [],
+        "skipped": [],
+    }
+    cur = conn.cursor()
+    processed = 0
+
+    def flush(path, batch, explicit_pass, meta_key):
+        existing = {}
+        ids = [values[0] for _, values in batch if values[0] is not None]
+        for start in range(0, len(ids), 500):
+            chunk = ids[start : start + 500]
+            cur.execute(
+                f"SELECT ID, Title, Author, Year FROM book_catalog WHERE ID IN ({','.join('?' * len(chunk))})",
+                chunk,
+            )
+            for row in cur.fetchall():
+                existing[row[0]] = row[1:]
+        fresh = []
+        moved = []
+        for line_no, values in batch:
+            book_id = values[0]
+            if book_id is not None and book_id in existing:
+                if existing[book_id] == (values[1], values[2], values[3]):
+                    if explicit_pass:
+                        summary["duplicates"] += 1
+                elif not explicit_pass:
+                    moved.append((line_no, values))
+                continue
+            if book_id is None and explicit_pass:
+                continue
+            if book_id is not None:
+                existing[book_id] = (values[1], values[2], values[3])
+            fresh.append(values)
+        add_copies(conn, fresh)
+        for line_no, values in moved:
+            summary["reassigned"].append(
+                (os.path.basename(path), values[0], add_copy(conn, (None, *values[1:])))
+            )
+        if not explicit_pass:
+            set_meta_value(conn, meta_key, batch[-1][0])
+        conn.commit()
+        summary["imported"] += len(fresh) + len(moved)
+        if progress:
+            progress(processed, summary)
+
+    def migrate_one(path, explicit_pass, meta_key):
+        nonlocal processed
+        done_line = 0 if explicit_pass else int(get_meta_value(conn, meta_key, 0))
+        rows = iter_sheet_rows(path)
+        batch = []
+        try:
+            next(rows, None)  # header
+            for line_no, row in enumerate(rows, start=2):
+                if line_no <= done_line or not any(v not in (None, "") for v in row):
+                    continue
+                values, error = validate_book_row(row, column_map)
+                if explicit_pass:
+                    processed += 1
+                    if error:
+                        summary["rejects"].append(
+                            (os.path.basename(path), line_no, error)
+                        )
+                        continue
+                elif error:
+                    continue
+                batch.append((line_no, values))
+                if len(batch) >= batch_size:
+                    flush(path, batch, explicit_pass, meta_key)
+                    batch = []
+            if batch:
+                flush(path, batch, explicit_pass, meta_key)
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            rows.close()
+
+    pending = []
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        meta_key = f"legacy_workbook:{file_sha256(path)}"
+        if get_meta_value(conn, meta_key) == "done":
+            summary["skipped"].append(os.path.basename(path))
+        else:
+            pending.append((path, meta_key))
+    for explicit_pass in (True, False):
+        for path, meta_key in pending:
+            migrate_one(path, explicit_pass, meta_key)
+    for path, meta_key in pending:
+        set_meta_value(conn, meta_key, "done")
+    conn.commit()
+    return summary
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def logs_filter_sql(user_id=None, kind=None, start=None, end=None, **refs):
+    where = []
+    params = []
+    if user_id is not None:
+        where.append("user_id = ?")
+        params.append(user_id)
+    if kind:
+        where.append("action_code = ?")
+        params.append(kind)
+    for column in LOG_REF_COLUMNS:
+        if refs.get(column) is not None:
+            where.append(f"{column} = ?")
+            params.append(refs[column])
+    if start:
+        where.append("timestamp >= ?")
+        params.append(start)
+    if end:
+        where.append("timestamp <= ?")
+        params.append(end)
+    return where, params
+
+
+def parse_legacy_log_action(action):
+    # Returns (action_code, {column: id}) for a free-text action string
+    for code, pattern, columns in LEGACY_LOG_PATTERNS:
+        m = pattern.match(action or "")
+        if m:
+            return code, {col: int(val) for col, val in zip(columns, m.groups())}
+    return "other", {}
+
+
+def log_template_pattern(template):
+    # Regex matching the full text a template renders; {detail} is captured
+    parts = re.split(r"\{(\w+)\}", template)
+    pattern = ""
+    for i, part in enumerate(parts):
+        if i % 2 == 0:
+            pattern += re.escape(part)
+        else:
+            pattern += "(?P<detail>.*)" if part == "detail" else r"\d+"
+    return re.compile(pattern)
+
+
+LOG_ACTION_PATTERNS = {
+    code: log_template_pattern(template)
+    for code, template in LOG_ACTION_TEMPLATES.items()
+}
+
+
+def log_action_detail(code, action):
+    pattern = LOG_ACTION_PATTERNS.get(code)
+    m = pattern.fullmatch(action or "") if pattern else None
+    if not m:
+        return action
+    return m.groupdict().get("detail")
+
+
+def log_action_text(code, action, refs):
+    template = LOG_ACTION_TEMPLATES.get(code)
+    if template is None or (action and LOG_ACTION_PATTERNS[code].fullmatch(action)):
+        return action or ""
+    return template.format(detail=action or "", **dict(zip(LOG_REF_COLUMNS, refs)))
+
+
+def render_log_row(row):
+    row = list(row)
+    row[2] = log_action_text(row[4], row[2], row[5:])
+    return row
+
+
+def shorten_log_actions(conn, batch_size=IMPORT_BATCH_SIZE):
+    # Part of migrate_baseline_schema(): coded rows keep only their detail
+    cur = conn.cursor()
+    last_id = 0
+    while True:
+        cur.execute(
+            "SELECT id, action_code, action FROM logs WHERE id > ? ORDER BY id LIMIT ?",
+            (last_id, batch_size),
+        )
+        rows = cur.fetchall()
+        if not rows:
+            break
+        updates = []
+        for log_id, code, action in rows:
+            detail = log_action_detail(code, action)
+            if detail != action:
+                updates.append((detail, log_id))
+        cur.executemany("UPDATE logs SET action = ? WHERE id = ?", updates)
+        conn.commit()
+        last_id = rows[-1][0]
+
+
+def migrate_log_schema(conn, batch_size=IMPORT_BATCH_SIZE):
+    cur = conn.cursor()
+    cur.execute("ALTER TABLE logs ADD COLUMN action_code TEXT")
+    for column in LOG_REF_COLUMNS:
+        cur.execute(f"ALTER TABLE logs ADD COLUMN {column} INTEGER")
+    last_id = 0
+    while True:
+        cur.execute(
+            "SELECT id, action FROM logs WHERE action_code IS NULL AND id > ? ORDER BY id LIMIT ?",
+            (last_id, batch_size),
+        )
+        rows = cur.fetchall()
+        if not rows:
+            break
+        updates = []
+        for log_id, action in rows:
+            code, refs = parse_legacy_log_action(action)
+            updates.append(
+                (code, *(refs.get(col) for col in LOG_REF_COLUMNS), log_id)
+            )
+        cur.executemany(
+            "UPDATE logs SET action_code=?, book_id=?, reader_id=?, loan_id=?, target_user_id=? WHERE id=?",
+            updates,
+        )
+        conn.commit()
+        last_id = rows[-1][0]
+
+
+def status_counter_sql(column):
+    # CASE expression naming the stats counter a Books.Status value belongs to
+    cases = " ".join(
+        "WHEN lower({}) IN ({}) THEN '{}'".format(
+            column, ", ".join(f"'{v}'" for v in values), name
+        )
+        for name, values in STATUS_COUNTERS.items()
+    )
+    return f"(CASE {cases} ELSE 'books_other' END)"
+
+
+def install_stats_triggers(conn):
+    cur = conn.cursor()
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS stats (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    triggers = {
+        # Removed (soft-deleted) books are not counted
+        "trg_stats_books_insert": f"""
+            AFTER INSERT ON Books WHEN NEW.deleted_at IS NULL BEGIN
+                UPDATE stats SET value = value + 1
+                WHERE name IN ('books_total', {status_counter_sql("NEW.Status")});
+            END""",
+        "trg_stats_books_delete": f"""
+            AFTER DELETE ON Books WHEN OLD.deleted_at IS NULL BEGIN
+                UPDATE stats SET value = value - 1
+                WHERE name IN ('books_total', {status_counter_sql("OLD.Status")});
+            END""",
+        "trg_stats_books_status": f"""
+            AFTER UPDATE OF Status, deleted_at ON Books
+            WHEN (OLD.deleted_at IS NULL) != (NEW.deleted_at IS NULL)
+                OR {status_counter_sql("OLD.Status")} != {status_counter_sql("NEW.Status")}
+            BEGIN
+                UPDATE stats SET value = value - 1
+                WHERE OLD.deleted_at IS NULL
+                AND name IN ('books_total', {status_counter_sql("OLD.Status")});
+                UPDATE stats SET value = value + 1
+                WHERE NEW.deleted_at IS NULL
+                AND name IN ('books_total', {status_counter_sql("NEW.Status")});
+            END""",
+        "trg_stats_readers_insert": """
+            AFTER INSERT ON readers BEGIN
+                UPDATE stats SET value = value + 1 WHERE name = 'readers_total';
+            END""",
+        "trg_stats_readers_delete": """
+            AFTER DELETE ON readers BEGIN
+                UPDATE stats SET value = value - 1 WHERE name = 'readers_total';
+            END""",
+        "trg_stats_loans_insert": """
+            AFTER INSERT ON borrowed_books WHEN NEW.status = 'borrowed' BEGIN
+                UPDATE stats SET value = value + 1 WHERE name = 'loans_active';
+            END""",
+        "trg_stats_loans_delete": """
+            AFTER DELETE ON borrowed_books WHEN OLD.status = 'borrowed' BEGIN
+                UPDATE stats SET value = value - 1 WHERE name = 'loans_active';
+            END""",
+        "trg_stats_loans_status": """
+            AFTER UPDATE OF status ON borrowed_books
+            WHEN (OLD.status = 'borrowed') != (NEW.status = 'borrowed')
+            BEGIN
+                UPDATE stats
+                SET value = value + (CASE WHEN NEW.status = 'borrowed' THEN 1 ELSE -1 END)
+                WHERE name = 'loans_active';
+            END""",
+    }
+    for name, body in triggers.items():
+        cur.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
+
+
+def rebuild_stats(conn):
+    cur = conn.cursor()
+    counts = dict.fromkeys(STATS_COUNTERS, 0)
+    cur.execute(
+        f"SELECT {status_counter_sql('Status')}, COUNT(*) FROM Books WHERE deleted_at IS NULL GROUP BY 1"
+    )
+    for name, count in cur.fetchall():
+        counts[name] += count
+        counts["books_total"] += count
+    cur.execute("SELECT COUNT(*) FROM readers")
+    counts["readers_total"] = cur.fetchone()[0]
+    cur.execute("SELECT COUNT(*) FROM borrowed_books WHERE status = 'borrowed'")
+    counts["loans_active"] = cur.fetchone()[0]
+    cur.executemany(
+        "INSERT OR REPLACE INTO stats (name, value) VALUES (?, ?)", counts.items()
+    )
+
+
+def read_stats(conn):
+    cur = conn.cursor()
+    cur.execute("SELECT name, value FROM stats")
+    return dict(cur.fetchall())
+
+
+class LoanError(Exception):
+    pass
+
+
+def checkout_book(conn, book_id, reader_id, when=None, loan_periods=None):
+    # Lends the book in the caller's transaction; the caller commits
+    when = when or datetime.datetime.now().isoformat()
+    cur = conn.cursor()
+    cur.execute("SELECT grade FROM readers WHERE id=?", (reader_id,))
+    reader = cur.fetchone()
+    if not reader:
+        raise LoanError(f"reader {reader_id} does not exist")
+    cur.execute("SELECT Genre FROM book_catalog WHERE ID=?", (book_id,))
+    book = cur.fetchone()
+    due_day = epoch_day(datetime.date.fromisoformat(when[:10])) + loan_period_days(
+        loan_periods, reader[0], book[0] if book else None
+    )
+    cur.execute(
+        f"UPDATE Books SET Status='borrowed' WHERE ID=? AND Status IN {AVAILABLE_STATUSES_SQL} AND deleted_at IS NULL",
+        (book_id,),
+    )
+    if cur.rowcount == 0:
+        raise LoanError(f"book {book_id} is not available")
+    try:
+        cur.execute(
+            "INSERT INTO borrowed_books (book_id, reader_id, borrow_date, status, due_day) VALUES (?, ?, ?, 'borrowed', ?)",
+            (book_id, reader_id, when, due_day),
+        )
+    except sqlite3.IntegrityError:
+        raise LoanError(f"book {book_id} is already on loan")
+    return cur.lastrowid
+
+
+def close_loan(conn, loan_id, loan_status, book_status, when=None):
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT book_id FROM borrowed_books WHERE id=? AND status='borrowed'",
+        (loan_id,),
+    )
+    row = cur.fetchone()
+    if not row:
+        raise LoanError(f"loan {loan_id} is not active")
+    cur.execute(
+        "UPDATE borrowed_books SET status=?, return_date=? WHERE id=?",
+        (loan_status, when, loan_id),
+    )
+    cur.execute("UPDATE Books SET Status=? WHERE ID=?", (book_status, row[0]))
+    return row[0]
+
+
+def checkin_book(conn, loan_id, when=None):
+    return close_loan(
+        conn,
+        loan_id,
+        "returned",
+        "available",
+        when or datetime.datetime.now().isoformat(),
+    )
+
+
+def mark_loan_lost(conn, loan_id):
+    return close_loan(conn, loan_id, "lost", "lost")
+
+
+def run_circulation_batch(conn, book_ids, handle):
+    # Runs handle(book_id) per queued book in a savepoint; returns (done, failed)
+    done = []
+    failed = []
+    cur = conn.cursor()
+    if not conn.in_transaction:
+        # Otherwise each savepoint RELEASE would commit on its own
+        cur.execute("BEGIN")
+    for book_id in book_ids:
+        cur.execute("SAVEPOINT circulation_item")
+        try:
+            done.append((book_id, handle(book_id)))
+        except LoanError as e:
+            cur.execute("ROLLBACK TO circulation_item")
+            failed.append((book_id, str(e)))
+        except Exception:
+            # Anything else aborts the whole batch
+            try:
+                cur.execute("ROLLBACK TO circulation_item")
+                cur.execute("RELEASE circulation_item")
+            except sqlite3.Error:
+                pass
+            conn.rollback()
+            raise
+        cur.execute("RELEASE circulation_item")
+    return done, failed
+
+
+def checkout_books(conn, reader_id, book_ids, when=None, loan_periods=None):
+    when = when or datetime.datetime.now().isoformat()
+    return run_circulation_batch(
+        conn,
+        book_ids,
+        lambda book_id: checkout_book(conn, book_id, reader_id, when, loan_periods),
+    )
+
+
+def checkin_books(conn, book_ids, when=None):
+    when = when or datetime.datetime.now().isoformat()
+    cur = conn.cursor()
+
+    def checkin(book_id):
+        cur.execute(
+            "SELECT id FROM borrowed_books WHERE book_id=? AND status='borrowed'",
+            (book_id,),
+        )
+        row = cur.fetchone()
+        if not row:
+            raise LoanError(f"book {book_id} is not on loan")
+        checkin_book(conn, row[0], when)
+        return row[0]
+
+    return run_circulation_batch(conn, book_ids, checkin)
+
+
+def epoch_day(day=None):
+    return (day or datetime.date.today()).toordinal() - EPOCH_ORDINAL
+
+
+def epoch_day_to_date(value):
+    if value is None or value == "":
+        return ""
+    return datetime.date.fromordinal(int(value) + EPOCH_ORDINAL).isoformat()
+
+
+def loan_period_days(loan_periods, grade=None, genre=None):
+    loan_periods = loan_periods or {}
+    genres = {str(k).casefold(): v for k, v in loan_periods.get("genres", {}).items()}
+    grades = {str(k).casefold(): v for k, v in loan_periods.get("grades", {}).items()}
+    if genre and str(genre).casefold() in genres:
+        return int(genres[str(genre).casefold()])
+    if grade and str(grade).casefold() in grades:
+        return int(grades[str(grade).casefold()])
+    return int(loan_periods.get("default", 14))
+
+
+def add_due_dates(conn, loan_periods):
+    cur = conn.cursor()
+    cur.execute("ALTER TABLE borrowed_books ADD COLUMN due_day INTEGER")
+    cur.execute(
+        """SELECT b.id, b.borrow_date, r.grade, k.Genre FROM borrowed_books b
+           LEFT JOIN readers r ON r.id = b.reader_id
+           LEFT JOIN Books k ON k.ID = b.book_id
+           WHERE b.status = 'borrowed' AND b.due_day IS NULL"""
+    )
+    updates = []
+    for loan_id, borrow_date, grade, genre in cur.fetchall():
+        try:
+            borrowed = datetime.date.fromisoformat(str(borrow_date)[:10])
+        except ValueError:
+            borrowed = datetime.date.today()
+        due_day = epoch_day(borrowed) + loan_period_days(loan_periods, grade, genre)
+        updates.append((due_day, loan_id))
+    cur.executemany("UPDATE borrowed_books SET due_day=? WHERE id=?", updates)
+
+
+def sync_loan_state(conn):
+    # Repairs Books.Status from the loans; statuses are kept in lower case
+    cur = conn.cursor()
+    cur.execute("UPDATE Books SET Status = lower(Status) WHERE Status <> lower(Status)")
+    cur.execute(
+        "UPDATE borrowed_books SET status='returned' WHERE status='zwrócona'"
+    )
+    cur.execute(
+        "UPDATE Books SET Status='borrowed' WHERE ID IN (SELECT book_id FROM borrowed_books WHERE status='borrowed')"
+    )
+
+
+def get_meta_value(conn, key, default=None):
+    cur = conn.cursor()
+    cur.execute("SELECT value FROM app_meta WHERE key = ?", (key,))
+    row = cur.fetchone()
+    return row[0] if row else default
+
+
+def set_meta_value(conn, key, value):
+    conn.execute(
+        "INSERT OR REPLACE INTO app_meta (key, value) VALUES (?, ?)", (key, value)
+    )
+
+
+def get_log_archive_key(conn):
+    # Archive segments use a random key kept inside the database
+    from cryptography.fernet import Fernet
+
+    key = get_meta_value(conn, "log_archive_key")
+    if key is None:
+        key = Fernet.generate_key().decode("ascii")
+        set_meta_value(conn, "log_archive_key", key)
+        conn.commit()
+    return key.encode("ascii")
+
+
+def get_database_id(conn):
+    database_id = get_meta_value(conn, "database_id")
+    if database_id is None:
+        database_id = base64.urlsafe_b64encode(os.urandom(12)).decode("ascii")
+        set_meta_value(conn, "database_id", database_id)
+        conn.commit()
+    return database_id
+
+
+def log_archive_folder(db_path):
+    return f"{os.path.splitext(os.path.abspath(db_path))[0]}.{LOG_ARCHIVE_FOLDER}"
+
+
+def load_log_archive_index(folder):
+    # {"database_id", "segments"}; old indexes are a bare list
+    path = os.path.join(folder, LOG_ARCHIVE_INDEX)
+    if not os.path.exists(path):
+        return {"database_id": None, "segments": []}
+    with open(path, "r", encoding="utf-8") as f:
+        index = json.load(f)
+    if isinstance(index, list):
+        return {"database_id": None, "segments": index}
+    return index
+
+
+def claim_log_archive(conn, folder, index, fernet):
+    from cryptography.fernet import InvalidToken
+
+    database_id = get_database_id(conn)
+    if index["database_id"] == database_id:
+        return
+    if index["database_id"] is None:
+        if index["segments"]:
+            newest = os.path.join(folder, index["segments"][-1]["file"])
+            try:
+                with open(newest, "rb") as f:
+                    fernet.decrypt(f.read())
+            except (OSError, InvalidToken):
+                raise ValueError(f"{folder} holds the log archive of another database")
+        index["database_id"] = database_id
+        write_file_atomic(
+            os.path.join(folder, LOG_ARCHIVE_INDEX),
+            json.dumps(index, indent=1).encode("utf-8"),
+        )
+        return
+    raise ValueError(f"{folder} holds the log archive of another database")
+
+
+def write_file_atomic(path, data):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def archive_old_logs(conn, retention_days, folder, segment_rows=LOG_SEGMENT_ROWS):
+    from cryptography.fernet import Fernet
+
+    cutoff = (
+        datetime.datetime.now() - datetime.timedelta(days=retention_days)
+    ).isoformat()
+    os.makedirs(folder, exist_ok=True)
+    index = load_log_archive_index(folder)
+    fernet = Fernet(get_log_archive_key(conn))
+    # Refuses another database's archive before anything is deleted
+    claim_log_archive(conn, folder, index, fernet)
+    archived_upto = max((seg["last_id"] for seg in index["segments"]), default=0)
+    cur = conn.cursor()
+    # Rows already archived by an interrupted run
+    cur.execute(
+        "DELETE FROM logs WHERE id <= ? AND timestamp < ?", (archived_upto, cutoff)
+    )
+    conn.commit()
+    moved = 0
+    while True:
+        cur.execute(
+            "SELECT id, user_id, action, timestamp, action_code, book_id, reader_id, loan_id, target_user_id FROM logs WHERE timestamp < ? AND id > ? ORDER BY id LIMIT ?",
+            (cutoff, archived_upto, segment_rows),
+        )
+        rows = cur.fetchall()
+        if not rows:
+            break
+        first_id, last_id = rows[0][0], rows[-1][0]
+        payload = "\n".join(json.dumps(row, ensure_ascii=False) for row in rows)
+        file_name = f"logs_{first_id}_{last_id}.seg"
+        write_file_atomic(
+            os.path.join(folder, file_name),
+            fernet.encrypt(zlib.compress(payload.encode("utf-8"), 9)),
+        )
+        index["segments"].append(
+            {
+                "file": file_name,
+                "first_id": first_id,
+                "last_id": last_id,
+                "start": min(row[3] for row in rows),
+                "end": max(row[3] for row in rows),
+                "rows": len(rows),
+            }
+        )
+        write_file_atomic(
+            os.path.join(folder, LOG_ARCHIVE_INDEX),
+            json.dumps(index, indent=1).encode("utf-8"),
+        )
+        cur.execute(
+            "DELETE FROM logs WHERE id BETWEEN ? AND ? AND timestamp < ?",
+            (first_id, last_id, cutoff),
+        )
+        conn.commit()
+        archived_upto = last_id
+        moved += len(rows)
+    return moved
+
+
+def search_log_archive(conn, folder, start=None, end=None, text=None):
+    from cryptography.fernet import Fernet
+
+    fernet = Fernet(get_log_archive_key(conn))
+    index = load_log_archive_index(folder)
+    claim_log_archive(conn, folder, index, fernet)
+    needle = text.casefold() if text else None
+    for seg in index["segments"]:
+        if start and seg["end"] < start or end and seg["start"] > end:
+            continue
+        with open(os.path.join(folder, seg["file"]), "rb") as f:
+            payload = zlib.decompress(fernet.decrypt(f.read())).decode("utf-8")
+        for line in payload.split("\n"):
+            row = render_log_row(json.loads(line))
+            if start and row[3] < start or end and row[3] > end:
+                continue
+            if needle and needle not in row[2].casefold():
+                continue
+            yield row
+
+
+def iter_query_rows(conn, query, params=(), arraysize=EXPORT_FETCH_SIZE):
+    cur = conn.cursor()
+    cur.arraysize = arraysize
+    cur.execute(query, params)
+    while True:
+        rows = cur.fetchmany()
+        if not rows:
+            break
+        yield from rows
+
+
+def export_rows(rows, header, path, fmt, progress=None):
+    written = 0
+
+    def tick():
+        if progress and written % EXPORT_FETCH_SIZE == 0:
+            progress(written)
+
+    if fmt == "xlsx":
+        from openpyxl import Workbook
+
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet("Export")
+        ws.append(header)
+        for row in rows:
+            ws.append(list(row))
+            written += 1
+            tick()
+        wb.save(path)
+    elif fmt == "jsonl":
+        with open(path, "w", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(dict(zip(header, row)), ensure_ascii=False))
+                f.write("\n")
+                written += 1
+                tick()
+    else:
+        with open(path, "w", newline="", encoding="utf-8-sig") as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            for row in rows:
+                writer.writerow(row)
+                written += 1
+                tick()
+    if progress:
+        progress(written)
+    return written
+
+
+def export_dataset(db_path, dataset, path, fmt, progress=None, on_total=None):
+    # Runs on a worker thread with its own read-only connection
+    query, header = EXPORT_QUERIES[dataset]
+    conn = sqlite3.connect(f"file:{os.path.abspath(db_path)}?mode=ro", uri=True)
+    try:
+        if on_total:
+            on_total(conn.execute(f"SELECT COUNT(*) FROM ({query})").fetchone()[0])
+        rows = iter_query_rows(conn, query)
+        if dataset == "logs":
+            rows = map(render_log_row, rows)
+        return export_rows(rows, header, path, fmt, progress)
+    finally:
+        conn.close()
+
+
 def find_latest_version_executable(prefix):
     best_version = -1
     best_path = None
@@ -89,6 +2194,712 @@ def find_latest_version_executable(prefix):
     return best_path, best_version
 
 
+# Foreign key actions added to databases written by the last release
+FOREIGN_KEY_ACTIONS = (
+    ("borrowed_books", "Books", "ID", "ON UPDATE CASCADE"),
+    ("borrowed_books", "readers", "id", "ON UPDATE CASCADE"),
+    ("logs", "users", "id", "ON DELETE SET NULL"),
+)
+
+
+def add_foreign_key_actions(conn):
+    # Actions only live in the CREATE TABLE text, so it is edited in sqlite_master;
+    # runs with foreign_keys off
+    cur = conn.cursor()
+    cur.execute("PRAGMA schema_version")
+    version = cur.fetchone()[0]
+    cur.execute("PRAGMA writable_schema = ON")
+    try:
+        for table, parent, column, action in FOREIGN_KEY_ACTIONS:
+            cur.execute(
+                "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?",
+                (table,),
+            )
+            row = cur.fetchone()
+            if not row:
+                continue
+            sql = re.sub(
+                rf"REFERENCES\s+{parent}\s*\(\s*{column}\s*\)(?!\s*ON\b)",
+                f"REFERENCES {parent} ({column}) {action}",
+                row[0],
+            )
+            if sql != row[0]:
+                cur.execute(
+                    "UPDATE sqlite_master SET sql = ? WHERE type = 'table' AND name = ?",
+                    (sql, table),
+                )
+                version += 1
+        cur.execute(f"PRAGMA schema_version = {version}")
+    finally:
+        cur.execute("PRAGMA writable_schema = OFF")
+
+
+def foreign_keys(conn):
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' "
+        "AND name NOT LIKE 'sqlite_%' ORDER BY name"
+    )
+    keys = []
+    for (table,) in cur.fetchall():
+        cur.execute(f'PRAGMA foreign_key_list("{table}")')
+        for row in cur.fetchall():
+            keys.append((table, row[3], row[2], row[4] or "rowid"))
+    return keys
+
+
+def unindexed_foreign_keys(conn):
+    # Foreign keys whose column does not lead a non-partial index
+    cur = conn.cursor()
+    missing = []
+    for table, column, parent, parent_column in foreign_keys(conn):
+        cur.execute(f'PRAGMA index_list("{table}")')
+        indexed = False
+        for index in cur.fetchall():
+            if index[4]:
+                continue
+            cur.execute(f'PRAGMA index_info("{index[1]}")')
+            first = cur.fetchone()
+            if first and first[2] == column:
+                indexed = True
+                break
+        if not indexed:
+            missing.append((table, column, parent))
+    return missing
+
+
+def consistency_check_steps(conn):
+    # Steps of one consistency pass: ("integrity", table) and ("fk", key)
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' "
+        "AND name NOT LIKE 'sqlite_%' ORDER BY name"
+    )
+    if sqlite3.sqlite_version_info >= (3, 33, 0):
+        steps = [("integrity", table) for (table,) in cur.fetchall()]
+    else:
+        steps = [("integrity", None)]
+    return steps + [("fk", key) for key in foreign_keys(conn)]
+
+
+def orphan_condition(table, column, parent, parent_column):
+    return (
+        f'"{table}"."{column}" IS NOT NULL AND NOT EXISTS (SELECT 1 FROM "{parent}" '
+        f'WHERE "{parent}"."{parent_column}" = "{table}"."{column}")'
+    )
+
+
+def consistency_check_slice(conn, budget_seconds):
+    # Runs the resumable consistency pass for about budget_seconds; returns
+    # (report or None, steps done, steps in the pass)
+    steps = consistency_check_steps(conn)
+    state = json.loads(get_meta_value(conn, "consistency_cursor") or "null")
+    if not state or state["steps"] != len(steps):
+        # First slice, or the schema changed under the pass: start over
+        state = {
+            "started": datetime.datetime.now().isoformat(timespec="seconds"),
+            "steps": len(steps),
+            "step": 0,
+            "rowid": 0,
+            "retries": 0,
+            "problems": [],
+            "orphans": {},
+        }
+    started = time.monotonic()
+    cur = conn.cursor()
+    while state["step"] < len(steps):
+        kind, target = steps[state["step"]]
+        if state["retries"]:
+            deadline = time.monotonic() + budget_seconds * 2 ** state["retries"]
+        else:
+            deadline = started + budget_seconds
+        conn.set_progress_handler(lambda: time.monotonic() > deadline, 1000)
+        try:
+            if kind == "integrity":
+                if target is None:
+                    cur.execute("PRAGMA integrity_check")
+                else:
+                    cur.execute(f'PRAGMA integrity_check("{target}")')
+                state["problems"] += [
+                    row[0] for row in cur.fetchall() if row[0] != "ok"
+                ]
+                state["step"] += 1
+            else:
+                table, column, parent, parent_column = target
+                cur.execute(f'SELECT MAX(rowid) FROM "{table}"')
+                last = cur.fetchone()[0] or 0
+                if state["rowid"] >= last:
+                    state["step"] += 1
+                    state["rowid"] = 0
+                else:
+                    upper = state["rowid"] + CONSISTENCY_SCAN_ROWS
+                    cur.execute(
+                        f'SELECT COUNT(*) FROM "{table}" WHERE rowid > ? AND rowid <= ? '
+                        f"AND {orphan_condition(table, column, parent, parent_column)}",
+                        (state["rowid"], upper),
+                    )
+                    count = cur.fetchone()[0]
+                    if count:
+                        name = f"{table}.{column}"
+                        state["orphans"][name] = state["orphans"].get(name, 0) + count
+                    state["rowid"] = upper
+            state["retries"] = 0
+        except sqlite3.OperationalError as e:
+            if "interrupt" not in str(e):
+                raise
+            state["retries"] += 1
+            if state["retries"] > CONSISTENCY_RETRIES:
+                name = target if kind == "integrity" else f"{target[0]}.{target[1]}"
+                state["problems"].append(
+                    f"{kind} {name or 'database'}: not checked, over the time budget"
+                )
+                state["step"] += 1
+                state["rowid"] = 0
+                state["retries"] = 0
+            break
+        finally:
+            conn.set_progress_handler(None, 0)
+        if time.monotonic() - started >= budget_seconds:
+            break
+    state["problems"] = state["problems"][:CONSISTENCY_MAX_PROBLEMS]
+    report = None
+    if state["step"] >= len(steps):
+        report = {
+            "at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "started": state["started"],
+            "problems": state["problems"],
+            "orphans": state["orphans"],
+        }
+        set_meta_value(conn, "consistency_report", json.dumps(report))
+        cur.execute("DELETE FROM app_meta WHERE key = 'consistency_cursor'")
+    else:
+        set_meta_value(conn, "consistency_cursor", json.dumps(state))
+    conn.commit()
+    return report, state["step"], len(steps)
+
+
+def consistency_report(conn):
+    value = get_meta_value(conn, "consistency_report")
+    return json.loads(value) if value else None
+
+
+def fix_orphans(conn, table, column):
+    keys = {(t, c): (p, pc) for t, c, p, pc in foreign_keys(conn)}
+    parent, parent_column = keys[(table, column)]
+    orphans = orphan_condition(table, column, parent, parent_column)
+    cur = conn.cursor()
+    if (table, column) == ("borrowed_books", "book_id"):
+        cur.execute(
+            "INSERT INTO Books (ID, title_id, Status, deleted_at) "
+            f"SELECT DISTINCT book_id, ?, 'missing', ? FROM borrowed_books WHERE {orphans}",
+            (
+                ensure_title(conn, "(missing book)", None, None, None),
+                datetime.datetime.now().isoformat(),
+            ),
+        )
+    elif (table, column) == ("borrowed_books", "reader_id"):
+        cur.execute(
+            "INSERT INTO readers (id, name, surname, grade) "
+            f"SELECT DISTINCT reader_id, '(deleted reader)', '', '' FROM borrowed_books WHERE {orphans}"
+        )
+    elif (table, column) == ("Books", "title_id"):
+        cur.execute(
+            f"UPDATE Books SET title_id = ? WHERE {orphans}",
+            (ensure_title(conn, "(missing title)", None, None, None),),
+        )
+    else:
+        cur.execute(f'UPDATE "{table}" SET "{column}" = NULL WHERE {orphans}')
+    fixed = cur.rowcount
+    report = consistency_report(conn)
+    if report:
+        report["orphans"].pop(f"{table}.{column}", None)
+        set_meta_value(conn, "consistency_report", json.dumps(report))
+    return fixed
+
+
+# Schema version in app_meta; newer databases are not restored over this one
+SCHEMA_VERSION = 1
+RESTORE_REQUIRED_TABLES = ("Books", "readers", "borrowed_books", "users", "logs")
+
+
+def stage_restore(src_path, dest_path, key):
+    if src_path.endswith(".enc"):
+        if not decrypt_file(src_path, dest_path, key):
+            return ["cannot be decrypted with the current credentials"]
+        return []
+    try:
+        source = sqlite3.connect(
+            f"file:{os.path.abspath(src_path)}?mode=ro", uri=True
+        )
+        target = sqlite3.connect(dest_path)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+    except sqlite3.DatabaseError as e:
+        return [f"not a database: {e}"]
+    return []
+
+
+def validate_database_file(path, username=None):
+    problems = []
+    try:
+        conn = sqlite3.connect(path)
+    except sqlite3.Error as e:
+        return [str(e)]
+    try:
+        cur = conn.cursor()
+        cur.execute("PRAGMA integrity_check(20)")
+        messages = [row[0] for row in cur.fetchall()]
+        if messages != ["ok"]:
+            return ["integrity check: " + "; ".join(messages)]
+        cur.execute("SELECT name FROM sqlite_master WHERE type='table'")
+        tables = {row[0] for row in cur.fetchall()}
+        missing = [name for name in RESTORE_REQUIRED_TABLES if name not in tables]
+        if missing:
+            return ["missing tables: " + ", ".join(missing)]
+        if "app_meta" in tables:
+            found = int(get_meta_value(conn, "schema_version", 0))
+            if found > SCHEMA_VERSION:
+                problems.append(
+                    f"schema version {found} is newer than supported ({SCHEMA_VERSION})"
+                )
+        if username is not None:
+            cur.execute("SELECT 1 FROM users WHERE username=?", (username,))
+            if not cur.fetchone():
+                problems.append(f"user {username} does not exist in it")
+    except sqlite3.DatabaseError as e:
+        problems.append(str(e))
+    finally:
+        conn.close()
+    return problems
+
+
+def migrate_baseline_schema(conn, settings):
+    # Brings a database of the last release (no app_meta) to the current schema
+    cur = conn.cursor()
+    migrate_log_schema(conn)
+    shorten_log_actions(conn)
+    for column in ("ISBN", "Barcode", "deleted_at"):
+        cur.execute(f"ALTER TABLE Books ADD COLUMN {column} TEXT")
+    sync_loan_state(conn)
+    add_due_dates(conn, settings.get("loan_periods"))
+    move_removed_books(conn)
+    add_titles_model(conn)
+    cur.execute("ALTER TABLE Books ADD COLUMN title_id INTEGER")
+    split_titles_from_copies(conn)
+    add_foreign_key_actions(conn)
+
+
+def init_schema(conn, settings):
+    cur = conn.cursor()
+    # The stats triggers need INSERT OR REPLACE to fire delete triggers
+    cur.execute("PRAGMA recursive_triggers = ON")
+    cur.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+    tables = {row[0] for row in cur.fetchall()}
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS app_meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS id_reservations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            first_id INTEGER NOT NULL,
+            last_id INTEGER NOT NULL,
+            user_id INTEGER,
+            created_at TEXT
+        )
+    """)
+    if "Books" in tables and "app_meta" not in tables:
+        migrate_baseline_schema(conn, settings)
+    add_titles_model(conn)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS Books (
+            ID INTEGER PRIMARY KEY,
+            title_id INTEGER NOT NULL REFERENCES titles (id),
+            Status TEXT,
+            BookRow TEXT,
+            Barcode TEXT,
+            deleted_at TEXT
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL,
+            is_admin INTEGER DEFAULT 0,
+            is_superadmin INTEGER DEFAULT 0,
+            privileges TEXT DEFAULT ''
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS readers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            surname TEXT NOT NULL,
+            grade TEXT NOT NULL
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS borrowed_books (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            book_id INTEGER NOT NULL,
+            reader_id INTEGER NOT NULL,
+            borrow_date TEXT NOT NULL,
+            return_date TEXT,
+            status TEXT NOT NULL,
+            due_day INTEGER,
+            FOREIGN KEY (book_id) REFERENCES Books (ID) ON UPDATE CASCADE,
+            FOREIGN KEY (reader_id) REFERENCES readers (id) ON UPDATE CASCADE
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            action TEXT,
+            timestamp TEXT,
+            action_code TEXT,
+            book_id INTEGER,
+            reader_id INTEGER,
+            loan_id INTEGER,
+            target_user_id INTEGER,
+            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE SET NULL
+        )
+    """)
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_id_reservations_last ON id_reservations (last_id)"
+    )
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_logs_timestamp ON logs (timestamp)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_logs_user ON logs (user_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_logs_code ON logs (action_code)")
+    for column in LOG_REF_COLUMNS:
+        cur.execute(
+            f"CREATE INDEX IF NOT EXISTS idx_logs_{column} ON logs ({column}) WHERE {column} IS NOT NULL"
+        )
+    for column in ("reader_id", "book_id"):
+        other = "book_id" if column == "reader_id" else "reader_id"
+        cur.execute(
+            f"CREATE INDEX IF NOT EXISTS idx_loans_{column[:-3]}_history ON borrowed_books "
+            f"({column}, borrow_date, id, {other}, return_date, status, due_day)"
+        )
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_loans_active ON borrowed_books (id) WHERE status = 'borrowed'"
+    )
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_loans_due ON borrowed_books (due_day) WHERE status = 'borrowed'"
+    )
+    try:
+        cur.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_loans_active_book ON borrowed_books (book_id) WHERE status = 'borrowed'"
+        )
+    except sqlite3.IntegrityError:
+        # Historic double loans; keep them visible rather than failing to open
+        cur.execute(
+            "CREATE INDEX IF NOT EXISTS idx_loans_active_book ON borrowed_books (book_id) WHERE status = 'borrowed'"
+        )
+    add_book_indexes(conn)
+    install_stats_triggers(conn)
+    if get_meta_value(conn, "schema_version") is None:
+        rebuild_stats(conn)
+        set_meta_value(conn, "schema_version", SCHEMA_VERSION)
+
+
+def seed_sample_db(conn, books=5000, readers=500, loans=20000, logs=20000):
+    init_schema(conn, DEFAULT_SETTINGS)
+    cur = conn.cursor()
+    today = epoch_day()
+    # Every tenth book is on loan (see the loans below), the rest mostly lendable
+    statuses = ("available", "available", "available", "returned", "lost", "missing")
+    cur.executemany(
+        "INSERT INTO users (username, password, is_admin, privileges) VALUES (?, ?, ?, ?)",
+        [(f"user{i}", "x", int(i == 0), "manage_books") for i in range(20)],
+    )
+    add_copies(
+        conn,
+        [
+            (
+                i,
+                f"Title {i % (books // 3 or 1)}",
+                f"Author {i % 300}",
+                1950 + i % 70,
+                f"Genre {i % 25}",
+                "borrowed" if i % 10 == 1 else statuses[i % len(statuses)],
+                f"R{i % 40}",
+                f"978{i // 3:010d}" if i % 2 else None,
+                f"LIB{i:07d}",
+                "2000-01-01T00:00:00" if i % 50 == 0 else None,
+            )
+            for i in range(1, books + 1)
+        ],
+    )
+    cur.executemany(
+        "INSERT INTO readers (name, surname, grade) VALUES (?, ?, ?)",
+        [
+            (f"Name{i}", f"Surname{i}", f"{1 + i % 8}{'abc'[i % 3]}")
+            for i in range(readers)
+        ],
+    )
+    cur.executemany(
+        "INSERT INTO borrowed_books (book_id, reader_id, borrow_date, return_date, status, due_day) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        [
+            (
+                1 + i % books,
+                1 + i % readers,
+                (datetime.date.today() - datetime.timedelta(days=i % 700)).isoformat(),
+                None if i % 10 == 0 and i < books else "2020-01-01",
+                "borrowed" if i % 10 == 0 and i < books else "returned",
+                today - i % 30,
+            )
+            for i in range(loans)
+        ],
+    )
+    cur.executemany(
+        "INSERT INTO logs "
+        "(user_id, action, timestamp, action_code, book_id, reader_id, loan_id) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [
+            (
+                1 + i % 20,
+                (f"user{1 + i % 20}", None, None, f"sample action {i}")[i % 4],
+                (
+                    datetime.datetime(2024, 1, 1) + datetime.timedelta(minutes=i)
+                ).isoformat(),
+                ("login", "book_assigned", "loan_returned", "other")[i % 4],
+                1 + i % books if i % 4 in (1, 2) else None,
+                1 + i % readers if i % 4 == 1 else None,
+                1 + i % loans if i % 4 == 2 and loans else None,
+            )
+            for i in range(logs)
+        ],
+    )
+    rebuild_stats(conn)
+    conn.commit()
+
+
+def hot_queries():
+    # (name, sql, args, index the plan must use) for the list screens and lookups
+    today = epoch_day()
+    queries = []
+
+    def page(name, index, table, columns, key_col, sort_col=None, **kw):
+        kw.setdefault("token", (None, 1))
+        sql, args = keyset_query(table, columns, key_col, sort_col, **kw)
+        queries.append((name, sql, args, index))
+
+    book_columns = "ID, Title, Author, Year, Genre, Status"
+    where, params = books_filter_sql(None)
+    for column in ("Title", "Author", "Year", "Genre", "Status"):
+        for ascending in (True, False):
+            page(
+                f"books sorted by {column} {'ASC' if ascending else 'DESC'}",
+                {"Title": "idx_titles_match", "Status": "idx_books_live_status"}.get(
+                    column, f"idx_titles_{column.lower()}"
+                ),
+                "book_catalog",
+                book_columns,
+                "ID",
+                column,
+                ascending=ascending,
+                token=("M", 1),
+                where=where,
+                params=params,
+            )
+    where, params = books_filter_sql({"ID": 42})
+    page(
+        "books filtered by ID",
+        "PRIMARY KEY",
+        "book_catalog",
+        book_columns,
+        "ID",
+        where=where,
+        params=params,
+    )
+    page(
+        "removed books",
+        "idx_books_deleted",
+        "book_catalog",
+        "ID, Title, Author, Year, BookRow, deleted_at",
+        "ID",
+        "deleted_at",
+        token=("2001-01-01", 1),
+        ascending=False,
+        where=["deleted_at IS NOT NULL"],
+    )
+    queries += [
+        (
+            "book by ISBN",
+            f"SELECT ID, Title FROM book_catalog WHERE ISBN = ? AND deleted_at IS NULL ORDER BY Status IN {AVAILABLE_STATUSES_SQL} DESC, ID LIMIT 1",
+            ["9780000000001"],
+            "idx_titles_isbn",
+        ),
+        (
+            "book by barcode",
+            "SELECT ID, Title FROM book_catalog WHERE Barcode = ? AND deleted_at IS NULL",
+            ["LIB0000001"],
+            "idx_books_barcode",
+        ),
+        (
+            "copies of a title",
+            f"SELECT COUNT(*), COUNT(CASE WHEN Status IN {AVAILABLE_STATUSES_SQL} THEN 1 END) "
+            "FROM Books WHERE title_id = ? AND deleted_at IS NULL",
+            [1],
+            "idx_books_title_copies",
+        ),
+        (
+            "next free book ID",
+            "SELECT MAX(COALESCE((SELECT MAX(ID) FROM Books), 0), "
+            "COALESCE((SELECT MAX(last_id) FROM id_reservations), 0))",
+            [],
+            "idx_id_reservations_last",
+        ),
+        (
+            "reader by ID",
+            "SELECT name, surname FROM readers WHERE id=?",
+            [1],
+            "PRIMARY KEY",
+        ),
+        (
+            "active loan of a book",
+            "SELECT id FROM borrowed_books WHERE book_id=? AND status='borrowed'",
+            [1],
+            "idx_loans_active_book",
+        ),
+        (
+            "login lookup",
+            "SELECT id, password, is_admin FROM users WHERE username=?",
+            ["user1"],
+            "sqlite_autoindex_users_1",
+        ),
+        (
+            "privileges of a user",
+            "SELECT privileges FROM users WHERE id=?",
+            [1],
+            "PRIMARY KEY",
+        ),
+    ]
+    page(
+        "available books to lend",
+        "idx_books_live_available",
+        "book_catalog",
+        book_columns,
+        "ID",
+        where=AVAILABLE_BOOKS_WHERE,
+    )
+    where, params = loans_filter_sql()
+    page(
+        "active loans",
+        "idx_loans_active",
+        LOANS_VIEW_TABLES,
+        LOANS_VIEW_COLUMNS,
+        "b.id",
+        token=(None, 10**9),
+        ascending=False,
+        where=where,
+        params=params,
+    )
+    # Text searches cannot seek, so they walk the list's key order
+    page(
+        "readers by text",
+        "INTEGER PRIMARY KEY",
+        "readers",
+        "id, name, surname, grade",
+        "id",
+        where=["(id || name || surname || grade) LIKE ?"],
+        params=["%an%"],
+    )
+    for active_only in (True, False):
+        where, params = loans_filter_sql(active_only=active_only, text="an")
+        page(
+            f"{'active' if active_only else 'all'} loans by text",
+            "idx_loans_active" if active_only else "INTEGER PRIMARY KEY",
+            LOANS_VIEW_TABLES,
+            LOANS_VIEW_COLUMNS,
+            "b.id",
+            token=(None, 10**9),
+            ascending=False,
+            where=where,
+            params=params,
+        )
+    for column in ("Title", "Author", "Genre", "Status"):
+        where, params = books_filter_sql({column: "an"})
+        page(
+            f"books filtered by {column}",
+            "INTEGER PRIMARY KEY",
+            "book_catalog",
+            book_columns,
+            "ID",
+            where=where,
+            params=params,
+        )
+    where, params = books_filter_sql({"Year": 2000})
+    page(
+        "books filtered by Year",
+        "idx_titles_year",
+        "book_catalog",
+        book_columns,
+        "ID",
+        where=where,
+        params=params,
+    )
+    where, params = loans_filter_sql(overdue_only=True)
+    page(
+        "overdue loans",
+        "idx_loans_due",
+        LOANS_VIEW_TABLES,
+        LOANS_VIEW_COLUMNS,
+        "b.id",
+        "b.due_day",
+        token=(today - 20, 1),
+        where=where,
+        params=params,
+    )
+    for name, history, column in (
+        ("reader loan history", LOAN_HISTORY_BY_READER, "reader_id"),
+        ("book loan history", LOAN_HISTORY_BY_BOOK, "book_id"),
+    ):
+        page(
+            name,
+            f"idx_loans_{column[:-3]}_history",
+            history[0],
+            history[1],
+            "b.id",
+            "b.borrow_date",
+            token=("2025-01-01", 10**9),
+            ascending=False,
+            where=[f"b.{column} = ?"],
+            params=[1],
+        )
+    for name, index, filters in (
+        ("logs of a user", "idx_logs_user", {"user_id": 3}),
+        ("logs of a kind", "idx_logs_code", {"kind": "login"}),
+        ("logs of a book", "idx_logs_book_id", {"book_id": 7}),
+        (
+            "logs in a date range",
+            ("idx_logs_timestamp", "INTEGER PRIMARY KEY"),
+            {"start": "2024-01-02", "end": "2024-01-03"},
+        ),
+    ):
+        where, params = logs_filter_sql(**filters)
+        page(
+            name,
+            index,
+            "logs",
+            "id, user_id, action, timestamp",
+            "id",
+            token=(None, 10**9),
+            ascending=False,
+            where=where,
+            params=params,
+        )
+    return queries
+
+
 class BookwormApp(tk.Tk):
     def __init__(self):
         super().__init__()
@@ -100,6 +2911,8 @@ class BookwormApp(tk.Tk):
         self.lang = "EN"
         self.username = None
         self.password = None
+        # Fernet key derived at login; backups are encrypted with it
+        self.user_key = None
         self.conn = None
         self.cursor = None
         self.db_encrypted_path = "bookworm.db.enc"
@@ -107,6 +2920,16 @@ class BookwormApp(tk.Tk):
         self.failed_login_attempts = 0
         self.last_failed_login_time = None
         self.is_admin = False
+        self.user_id = None
+        self.log_buffer = []
+        self.log_flush_job = None
+        # Set while an import holds a transaction open; timers must not commit
+        self.long_transaction = False
+        self.id_reservation = None
+        self.last_activity = time.monotonic()
+        self.bind_all("<Any-KeyPress>", self.note_activity, add="+")
+        self.bind_all("<Any-ButtonPress>", self.note_activity, add="+")
+        self.after(MAINTENANCE_POLL_MS, self.maintenance_tick)
 
         # Check if settings.json exists before loading settings
         if not os.path.exists(SETTINGS_FILE):
@@ -280,13 +3103,19 @@ class BookwormApp(tk.Tk):
             row = self.cursor.fetchone()
             if row and row[1] == password:
                 self.username = username
+                self.user_id = row[0]
                 self.is_admin = bool(row[2])
+                self.user_key = generate_key(username, password)
                 self.failed_login_attempts = 0
                 # Ensure language is set correctly before showing main menu
                 self.lang = self.settings.get("default_language", "EN")
                 if self.lang not in ["EN", "PL"]:
                     self.lang = "EN"
-                self.log_action(row[0], f"login (user: {username})")
+                self.log_action(self.user_id, username, "login")
+                if self.is_admin:
+                    self.after_idle(lambda: self.apply_log_retention(quiet=True))
+                    self.after_idle(self.purge_removed_books)
+                self.offer_legacy_migration()
                 self.create_main_menu()
             else:
                 self.failed_login_attempts += 1
@@ -298,7 +3127,9 @@ class BookwormApp(tk.Tk):
                     else "Nieprawidłowa nazwa użytkownika lub hasło",
                 )
                 if row:
-                    self.log_action(row[0], f"failed_login (user: {username})")
+                    self.log_action(
+                        row[0], username, "failed_login"
+                    )
 
         def try_register():
             username = username_entry.get().strip()
@@ -326,12 +3157,13 @@ class BookwormApp(tk.Tk):
                         "INSERT INTO users (username, password, is_admin) VALUES (?, ?, 1)",
                         (username, password),
                     )
-                    self.conn.commit()
                     self.username = username
+                    self.user_id = self.cursor.lastrowid
                     self.is_admin = True
                     self.log_action(
-                        self.get_user_id(username), f"admin_created (user: {username})"
+                        self.user_id, username, "admin_created"
                     )
+                    self.flush_logs()
                     self.create_main_menu()
                 else:
                     return
@@ -341,12 +3173,13 @@ class BookwormApp(tk.Tk):
                         "INSERT INTO users (username, password, is_admin) VALUES (?, ?, 0)",
                         (username, password),
                     )
-                    self.conn.commit()
                     self.username = username
+                    self.user_id = self.cursor.lastrowid
                     self.is_admin = False
                     self.log_action(
-                        self.get_user_id(username), f"user_created (user: {username})"
+                        self.user_id, username, "user_created"
                     )
+                    self.flush_logs()
                     self.create_main_menu()
                 except sqlite3.IntegrityError:
                     messagebox.showerror(
@@ -387,136 +3220,507 @@ class BookwormApp(tk.Tk):
                         raise Exception("Failed to decrypt database")
             self.conn = sqlite3.connect(self.db_decrypted_path)
             self.cursor = self.conn.cursor()
-            self.cursor.execute("""
-                CREATE TABLE IF NOT EXISTS Books (
-                    ID INTEGER PRIMARY KEY,
-                    Title TEXT,
-                    Author TEXT,
-                    Year INTEGER,
-                    Genre TEXT,
-                    Status TEXT,
-                    BookRow TEXT
-                )
-            """)
-            self.cursor.execute("""
-                CREATE TABLE IF NOT EXISTS RemovedBooks (
-                    ID INTEGER PRIMARY KEY,
-                    Title TEXT,
-                    Author TEXT,
-                    Year INTEGER,
-                    Genre TEXT,
-                    Status TEXT
-                )
-            """)
-            self.cursor.execute("""
-                CREATE TABLE IF NOT EXISTS users (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    username TEXT UNIQUE NOT NULL,
-                    password TEXT NOT NULL,
-                    is_admin INTEGER DEFAULT 0,
-                    is_superadmin INTEGER DEFAULT 0,
-                    privileges TEXT DEFAULT ''
-                )
-            """)
-            self.cursor.execute("""
-                CREATE TABLE IF NOT EXISTS readers (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT NOT NULL,
-                    surname TEXT NOT NULL,
-                    grade TEXT NOT NULL
-                )
-            """)
-            self.cursor.execute("""
-                CREATE TABLE IF NOT EXISTS borrowed_books (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    book_id INTEGER NOT NULL,
-                    reader_id INTEGER NOT NULL,
-                    borrow_date TEXT NOT NULL,
-                    return_date TEXT,
-                    status TEXT NOT NULL,
-                    FOREIGN KEY (book_id) REFERENCES Books (ID),
-                    FOREIGN KEY (reader_id) REFERENCES readers (id)
-                )
-            """)
-            self.cursor.execute("""
-                CREATE TABLE IF NOT EXISTS logs (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    action TEXT,
-                    timestamp TEXT,
-                    FOREIGN KEY (user_id) REFERENCES users (id)
-                )
-            """)
+            apply_storage_profile(self.conn, storage_profile_pragmas(self.settings))
+            init_schema(self.conn, self.settings)
             self.conn.commit()
+            # Only after the migrations; a no-op inside a transaction
+            self.conn.execute("PRAGMA foreign_keys = ON")
 
     def create_new_encrypted_db(self):
         self.conn = sqlite3.connect(self.db_decrypted_path)
         self.cursor = self.conn.cursor()
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS Books (
-                ID INTEGER PRIMARY KEY,
-                Title TEXT,
-                Author TEXT,
-                Year INTEGER,
-                Genre TEXT,
-                Status TEXT,
-                BookRow TEXT
-            )
-        """)
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS RemovedBooks (
-                ID INTEGER PRIMARY KEY,
-                Title TEXT,
-                Author TEXT,
-                Year INTEGER,
-                Genre TEXT,
-                Status TEXT
-            )
-        """)
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE NOT NULL,
-                password TEXT NOT NULL,
-                is_admin INTEGER DEFAULT 0,
-                privileges TEXT DEFAULT ''
-            )
-        """)
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS readers (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                surname TEXT NOT NULL,
-                grade TEXT NOT NULL
-            )
-        """)
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS borrowed_books (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                book_id INTEGER NOT NULL,
-                reader_id INTEGER NOT NULL,
-                borrow_date TEXT NOT NULL,
-                return_date TEXT,
-                status TEXT NOT NULL,
-                FOREIGN KEY (book_id) REFERENCES Books (ID),
-                FOREIGN KEY (reader_id) REFERENCES readers (id)
-            )
-        """)
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS logs (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                action TEXT,
-                timestamp TEXT,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        """)
+        init_schema(self.conn, self.settings)
         self.conn.commit()
 
+    def disconnect_db(self, maintenance=True):
+        if not self.conn:
+            return
+        if self.id_reservation:
+            release_book_ids(self.conn, self.id_reservation[0])
+            self.id_reservation = None
+        self.flush_logs()
+        if maintenance:
+            # Last chance before the file is encrypted: run whatever is due
+            self.run_maintenance(at_close=True)
+        self.conn.close()
+        self.conn = None
+
+    def open_backup_sets(self, parent=None):
+        import threading
+        from tkinter import filedialog
+
+        win = tk.Toplevel(parent or self)
+        win.title("Backup sets" if self.lang == "EN" else "Zestawy kopii")
+        win.geometry("700x450")
+        store = dict(
+            DEFAULT_SETTINGS["backup_store"], **self.settings.get("backup_store", {})
+        )
+        def store_keys():
+            return open_backup_store(self.conn, store["dir"], self.user_key)
+
+        top = tk.Frame(win)
+        top.pack(fill="x", padx=10, pady=10)
+        tk.Label(
+            top, text="Store folder:" if self.lang == "EN" else "Folder kopii:"
+        ).grid(row=0, column=0, sticky="w")
+        dir_var = tk.StringVar(value=store.get("dir") or "")
+        tk.Entry(top, textvariable=dir_var, width=50).grid(
+            row=0, column=1, padx=5, sticky="ew"
+        )
+        daily_var = tk.BooleanVar(value=bool(store.get("daily_at_close")))
+        top.grid_columnconfigure(1, weight=1)
+
+        columns = ("created", "size", "chunks", "new")
+        tree = ttk.Treeview(win, columns=columns, show="headings")
+        for col, en, pl in (
+            ("created", "Created", "Utworzono"),
+            ("size", "Database size", "Rozmiar bazy"),
+            ("chunks", "Chunks", "Fragmenty"),
+            ("new", "New data", "Nowe dane"),
+        ):
+            tree.heading(col, text=en if self.lang == "EN" else pl)
+        tree.pack(fill="both", expand=True, padx=10)
+        status_var = tk.StringVar()
+        tk.Label(win, textvariable=status_var, anchor="w").pack(fill="x", padx=10)
+        buttons = tk.Frame(win)
+        buttons.pack(fill="x", padx=10, pady=10)
+
+        def megabytes(size):
+            return f"{size / 1048576:.1f} MB"
+
+        def save_store():
+            self.settings["backup_store"] = dict(
+                store, dir=dir_var.get().strip() or None, daily_at_close=daily_var.get()
+            )
+            self.save_settings(self.settings)
+            store.update(self.settings["backup_store"])
+
+        def browse():
+            folder = filedialog.askdirectory(parent=win)
+            if folder:
+                dir_var.set(folder)
+                save_store()
+                reload()
+
+        def reload():
+            tree.delete(*tree.get_children())
+            if not store.get("dir"):
+                return
+            try:
+                manifests, unreadable = read_backup_manifests(
+                    store["dir"], store_keys()
+                )
+            except OSError as e:
+                status_var.set(str(e))
+                return
+            for manifest in manifests:
+                tree.insert(
+                    "",
+                    "end",
+                    iid=manifest["name"],
+                    values=(
+                        manifest["created"].replace("T", " "),
+                        megabytes(manifest["size"]),
+                        len(manifest["chunks"]),
+                        megabytes(manifest["new_bytes"]),
+                    ),
+                )
+            if unreadable:
+                status_var.set(
+                    f"{len(unreadable)} older sets belong to other users"
+                    if self.lang == "EN"
+                    else f"{len(unreadable)} starszych zestawów należy do innych użytkowników"
+                )
+
+        def run_in_background(work, done):
+            for child in buttons.winfo_children():
+                child.config(state="disabled")
+            state = {"result": None, "error": None, "done": False}
+
+            def worker():
+                try:
+                    state["result"] = work()
+                except Exception as e:
+                    state["error"] = e
+                state["done"] = True
+
+            def poll():
+                if not state["done"]:
+                    win.after(200, poll)
+                    return
+                for child in buttons.winfo_children():
+                    child.config(state="normal")
+                if state["error"]:
+                    status_var.set("")
+                    messagebox.showerror(
+                        "Error" if self.lang == "EN" else "Błąd",
+                        str(state["error"]),
+                        parent=win,
+                    )
+                    return
+                done(state["result"])
+                reload()
+
+            threading.Thread(target=worker, daemon=True).start()
+            poll()
+
+        def backup_now():
+            save_store()
+            if not store.get("dir"):
+                browse()
+                if not store.get("dir"):
+                    return
+            self.flush_logs()
+            status_var.set(
+                "Backing up..." if self.lang == "EN" else "Tworzenie kopii..."
+            )
+            folder = store["dir"]
+            db_path = self.db_decrypted_path
+            retention = store.get("retention") or {}
+            keys = store_keys()
+
+            def work():
+                image = snapshot_database(db_path)
+                try:
+                    manifest = write_backup_set(folder, image, keys[0])
+                finally:
+                    remove_database_files(image)
+                return manifest, prune_backup_store(folder, keys, retention)
+
+            def done(result):
+                manifest, (sets, chunks, freed) = result
+                status_var.set(
+                    f"Stored {megabytes(manifest['new_bytes'])} of new data; "
+                    f"pruned {sets} sets, {megabytes(freed)}"
+                    if self.lang == "EN"
+                    else f"Zapisano {megabytes(manifest['new_bytes'])} nowych danych; "
+                    f"usunięto {sets} zestawów, {megabytes(freed)}"
+                )
+                self.log_action(
+                    self.user_id,
+                    f"backup set {manifest['name']} "
+                    f"({manifest['new_bytes']} new bytes)",
+                    "db_backup",
+                )
+
+            run_in_background(work, done)
+
+        def prune_now():
+            if not store.get("dir"):
+                return
+            folder = store["dir"]
+            retention = store.get("retention") or {}
+            keys = store_keys()
+
+            def done(result):
+                sets, chunks, freed = result
+                status_var.set(
+                    f"Pruned {sets} sets and {chunks} chunks ({megabytes(freed)})"
+                    if self.lang == "EN"
+                    else f"Usunięto {sets} zestawów i {chunks} fragmentów "
+                    f"({megabytes(freed)})"
+                )
+
+            run_in_background(lambda: prune_backup_store(folder, keys, retention), done)
+
+        def restore_selected():
+            selected = tree.selection()
+            if not selected:
+                return
+            name = selected[0]
+            created = tree.set(name, "created")
+            if not messagebox.askyesno(
+                "Restore" if self.lang == "EN" else "Przywracanie",
+                f"Replace the database with the backup from {created}?"
+                if self.lang == "EN"
+                else f"Zastąpić bazę kopią z {created}?",
+                parent=win,
+            ):
+                return
+            folder = store["dir"]
+            keys = store_keys()
+            self.restore_database(
+                os.path.join(folder, "manifests", name),
+                parent=win,
+                stage=lambda dest, key: restore_backup_set(folder, name, keys, dest),
+            )
+
+        tk.Button(
+            top, text="Browse..." if self.lang == "EN" else "Wybierz...", command=browse
+        ).grid(row=0, column=2)
+        ttk.Checkbutton(
+            top,
+            text="Back up daily when closing"
+            if self.lang == "EN"
+            else "Codzienna kopia przy zamykaniu",
+            variable=daily_var,
+            command=save_store,
+        ).grid(row=1, column=1, sticky="w", pady=(5, 0))
+        for text, command in (
+            (("Back up now", "Utwórz kopię"), backup_now),
+            (("Restore selected", "Przywróć wybraną"), restore_selected),
+            (("Prune", "Wyczyść stare"), prune_now),
+        ):
+            tk.Button(
+                buttons,
+                text=text[0] if self.lang == "EN" else text[1],
+                command=command,
+            ).pack(side="left", padx=5)
+        reload()
+
+    def write_daily_backup_set(self):
+        # Best effort at close: a missing USB stick must not keep the app open
+        store = self.settings.get("backup_store") or {}
+        if not (
+            self.conn
+            and self.user_key
+            and store.get("dir")
+            and store.get("daily_at_close")
+        ):
+            return
+        try:
+            keys = open_backup_store(self.conn, store["dir"], self.user_key)
+            manifests = read_backup_manifests(store["dir"], keys)[0]
+            if manifests:
+                age = datetime.datetime.now() - datetime.datetime.fromisoformat(
+                    manifests[0]["created"]
+                )
+                if age < datetime.timedelta(hours=BACKUP_SET_INTERVAL_HOURS):
+                    return
+            self.flush_logs()
+            image = snapshot_database(self.db_decrypted_path)
+            try:
+                manifest = write_backup_set(store["dir"], image, keys[0])
+            finally:
+                remove_database_files(image)
+            prune_backup_store(store["dir"], keys, store.get("retention") or {})
+        except Exception as e:
+            # Written by disconnect_db with the rest of the buffer
+            self.log_action(self.user_id, f"daily backup set failed: {e}", "db_backup")
+            return
+        self.log_action(
+            self.user_id,
+            f"backup set {manifest['name']} ({manifest['new_bytes']} new bytes)",
+            "db_backup",
+        )
+        self.flush_logs()
+
+    def open_consistency_report(self, parent=None):
+        win = tk.Toplevel(parent or self)
+        win.title("Consistency check" if self.lang == "EN" else "Spójność bazy")
+        win.geometry("700x450")
+        summary_var = tk.StringVar()
+        tk.Label(win, textvariable=summary_var, anchor="w", justify="left").pack(
+            fill="x", padx=10, pady=(10, 0)
+        )
+        columns = ("kind", "what", "rows")
+        tree = ttk.Treeview(win, columns=columns, show="headings")
+        for col, en, pl, width in (
+            ("kind", "Finding", "Problem", 150),
+            ("what", "Where", "Gdzie", 400),
+            ("rows", "Rows", "Wiersze", 80),
+        ):
+            tree.heading(col, text=en if self.lang == "EN" else pl)
+            tree.column(col, width=width, stretch=col == "what")
+        tree.pack(fill="both", expand=True, padx=10, pady=5)
+        buttons = tk.Frame(win)
+        buttons.pack(fill="x", padx=10, pady=(0, 10))
+        kinds = {
+            "integrity": ("Integrity", "Integralność"),
+            "orphans": ("Orphaned rows", "Osierocone wiersze"),
+            "unindexed": ("Unindexed key", "Klucz bez indeksu"),
+        }
+
+        def label(kind):
+            en, pl = kinds[kind]
+            return en if self.lang == "EN" else pl
+
+        def reload():
+            tree.delete(*tree.get_children())
+            report = consistency_report(self.conn)
+            if report is None:
+                summary_var.set(
+                    "No consistency pass has finished yet."
+                    if self.lang == "EN"
+                    else "Żadne sprawdzenie spójności nie zostało jeszcze ukończone."
+                )
+            else:
+                summary_var.set(
+                    f"Last pass: {report['started'].replace('T', ' ')} - "
+                    f"{report['at'].replace('T', ' ')}"
+                    if self.lang == "EN"
+                    else f"Ostatnie sprawdzenie: {report['started'].replace('T', ' ')} - "
+                    f"{report['at'].replace('T', ' ')}"
+                )
+                for problem in report["problems"]:
+                    tree.insert("", "end", values=(label("integrity"), problem, ""))
+                for name, count in report["orphans"].items():
+                    tree.insert(
+                        "", "end", iid=name, values=(label("orphans"), name, count)
+                    )
+            for table, column, parent_table in unindexed_foreign_keys(self.conn):
+                tree.insert(
+                    "",
+                    "end",
+                    values=(label("unindexed"), f"{table}.{column} -> {parent_table}", ""),
+                )
+
+        def check_now():
+            check_button.config(state="disabled")
+            win.config(cursor="watch")
+
+            def step():
+                if not win.winfo_exists():
+                    return
+                results = self.run_maintenance(["consistency_check"])
+                if results and results[0][1]["status"] == "partial":
+                    summary_var.set(
+                        f"Checking... {results[0][1]['detail']}"
+                        if self.lang == "EN"
+                        else f"Sprawdzanie... {results[0][1]['detail']}"
+                    )
+                    win.after(1, step)
+                    return
+                check_button.config(state="normal")
+                win.config(cursor="")
+                reload()
+
+            win.after(1, step)
+
+        def fix_selected():
+            selected = [item for item in tree.selection() if "." in item]
+            if not selected:
+                messagebox.showwarning(
+                    "Warning" if self.lang == "EN" else "Uwaga",
+                    "Select a row of orphans to fix."
+                    if self.lang == "EN"
+                    else "Wybierz wiersz z osieroconymi rekordami.",
+                    parent=win,
+                )
+                return
+            name = selected[0]
+            table, column = name.split(".", 1)
+            if (table, column) == ("borrowed_books", "book_id"):
+                how = (
+                    "Loans keep their history; each missing book is added back as a removed placeholder.",
+                    "Wypożyczenia zachowają historię; każda brakująca książka wróci jako usunięta.",
+                )
+            elif (table, column) == ("borrowed_books", "reader_id"):
+                how = (
+                    "Loans keep their history; each missing reader is added back as '(deleted reader)'.",
+                    "Wypożyczenia zachowają historię; każdy brakujący czytelnik wróci jako '(deleted reader)'.",
+                )
+            elif (table, column) == ("Books", "title_id"):
+                how = (
+                    "The copies join a '(missing title)' placeholder title.",
+                    "Egzemplarze dołączą do tytułu zastępczego '(missing title)'.",
+                )
+            else:
+                how = (
+                    f"The broken {column} values will be cleared.",
+                    f"Błędne wartości {column} zostaną wyczyszczone.",
+                )
+            if not messagebox.askyesno(
+                "Fix orphans" if self.lang == "EN" else "Napraw",
+                how[0] if self.lang == "EN" else how[1],
+                parent=win,
+            ):
+                return
+            try:
+                fixed = fix_orphans(self.conn, table, column)
+                self.conn.commit()
+            except sqlite3.Error as e:
+                self.conn.rollback()
+                messagebox.showerror(
+                    "Error" if self.lang == "EN" else "Błąd", str(e), parent=win
+                )
+                return
+            self.log_action(
+                self.user_id, f"{fixed} orphans of {name}", "orphans_fixed"
+            )
+            self.flush_logs()
+            reload()
+
+        for text, command in (
+            (("Check now", "Sprawdź teraz"), check_now),
+            (("Fix selected", "Napraw zaznaczone"), fix_selected),
+            (("Close", "Zamknij"), win.destroy),
+        ):
+            button = tk.Button(
+                buttons,
+                text=text[0] if self.lang == "EN" else text[1],
+                command=command,
+            )
+            button.pack(side="left", padx=5)
+            if command == check_now:
+                check_button = button
+        reload()
+
+    def restore_database(self, src, parent=None, stage=None):
+        live = self.db_decrypted_path
+        staged = live + ".restore"
+        previous = live + ".pre-restore"
+        remove_database_files(staged)
+        key = self.user_key
+        stage = stage or (lambda dest, key: stage_restore(src, dest, key))
+        problems = stage(staged, key) or validate_database_file(
+            staged, self.username
+        )
+        if problems:
+            remove_database_files(staged)
+            heading = (
+                "The backup was not restored:"
+                if self.lang == "EN"
+                else "Kopia nie została przywrócona:"
+            )
+            messagebox.showerror(
+                "Restore" if self.lang == "EN" else "Przywracanie",
+                "\n".join([heading] + problems),
+                parent=parent,
+            )
+            return False
+        self.disconnect_db(maintenance=False)
+        remove_database_files(previous)
+        if os.path.exists(live):
+            os.replace(live, previous)
+        os.replace(staged, live)
+        try:
+            self.load_or_create_encrypted_db()
+        except Exception as e:
+            if self.conn:
+                self.conn.close()
+                self.conn = None
+            remove_database_files(live)
+            if os.path.exists(previous):
+                os.replace(previous, live)
+            self.load_or_create_encrypted_db()
+            messagebox.showerror(
+                "Restore" if self.lang == "EN" else "Przywracanie",
+                f"The backup could not be opened, nothing was changed: {e}"
+                if self.lang == "EN"
+                else f"Nie udało się otworzyć kopii, nic nie zmieniono: {e}",
+                parent=parent,
+            )
+            return False
+        remove_database_files(previous)
+        # IDs may differ in the restored database
+        self.cursor.execute(
+            "SELECT id, is_admin FROM users WHERE username=?", (self.username,)
+        )
+        self.user_id, is_admin = self.cursor.fetchone()
+        self.is_admin = bool(is_admin)
+        self.log_action(self.user_id, src, "db_restored")
+        self.flush_logs()
+        self.create_main_menu()
+        messagebox.showinfo(
+            "Restore" if self.lang == "EN" else "Przywracanie",
+            "Database restored." if self.lang == "EN" else "Baza danych przywrócona.",
+        )
+        return True
+
     def close_db(self):
-        if self.conn:
-            self.conn.close()
-            self.conn = None
+        self.write_daily_backup_set()
+        self.disconnect_db()
         if (
             self.db_decrypted_path
             and self.db_encrypted_path
@@ -542,20 +3746,70 @@ class BookwormApp(tk.Tk):
         row = self.cursor.fetchone()
         return row[0] if row else None
 
-    def log_action(self, user_id, action):
-        import datetime
+    def log_action(self, user_id, detail, code="other", **refs):
+        # Buffered and written by flush_logs(); refs are the typed id columns
+        now = datetime.datetime.now().isoformat()
+        self.log_buffer.append(
+            (user_id, detail, now, code, *(refs.get(col) for col in LOG_REF_COLUMNS))
+        )
+        if len(self.log_buffer) >= LOG_FLUSH_SIZE:
+            self.flush_logs()
+        elif self.log_flush_job is None:
+            self.log_flush_job = self.after(LOG_FLUSH_INTERVAL_MS, self.flush_logs)
 
+    def log_actions(self, user_id, entries):
         now = datetime.datetime.now().isoformat()
-        self.cursor.execute(
-            "INSERT INTO logs (user_id, action, timestamp) VALUES (?, ?, ?)",
-            (user_id, action, now),
+        self.log_buffer.extend(
+            (user_id, detail, now, code, *(refs.get(col) for col in LOG_REF_COLUMNS))
+            for detail, code, refs in entries
         )
+        self.flush_logs()
+
+    def flush_logs(self):
+        # Writes buffered log rows and commits them with any pending changes
+        if self.log_flush_job is not None:
+            self.after_cancel(self.log_flush_job)
+            self.log_flush_job = None
+        if not self.conn:
+            return
+        if self.long_transaction:
+            self.log_flush_job = self.after(LOG_FLUSH_INTERVAL_MS, self.flush_logs)
+            return
+        if self.log_buffer:
+            self.cursor.executemany(
+                "INSERT INTO logs (user_id, action, timestamp, action_code, book_id, reader_id, loan_id, target_user_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                self.log_buffer,
+            )
+            self.log_buffer.clear()
         self.conn.commit()
 
+    def note_activity(self, event=None):
+        self.last_activity = time.monotonic()
+
+    def maintenance_tick(self):
+        self.after(MAINTENANCE_POLL_MS, self.maintenance_tick)
+        idle = time.monotonic() - self.last_activity
+        if self.conn and idle >= MAINTENANCE_IDLE_SECONDS:
+            self.run_maintenance()
+
+    def run_maintenance(self, names=None, at_close=False):
+        if self.long_transaction:
+            return []
+        self.flush_logs()
+        try:
+            return run_maintenance(
+                self.conn, maintenance_tasks(self.settings), names, at_close
+            )
+        except sqlite3.Error:
+            self.conn.rollback()
+            return []
+
     def logout(self):
         self.close_db()
         self.username = None
+        self.user_id = None
         self.password = None
+        self.user_key = None
         self.create_language_selection()
 
     def run_updater(self):
@@ -586,42 +3840,42 @@ class BookwormApp(tk.Tk):
                 self.lang = "EN"
         form = tk.Toplevel(self)
         form.title("Add New Book" if self.lang == "EN" else "Dodaj nową książkę")
-        form.geometry("460x390")
+        form.geometry("460x520")
         form.grab_set()
         labels = {
             "EN": [
-                "ID (0 may repeat)",
+                "ID (0 = next free)",
                 "Title",
                 "Author",
                 "Year",
                 "Genre",
                 "Status",
                 "Book Row",
+                "ISBN",
+                "Barcode",
             ],
             "PL": [
-                "ID (0 może się powtarzać)",
+                "ID (0 = następne wolne)",
                 "Tytuł",
                 "Autor",
                 "Rok",
                 "Gatunek",
                 "Status",
                 "Regał książkowy",
+                "ISBN",
+                "Kod kreskowy",
             ],
         }
-        status_options = {
-            "EN": ["borrowed", "available", "missing", "returned", "other"],
-            "PL": ["wypożyczona", "dostępna", "brak", "zwrócona", "inne"],
-        }
         entries = {}
         for i, text in enumerate(labels[self.lang]):
             lbl = tk.Label(form, text=text, anchor="w")
             lbl.grid(row=i, column=0, padx=10, pady=8, sticky="w")
             if text == "Status" or text == "Status":
                 cmb = ttk.Combobox(
-                    form, values=status_options[self.lang], state="readonly"
+                    form, values=BOOK_STATUS_OPTIONS[self.lang], state="readonly"
                 )
                 cmb.grid(row=i, column=1, padx=10, pady=8, sticky="ew")
-                cmb.current(1)  # Default to "available"
+                cmb.current(0)  # Default to "available"
                 entries[text] = cmb
             else:
                 ent = tk.Entry(form)
@@ -664,6 +3918,43 @@ class BookwormApp(tk.Tk):
         form.grid_columnconfigure(1, weight=1)
         form.after(100, lambda: entries[labels[self.lang][0]].focus_set())
 
+        def suggest_id():
+            # Next ID of this session's reserved block, else the next free one
+            next_id = None
+            if self.id_reservation:
+                next_id = next_reserved_book_id(self.conn, *self.id_reservation[1:])
+                if next_id is None:
+                    release_book_ids(self.conn, self.id_reservation[0])
+                    self.conn.commit()
+                    self.id_reservation = None
+            if next_id is None:
+                next_id = next_free_book_id(self.conn)
+            id_entry = entries[labels[self.lang][0]]
+            id_entry.delete(0, tk.END)
+            id_entry.insert(0, next_id)
+            text = ""
+            if self.id_reservation:
+                first_id, last_id = self.id_reservation[1:]
+                text = (
+                    f"Reserved IDs {first_id}-{last_id}"
+                    if self.lang == "EN"
+                    else f"Zarezerwowane ID {first_id}-{last_id}"
+                )
+            reservation_label.config(text=text)
+
+        def reserve_ids():
+            try:
+                count = int(reserve_count_var.get())
+                if count < 1:
+                    raise ValueError
+            except (tk.TclError, ValueError):
+                return
+            if self.id_reservation:
+                release_book_ids(self.conn, self.id_reservation[0])
+            self.id_reservation = reserve_book_ids(self.conn, count, self.user_id)
+            self.conn.commit()
+            suggest_id()
+
         def submit():
             try:
                 id_val = int(entries[labels[self.lang][0]].get())
@@ -677,14 +3968,7 @@ class BookwormApp(tk.Tk):
                     else "ID musi być liczbą >= 0",
                 )
                 return
-            existing_ids = self.get_existing_ids()
-            if id_val != 0 and id_val in existing_ids:
-                messagebox.showerror(
-                    "Error" if self.lang == "EN" else "Błąd",
-                    "ID already exists or input 0 which may repeat"
-                    if self.lang == "EN"
-                    else "ID już istnieje lub wpisz 0, który może się powtarzać",
-                )
+            if not self.check_book_id(id_val, parent=form):
                 return
             title = entries[labels[self.lang][1]].get().strip()
             if not title:
@@ -696,29 +3980,30 @@ class BookwormApp(tk.Tk):
             author = entries[labels[self.lang][2]].get().strip()
             year = entries[labels[self.lang][3]].get().strip()
             genre = entries[labels[self.lang][4]].get().strip()
-            status = entries[labels[self.lang][5]].get().strip()
+            status = entries[labels[self.lang][5]].get().strip().lower()
             # Ensure status is 'available' unless user explicitly chooses otherwise
-            if not status or status.lower() not in [
-                "available",
-                "dostępna",
-                "borrowed",
-                "wypożyczona",
-                "missing",
-                "brak",
-                "other",
-                "inne",
-            ]:
+            if not status or status not in BOOK_STATUSES:
                 status = "available"
             book_row = entries[labels[self.lang][6]].get().strip()
+            codes = self.read_book_codes(
+                entries[labels[self.lang][7]].get(),
+                entries[labels[self.lang][8]].get(),
+                id_val,
+                form,
+            )
+            if codes is None:
+                return
             try:
-                cur = self.conn.cursor()
-                # SQLite upsert workaround: Try insert, if fail update
-                cur.execute(
-                    "INSERT OR REPLACE INTO Books (ID, Title, Author, Year, Genre, Status, BookRow) VALUES (?, ?, ?, ?, ?, ?, ?)",
-                    (id_val, title, author, year, genre, status, book_row),
+                if id_val == 0:
+                    id_val = next_free_book_id(self.conn)
+                # A known ISBN or identical details add a copy of an existing title
+                add_copy(
+                    self.conn,
+                    (id_val, title, author, year, genre, status, book_row, *codes),
                 )
                 self.conn.commit()
             except Exception as e:
+                self.conn.rollback()
                 messagebox.showerror(
                     "Error" if self.lang == "EN" else "Błąd", f"Failed to add book: {e}"
                 )
@@ -728,8 +4013,17 @@ class BookwormApp(tk.Tk):
                 "Book added successfully."
                 if self.lang == "EN"
                 else "Książka dodana pomyślnie.",
+                parent=form,
             )
-            form.destroy()
+            if self.id_reservation:
+                # Bulk entry: keep the form open on the next reserved ID
+                for widget in entries.values():
+                    if not isinstance(widget, ttk.Combobox):
+                        widget.delete(0, tk.END)
+                suggest_id()
+                entries[labels[self.lang][1]].focus_set()
+            else:
+                form.destroy()
             # --- Refresh lending tab's books table if open ---
             # If open_reader_panel is open, call its load_readers_books to refresh tables
             for win in self.winfo_children():
@@ -758,7 +4052,8 @@ class BookwormApp(tk.Tk):
                                             ):
                                                 widget.delete(*widget.get_children())
                                                 self.cursor.execute(
-                                                    "SELECT ID, Title, Author, Year, Genre, Status FROM Books WHERE Status='available'"
+                                                    "SELECT ID, Title, Author, Year, Genre, Status FROM book_catalog WHERE "
+                                                    + " AND ".join(AVAILABLE_BOOKS_WHERE)
                                                 )
                                                 for row in self.cursor.fetchall():
                                                     widget.insert("", "end", values=row)
@@ -778,11 +4073,107 @@ class BookwormApp(tk.Tk):
         )
         submit_btn.bind("<Return>", lambda e: submit())
 
-    def get_existing_ids(self):
-        cur = self.conn.cursor()
-        cur.execute("SELECT ID FROM Books")
-        ids = [row[0] for row in cur.fetchall() if row[0] is not None]
-        return ids
+        reserve_frame = tk.Frame(form)
+        reserve_frame.grid(row=len(labels[self.lang]) + 1, column=0, columnspan=2)
+        reserve_count_var = tk.IntVar(value=50)
+        tk.Spinbox(
+            reserve_frame, from_=1, to=10000, textvariable=reserve_count_var, width=6
+        ).pack(side="left", padx=5)
+        tk.Button(
+            reserve_frame,
+            text="Reserve IDs" if self.lang == "EN" else "Zarezerwuj ID",
+            command=reserve_ids,
+        ).pack(side="left", padx=5)
+        reservation_label = tk.Label(reserve_frame, text="")
+        reservation_label.pack(side="left", padx=5)
+        suggest_id()
+
+    def read_book_codes(self, isbn_text, barcode_text, book_id, parent, title_id=None):
+        try:
+            isbn = normalize_isbn(isbn_text)
+        except ValueError:
+            messagebox.showerror(
+                "Error" if self.lang == "EN" else "Błąd",
+                "ISBN must be a valid ISBN-10 or ISBN-13"
+                if self.lang == "EN"
+                else "ISBN musi być poprawnym numerem ISBN-10 lub ISBN-13",
+                parent=parent,
+            )
+            return None
+        barcode = normalize_barcode(barcode_text)
+        owner = find_code_owner(
+            self.conn, isbn, barcode, exclude_id=book_id, title_id=title_id
+        )
+        if owner is not None:
+            messagebox.showerror(
+                "Error" if self.lang == "EN" else "Błąd",
+                f"ISBN or barcode already belongs to book ID {owner}"
+                if self.lang == "EN"
+                else f"ISBN lub kod kreskowy należy już do książki o ID {owner}",
+                parent=parent,
+            )
+            return None
+        return isbn, barcode
+
+    def check_book_id(self, id_val, current_id=None, parent=None):
+        if id_val == 0 or id_val == current_id:
+            return True
+        if book_id_exists(self.conn, id_val):
+            # Removed books keep their ID until they are purged
+            messagebox.showerror(
+                "Error" if self.lang == "EN" else "Błąd",
+                "ID already exists, possibly on a removed book not yet purged "
+                "(enter 0 for the next free ID)"
+                if self.lang == "EN"
+                else "ID już istnieje, być może przy usuniętej, jeszcze nieskasowanej "
+                "książce (wpisz 0, aby nadać następne wolne ID)",
+                parent=parent,
+            )
+            return False
+        reservation = book_id_reservation(self.conn, id_val)
+        if reservation is not None and (
+            not self.id_reservation or reservation != self.id_reservation[0]
+        ):
+            messagebox.showerror(
+                "Error" if self.lang == "EN" else "Błąd",
+                "This ID is reserved for another data-entry session"
+                if self.lang == "EN"
+                else "To ID jest zarezerwowane dla innej sesji wprowadzania",
+                parent=parent,
+            )
+            return False
+        return True
+
+    def attach_pager(self, tree, fetch_page, render_row=None):
+        state = {"token": None, "done": False, "busy": False}
+
+        def load_more():
+            if state["done"] or state["busy"]:
+                return
+            state["busy"] = True
+            try:
+                rows, token = fetch_page(state["token"])
+                for row in rows:
+                    tree.insert(
+                        "", "end", values=render_row(row) if render_row else row
+                    )
+                state["token"] = token
+                state["done"] = token is None
+            finally:
+                state["busy"] = False
+
+        def on_yscroll(first, last):
+            if float(last) >= 1.0 and not state["done"]:
+                tree.after_idle(load_more)
+
+        def reset():
+            tree.delete(*tree.get_children())
+            state["token"] = None
+            state["done"] = False
+            load_more()
+
+        tree.configure(yscrollcommand=on_yscroll)
+        return reset
 
     def entry_return_key(self, entries, label_list, current_index):
         next_index = current_index + 1
@@ -886,34 +4277,23 @@ class BookwormApp(tk.Tk):
         btn_frame.grid_columnconfigure(2, weight=1)
 
         def load_tree_data(filter_criteria=None, sort_by=None, ascending=True):
-            tree.delete(*tree.get_children())
+            where, params = books_filter_sql(filter_criteria)
+
+            def fetch_page(token):
+                return keyset_page(
+                    self.conn,
+                    "book_catalog",
+                    "ID, Title, Author, Year, Genre, Status",
+                    "ID",
+                    sort_col=sort_by,
+                    ascending=ascending,
+                    where=where,
+                    params=params,
+                    token=token,
+                )
+
             try:
-                cur = self.conn.cursor()
-                base_query = "SELECT ID, Title, Author, Year, Genre, Status FROM Books"
-                params = []
-                where_clauses = []
-                if filter_criteria:
-                    for key, val in filter_criteria.items():
-                        # For ID and Year exact match, others LIKE match insensitive
-                        if key in ("ID", "Year"):
-                            where_clauses.append(f"{key} = ?")
-                            params.append(val)
-                        else:
-                            where_clauses.append(f"{key} LIKE ?")
-                            params.append(f"%{val}%")
-                if where_clauses:
-                    base_query += " WHERE " + " AND ".join(where_clauses)
-                if sort_by:
-                    base_query += (
-                        f" ORDER BY {sort_by} {'ASC' if ascending else 'DESC'}"
-                    )
-                cur.execute(base_query, params)
-                rows = cur.fetchall()
-                for row in rows:
-                    vals = list(row)
-                    if len(vals) < 6:
-                        vals += [""] * (6 - len(vals))
-                    tree.insert("", "end", values=vals)
+                self.attach_pager(tree, fetch_page)()
             except Exception as e:
                 messagebox.showerror(
                     "Error" if self.lang == "EN" else "Błąd",
@@ -979,29 +4359,34 @@ class BookwormApp(tk.Tk):
             item = tree.item(selected[0])
             values = item["values"]
             book_id = values[0]
-            book_data = values[:6]
 
             confirmed = messagebox.askyesno(
                 "Confirm removal" if self.lang == "EN" else "Potwierdź usunięcie",
-                "Are you sure you want to remove the selected book?"
+                "Are you sure you want to remove the selected book?\n"
+                "Its barcode is freed at once; its ID stays taken until the "
+                "removed book is purged."
                 if self.lang == "EN"
-                else "Czy na pewno chcesz usunąć wybraną książkę?",
+                else "Czy na pewno chcesz usunąć wybraną książkę?\n"
+                "Jej kod kreskowy zostanie od razu zwolniony; ID pozostanie zajęte, "
+                "dopóki usunięta książka nie zostanie trwale skasowana.",
             )
             if not confirmed:
                 return
             try:
-                cur = self.conn.cursor()
-                # delete from Books
-                cur.execute("DELETE FROM Books WHERE ID = ?", (book_id,))
-                # add to RemovedBooks
-                cur.execute(
-                    """INSERT OR REPLACE INTO RemovedBooks
-                            (ID, Title, Author, Year, Genre, Status)
-                            VALUES (?, ?, ?, ?, ?, ?)""",
-                    tuple(book_data),
-                )
+                # Soft delete: the row stays (with its shelf and loans) until purged
+                soft_delete_book(self.conn, book_id)
                 self.conn.commit()
+            except LoanError:
+                messagebox.showerror(
+                    "Error" if self.lang == "EN" else "Błąd",
+                    "This book is on loan; return it or mark it lost before removing it."
+                    if self.lang == "EN"
+                    else "Ta książka jest wypożyczona; przyjmij zwrot lub oznacz ją jako "
+                    "zagubioną przed usunięciem.",
+                )
+                return
             except Exception as e:
+                self.conn.rollback()
                 messagebox.showerror(
                     "Error" if self.lang == "EN" else "Błąd",
                     f"Failed to remove book: {e}",
@@ -1016,6 +4401,9 @@ class BookwormApp(tk.Tk):
             tree.delete(selected[0])
             filter_tree()
 
+        def on_removed_list():
+            self.open_removed_books(top, on_restore=filter_tree)
+
         btn_edit = tk.Button(
             btn_frame,
             text="Edit Book" if self.lang == "EN" else "Edytuj książkę",
@@ -1040,6 +4428,130 @@ class BookwormApp(tk.Tk):
         )
         btn_remove.pack(side="left", padx=10)
 
+        def on_history():
+            selected = tree.selection()
+            if not selected:
+                messagebox.showwarning(
+                    "Warning" if self.lang == "EN" else "Uwaga",
+                    "Select a book first"
+                    if self.lang == "EN"
+                    else "Najpierw wybierz książkę",
+                )
+                return
+            values = tree.item(selected[0])["values"]
+            self.show_loan_history(top, book_id=values[0], subject=values[1])
+
+        tree.bind("<Double-1>", lambda e: on_history())
+
+        copies_label = tk.Label(top, text="", anchor="w")
+        copies_label.pack(fill="x", padx=5, before=btn_frame)
+
+        def selected_title_id():
+            selected = tree.selection()
+            if not selected:
+                return None, None
+            book_id = tree.item(selected[0])["values"][0]
+            cur = self.conn.cursor()
+            cur.execute("SELECT title_id FROM Books WHERE ID = ?", (book_id,))
+            row = cur.fetchone()
+            return book_id, row[0] if row else None
+
+        def on_select(event=None):
+            book_id, title_id = selected_title_id()
+            if title_id is None:
+                copies_label.config(text="")
+                return
+            copies, available = title_availability(self.conn, title_id)
+            copies_label.config(
+                text=f"Copies of this title: {copies}, available: {available}"
+                if self.lang == "EN"
+                else f"Egzemplarze tego tytułu: {copies}, dostępne: {available}"
+            )
+
+        tree.bind("<<TreeviewSelect>>", on_select)
+
+        def on_add_copy():
+            book_id, title_id = selected_title_id()
+            if book_id is None:
+                messagebox.showwarning(
+                    "Warning" if self.lang == "EN" else "Uwaga",
+                    "Select a book first"
+                    if self.lang == "EN"
+                    else "Najpierw wybierz książkę",
+                )
+                return
+            new_id = next_free_book_id(self.conn)
+            try:
+                self.conn.execute(
+                    "INSERT INTO Books (ID, title_id, Status, BookRow) "
+                    "SELECT ?, title_id, 'available', BookRow FROM Books WHERE ID = ?",
+                    (new_id, book_id),
+                )
+                self.conn.commit()
+            except Exception as e:
+                self.conn.rollback()
+                messagebox.showerror(
+                    "Error" if self.lang == "EN" else "Błąd",
+                    f"Failed to add copy: {e}"
+                    if self.lang == "EN"
+                    else f"Nie udało się dodać egzemplarza: {e}",
+                )
+                return
+            messagebox.showinfo(
+                "Success" if self.lang == "EN" else "Sukces",
+                f"Added a copy with ID {new_id}."
+                if self.lang == "EN"
+                else f"Dodano egzemplarz o ID {new_id}.",
+            )
+            filter_tree()
+
+        btn_add_copy = tk.Button(
+            btn_frame,
+            text="Add Copy" if self.lang == "EN" else "Dodaj egzemplarz",
+            bg=self.BTN_BG,
+            fg=self.BTN_FG,
+            activebackground=self.BTN_HOVER_BG,
+            activeforeground=self.BTN_HOVER_FG,
+            font=("Segoe UI", 11, "bold"),
+            command=on_add_copy,
+        )
+        btn_add_copy.pack(side="left", padx=10)
+        btn_history = tk.Button(
+            btn_frame,
+            text="Loan History" if self.lang == "EN" else "Historia wypożyczeń",
+            bg=self.BTN_BG,
+            fg=self.BTN_FG,
+            activebackground=self.BTN_HOVER_BG,
+            activeforeground=self.BTN_HOVER_FG,
+            font=("Segoe UI", 11, "bold"),
+            command=on_history,
+        )
+        btn_history.pack(side="left", padx=10)
+
+        btn_removed = tk.Button(
+            btn_frame,
+            text="Removed Books" if self.lang == "EN" else "Usunięte książki",
+            bg=self.BTN_BG,
+            fg=self.BTN_FG,
+            activebackground=self.BTN_HOVER_BG,
+            activeforeground=self.BTN_HOVER_FG,
+            font=("Segoe UI", 11, "bold"),
+            command=on_removed_list,
+        )
+        btn_removed.pack(side="left", padx=10)
+
+        btn_import = tk.Button(
+            btn_frame,
+            text="Import Books" if self.lang == "EN" else "Importuj książki",
+            bg=self.BTN_BG,
+            fg=self.BTN_FG,
+            activebackground=self.BTN_HOVER_BG,
+            activeforeground=self.BTN_HOVER_FG,
+            font=("Segoe UI", 11, "bold"),
+            command=lambda: self.import_books_dialog(parent=top, on_done=filter_tree),
+        )
+        btn_import.pack(side="left", padx=10)
+
         btn_close = tk.Button(
             btn_frame,
             text="Close" if self.lang == "EN" else "Zamknij",
@@ -1047,65 +4559,280 @@ class BookwormApp(tk.Tk):
         )
         btn_close.pack(side="bottom", fill="x", pady=(10, 0), padx=10)
 
-    def sort_by_column(self, tree, col):
-        ascending = self.sort_directions[col]
-        self.sort_directions[col] = not ascending
-        crit = {}
-        cleared_all = True
-        for key in self.search_vars:
-            val = self.search_vars[key].get().strip()
-            if val != "":
-                cleared_all = False
-                keys_map_pl_en = {
-                    "Szukaj po ID": "ID",
-                    "Szukaj po tytule": "Title",
-                    "Szukaj po autorze": "Author",
-                    "Szukaj po roku": "Year",
-                    "Szukaj po gatunku": "Genre",
-                    "Szukaj po statusie": "Status",
-                    "Search by ID": "ID",
-                    "Search by Title": "Title",
-                    "Search by Author": "Author",
-                    "Search by Year": "Year",
-                    "Search by Genre": "Genre",
-                    "Search by Status": "Status",
-                }
-                crit[keys_map_pl_en.get(key, key)] = val
-        filter_criteria = None if cleared_all else crit
-        tree.delete(*tree.get_children())
+    def sort_by_column(self, tree, col):
+        ascending = self.sort_directions.get(col, True)
+        self.sort_directions[col] = not ascending
+        crit = {}
+        cleared_all = True
+        for key in self.search_vars:
+            val = self.search_vars[key].get().strip()
+            if val != "":
+                cleared_all = False
+                keys_map_pl_en = {
+                    "Szukaj po ID": "ID",
+                    "Szukaj po tytule": "Title",
+                    "Szukaj po autorze": "Author",
+                    "Szukaj po roku": "Year",
+                    "Szukaj po gatunku": "Genre",
+                    "Szukaj po statusie": "Status",
+                    "Search by ID": "ID",
+                    "Search by Title": "Title",
+                    "Search by Author": "Author",
+                    "Search by Year": "Year",
+                    "Search by Genre": "Genre",
+                    "Search by Status": "Status",
+                }
+                crit[keys_map_pl_en.get(key, key)] = val
+        filter_criteria = None if cleared_all else crit
+        where, params = books_filter_sql(filter_criteria)
+
+        def fetch_page(token):
+            return keyset_page(
+                self.conn,
+                "book_catalog",
+                "ID, Title, Author, Year, Genre, Status",
+                "ID",
+                sort_col=None if col == "ID" else col,
+                ascending=ascending,
+                where=where,
+                params=params,
+                token=token,
+            )
+
+        try:
+            self.attach_pager(tree, fetch_page)()
+        except Exception as e:
+            messagebox.showerror(
+                "Error" if self.lang == "EN" else "Błąd", f"Failed to sort data: {e}"
+            )
+
+    def import_books_dialog(self, parent=None, on_done=None):
+        from tkinter import filedialog
+
+        path = filedialog.askopenfilename(
+            parent=parent,
+            title="Import books" if self.lang == "EN" else "Importuj książki",
+            filetypes=[
+                ("CSV / Excel", "*.csv *.xlsx"),
+                ("All Files", "*.*"),
+            ],
+        )
+        if not path:
+            return
+        try:
+            header = read_sheet_header(path)
+        except Exception as e:
+            messagebox.showerror(
+                "Error" if self.lang == "EN" else "Błąd",
+                f"Failed to read file: {e}"
+                if self.lang == "EN"
+                else f"Nie udało się odczytać pliku: {e}",
+                parent=parent,
+            )
+            return
+        guessed = guess_column_map(header)
+        skip = "(skip)" if self.lang == "EN" else "(pomiń)"
+        choices = [skip] + [f"{i + 1}: {h}" for i, h in enumerate(header)]
+        field_labels = {
+            "EN": ["ID", "Title", "Author", "Year", "Genre", "Status", "Book Row"],
+            "PL": ["ID", "Tytuł", "Autor", "Rok", "Gatunek", "Status", "Regał"],
+        }
+
+        win = tk.Toplevel(parent or self)
+        win.title("Import books" if self.lang == "EN" else "Importuj książki")
+        win.geometry("460x420")
+        win.grab_set()
+        mapping_vars = {}
+        for i, (field, label) in enumerate(
+            zip(IMPORT_HEADER_NAMES, field_labels[self.lang])
+        ):
+            tk.Label(win, text=label, anchor="w").grid(
+                row=i, column=0, padx=10, pady=4, sticky="w"
+            )
+            var = tk.StringVar(
+                value=choices[guessed[field] + 1] if field in guessed else skip
+            )
+            ttk.Combobox(
+                win, values=choices, state="readonly", textvariable=var
+            ).grid(row=i, column=1, padx=10, pady=4, sticky="ew")
+            mapping_vars[field] = var
+        status_var = tk.StringVar()
+        tk.Label(win, textvariable=status_var, anchor="w").grid(
+            row=8, column=0, columnspan=2, padx=10, pady=4, sticky="w"
+        )
+        progress_bar = ttk.Progressbar(win, mode="indeterminate")
+        progress_bar.grid(row=9, column=0, columnspan=2, padx=10, pady=4, sticky="ew")
+        rejects_list = tk.Listbox(win, height=5)
+        rejects_list.grid(row=10, column=0, columnspan=2, padx=10, pady=4, sticky="nsew")
+        win.grid_columnconfigure(1, weight=1)
+        win.grid_rowconfigure(10, weight=1)
+
+        def on_progress(processed, imported, new_rejects):
+            for line_no, reason in new_rejects:
+                rejects_list.insert("end", f"{line_no}: {reason}")
+            status_var.set(
+                f"Processed {processed}, imported {imported}, rejected {rejects_list.size()}"
+                if self.lang == "EN"
+                else f"Przetworzono {processed}, zaimportowano {imported}, odrzucono {rejects_list.size()}"
+            )
+            progress_bar.step(5)
+            win.update()
+
+        def run_import():
+            column_map = {}
+            for field, var in mapping_vars.items():
+                if var.get() != skip:
+                    column_map[field] = int(var.get().split(":", 1)[0]) - 1
+            if "Title" not in column_map:
+                messagebox.showerror(
+                    "Error" if self.lang == "EN" else "Błąd",
+                    "Title column must be mapped"
+                    if self.lang == "EN"
+                    else "Kolumna tytułu musi być przypisana",
+                    parent=win,
+                )
+                return
+            btn_start.config(state="disabled")
+            rejects_list.delete(0, "end")
+            self.long_transaction = True
+            try:
+                imported, rejects = import_books(
+                    self.conn, path, column_map, progress=on_progress
+                )
+            except Exception as e:
+                btn_start.config(state="normal")
+                messagebox.showerror(
+                    "Error" if self.lang == "EN" else "Błąd",
+                    f"Import failed, nothing was saved: {e}"
+                    if self.lang == "EN"
+                    else f"Import nieudany, nic nie zapisano: {e}",
+                    parent=win,
+                )
+                return
+            finally:
+                self.long_transaction = False
+            self.log_action(
+                self.user_id,
+                f"{imported} books from {os.path.basename(path)} ({len(rejects)} rejected)",
+                "books_imported",
+            )
+            self._show_info_popup(
+                "Import finished" if self.lang == "EN" else "Import zakończony",
+                f"Imported {imported} books, rejected {len(rejects)}."
+                if self.lang == "EN"
+                else f"Zaimportowano {imported} książek, odrzucono {len(rejects)}.",
+                parent=win,
+            )
+            if on_done:
+                on_done()
+
+        btn_start = tk.Button(
+            win,
+            text="Import" if self.lang == "EN" else "Importuj",
+            bg=self.BTN_BG,
+            fg=self.BTN_FG,
+            activebackground=self.BTN_HOVER_BG,
+            activeforeground=self.BTN_HOVER_FG,
+            font=("Segoe UI", 12, "bold"),
+            command=run_import,
+        )
+        btn_start.grid(row=7, column=0, columnspan=2, padx=10, pady=8, sticky="ew")
+
+    def offer_legacy_migration(self):
+        if not self.is_admin or not any(os.path.exists(p) for p in LEGACY_WORKBOOKS):
+            return
+        self.cursor.execute("SELECT 1 FROM Books LIMIT 1")
+        if self.cursor.fetchone():
+            return
+        if messagebox.askyesno(
+            "Old catalog found" if self.lang == "EN" else "Znaleziono stary katalog",
+            "Excel catalog files from an older Bookworm version were found. Import them into the database?"
+            if self.lang == "EN"
+            else "Znaleziono pliki katalogu Excel ze starszej wersji Bookworm. Zaimportować je do bazy danych?",
+        ):
+            self.migrate_legacy_dialog()
+
+    def migrate_legacy_dialog(self, parent=None):
+        found = [p for p in LEGACY_WORKBOOKS if os.path.exists(p)]
+        if not found:
+            messagebox.showinfo(
+                "Not Found" if self.lang == "EN" else "Nie znaleziono",
+                f"No {' / '.join(LEGACY_WORKBOOKS)} files found."
+                if self.lang == "EN"
+                else f"Nie znaleziono plików {' / '.join(LEGACY_WORKBOOKS)}.",
+                parent=parent,
+            )
+            return
+        win = tk.Toplevel(parent or self)
+        win.title("Excel migration" if self.lang == "EN" else "Migracja z Excela")
+        win.geometry("380x120")
+        win.grab_set()
+        status_var = tk.StringVar()
+        tk.Label(win, textvariable=status_var).pack(pady=10)
+        progress_bar = ttk.Progressbar(win, mode="indeterminate")
+        progress_bar.pack(fill="x", padx=10)
+
+        def on_progress(processed, summary):
+            status_var.set(
+                f"Processed {processed}, imported {summary['imported']}"
+                if self.lang == "EN"
+                else f"Przetworzono {processed}, zaimportowano {summary['imported']}"
+            )
+            progress_bar.step(5)
+            win.update()
+
+        self.long_transaction = True
         try:
-            cur = self.conn.cursor()
-            base_query = "SELECT ID, Title, Author, Year, Genre, Status FROM Books"
-            params = []
-            where_clauses = []
-            if filter_criteria:
-                for key, val in filter_criteria.items():
-                    if key in ("ID", "Year"):
-                        where_clauses.append(f"{key} = ?")
-                        params.append(val)
-                    else:
-                        where_clauses.append(f"{key} LIKE ?")
-                        params.append(f"%{val}%")
-            if where_clauses:
-                base_query += " WHERE " + " AND ".join(where_clauses)
-            if col:
-                base_query += f" ORDER BY {col} {'ASC' if ascending else 'DESC'}"
-            cur.execute(base_query, params)
-            rows = cur.fetchall()
-            for row in rows:
-                vals = list(row)
-                if len(vals) < 6:
-                    vals += [""] * (6 - len(vals))
-                tree.insert("", "end", values=vals)
+            summary = migrate_legacy_workbooks(self.conn, found, progress=on_progress)
         except Exception as e:
+            self.long_transaction = False
+            win.destroy()
             messagebox.showerror(
-                "Error" if self.lang == "EN" else "Błąd", f"Failed to sort data: {e}"
+                "Error" if self.lang == "EN" else "Błąd",
+                f"Migration failed: {e}"
+                if self.lang == "EN"
+                else f"Migracja nieudana: {e}",
+                parent=parent,
+            )
+            return
+        self.long_transaction = False
+        win.destroy()
+        self.log_action(
+            self.user_id,
+            f"{summary['imported']} books from {', '.join(found)}",
+            "books_migrated",
+        )
+        lines = [
+            f"Imported: {summary['imported']}"
+            if self.lang == "EN"
+            else f"Zaimportowano: {summary['imported']}",
+            f"Skipped duplicates: {summary['duplicates']}"
+            if self.lang == "EN"
+            else f"Pominięte duplikaty: {summary['duplicates']}",
+            f"Rejected rows: {len(summary['rejects'])}"
+            if self.lang == "EN"
+            else f"Odrzucone wiersze: {len(summary['rejects'])}",
+        ]
+        if summary["skipped"]:
+            lines.append(
+                f"Already migrated: {', '.join(summary['skipped'])}"
+                if self.lang == "EN"
+                else f"Już zmigrowane: {', '.join(summary['skipped'])}"
             )
+        for file_name, old_id, new_id in summary["reassigned"][:10]:
+            lines.append(f"{file_name}: ID {old_id} -> {new_id}")
+        if len(summary["reassigned"]) > 10:
+            lines.append(f"... (+{len(summary['reassigned']) - 10})")
+        messagebox.showinfo(
+            "Migration finished" if self.lang == "EN" else "Migracja zakończona",
+            "\n".join(lines),
+            parent=parent,
+        )
 
     def edit_book(self, book_id):
         cur = self.conn.cursor()
         cur.execute(
-            "SELECT ID, Title, Author, Year, Genre, Status, BookRow FROM Books WHERE ID = ?",
+            "SELECT ID, Title, Author, Year, Genre, Status, BookRow, ISBN, Barcode, title_id FROM book_catalog WHERE ID = ?",
             (book_id,),
         )
         row = cur.fetchone()
@@ -1123,26 +4850,36 @@ class BookwormApp(tk.Tk):
             "Genre": row[4],
             "Status": row[5],
             "BookRow": row[6] if len(row) > 6 else "",
+            "ISBN": row[7] or "",
+            "Barcode": row[8] or "",
+            "title_id": row[9],
         }
         form = tk.Toplevel(self)
         form.title("Edit Book" if self.lang == "EN" else "Edytuj książkę")
-        form.geometry("440x360")
+        form.geometry("440x440")
         form.grab_set()
         labels = {
-            "EN": ["ID (0 may repeat)", "Title", "Author", "Year", "Genre", "Status"],
+            "EN": [
+                "ID (0 = next free)",
+                "Title",
+                "Author",
+                "Year",
+                "Genre",
+                "Status",
+                "ISBN",
+                "Barcode",
+            ],
             "PL": [
-                "ID (0 może się powtarzać)",
+                "ID (0 = następne wolne)",
                 "Tytuł",
                 "Autor",
                 "Rok",
                 "Gatunek",
                 "Status",
+                "ISBN",
+                "Kod kreskowy",
             ],
         }
-        status_options = {
-            "EN": ["borrowed", "available", "missing", "other"],
-            "PL": ["wypożyczona", "dostępna", "brak", "inne"],
-        }
         entries = {}
         values_current = [
             current["ID"],
@@ -1151,23 +4888,23 @@ class BookwormApp(tk.Tk):
             current["Year"],
             current["Genre"],
             current["Status"],
+            current["ISBN"],
+            current["Barcode"],
         ]
         for i, text in enumerate(labels[self.lang]):
             lbl = tk.Label(form, text=text, anchor="w")
             lbl.grid(row=i, column=0, padx=10, pady=8, sticky="w")
             if text == "Status" or text == "Status":
                 cmb = ttk.Combobox(
-                    form, values=status_options[self.lang], state="readonly"
+                    form, values=BOOK_STATUS_OPTIONS[self.lang], state="readonly"
                 )
                 cmb.grid(row=i, column=1, padx=10, pady=8, sticky="ew")
-                try:
-                    cmb.current(
-                        status_options[self.lang].index(
-                            str(values_current[i]).casefold()
-                        )
-                    )
-                except Exception:
-                    cmb.current(1)  # default to "available"
+                # The EN and PL lists are parallel: either name selects the same entry
+                status = str(values_current[i]).casefold()
+                cmb.current(0)  # default to "available"
+                for options in BOOK_STATUS_OPTIONS.values():
+                    if status in options:
+                        cmb.current(options.index(status))
                 entries[text] = cmb
             else:
                 ent = tk.Entry(form)
@@ -1223,14 +4960,7 @@ class BookwormApp(tk.Tk):
                     else "ID musi być liczbą >= 0",
                 )
                 return
-            existing_ids = self.get_existing_ids()
-            if id_val != 0 and id_val in existing_ids and id_val != current["ID"]:
-                messagebox.showerror(
-                    "Error" if self.lang == "EN" else "Błąd",
-                    "ID already exists or input 0 which may repeat"
-                    if self.lang == "EN"
-                    else "ID już istnieje lub wpisz 0, który może się powtarzać",
-                )
+            if not self.check_book_id(id_val, current_id=current["ID"], parent=form):
                 return
             title = entries[labels[self.lang][1]].get().strip()
             if not title:
@@ -1242,17 +4972,33 @@ class BookwormApp(tk.Tk):
             author = entries[labels[self.lang][2]].get().strip()
             year = entries[labels[self.lang][3]].get().strip()
             genre = entries[labels[self.lang][4]].get().strip()
-            status = entries[labels[self.lang][5]].get().strip()
+            status = entries[labels[self.lang][5]].get().strip().lower()
+            codes = self.read_book_codes(
+                entries[labels[self.lang][6]].get(),
+                entries[labels[self.lang][7]].get(),
+                current["ID"],
+                form,
+                title_id=current["title_id"],
+            )
+            if codes is None:
+                return
             try:
                 cur = self.conn.cursor()
+                if id_val == 0:
+                    id_val = next_free_book_id(self.conn)
                 # Update by rowid primary key - we use ID as primary key but update by ID
                 cur.execute(
-                    """UPDATE Books SET ID=?, Title=?, Author=?, Year=?, Genre=?, Status=?
-                            WHERE ID=?""",
-                    (id_val, title, author, year, genre, status, current["ID"]),
+                    "UPDATE Books SET ID=?, Status=?, Barcode=? WHERE ID=?",
+                    (id_val, status, codes[1], current["ID"]),
+                )
+                # Bibliographic changes apply to every copy of the title
+                cur.execute(
+                    "UPDATE titles SET Title=?, Author=?, Year=?, Genre=?, ISBN=? WHERE id=?",
+                    (title, author, year, genre, codes[0], current["title_id"]),
                 )
                 self.conn.commit()
             except Exception as e:
+                self.conn.rollback()
                 messagebox.showerror(
                     "Error" if self.lang == "EN" else "Błąd",
                     f"Failed to update book: {e}",
@@ -1386,6 +5132,36 @@ class BookwormApp(tk.Tk):
             )
             self.grid_rowconfigure(next_row, weight=1)
             next_row += 1
+        if self.conn:
+            stats = read_stats(self.conn)
+            labels = {
+                "EN": [
+                    ("books_total", "Books"),
+                    ("books_available", "Available"),
+                    ("books_borrowed", "Borrowed"),
+                    ("books_lost", "Lost/missing"),
+                    ("readers_total", "Readers"),
+                    ("loans_active", "Active loans"),
+                ],
+                "PL": [
+                    ("books_total", "Książki"),
+                    ("books_available", "Dostępne"),
+                    ("books_borrowed", "Wypożyczone"),
+                    ("books_lost", "Zagubione/brak"),
+                    ("readers_total", "Czytelnicy"),
+                    ("loans_active", "Aktywne wypożyczenia"),
+                ],
+            }
+            dashboard = tk.Frame(self, relief="groove", bd=2)
+            dashboard.grid(row=98, column=0, columnspan=3, sticky="ew", padx=50, pady=7)
+            for j, (name, label) in enumerate(labels[lang]):
+                tk.Label(dashboard, text=label, font=("Arial", 9)).grid(
+                    row=0, column=j, padx=8
+                )
+                tk.Label(
+                    dashboard, text=str(stats.get(name, 0)), font=("Arial", 14, "bold")
+                ).grid(row=1, column=j, padx=8)
+                dashboard.grid_columnconfigure(j, weight=1)
         # Exit button at the bottom
         btn_exit = self.create_high_contrast_button(
             self, exit_option[lang], command=self.quit
@@ -1529,10 +5305,13 @@ class BookwormApp(tk.Tk):
                 )
                 return
             self.cursor.execute("UPDATE users SET is_admin=0 WHERE id=?", (user_id,))
-            self.conn.commit()
             self.log_action(
-                self.get_user_id(self.username), f"promoted user_id={user_id} to admin"
+                self.user_id,
+                None,
+                "user_demoted",
+                target_user_id=user_id,
             )
+            self.flush_logs()
             refresh_users()
 
         def delete_user():
@@ -1540,6 +5319,14 @@ class BookwormApp(tk.Tk):
             if not selected:
                 return
             user_id = user_tree.item(selected[0])["values"][0]
+            if user_id == self.user_id:
+                tk.messagebox.showwarning(
+                    "Warning" if self.lang == "EN" else "Ostrzeżenie",
+                    "You cannot delete your own account while logged in."
+                    if self.lang == "EN"
+                    else "Nie możesz usunąć własnego konta podczas zalogowania.",
+                )
+                return
             self.cursor.execute(
                 "SELECT is_superadmin FROM users WHERE id=?", (user_id,)
             )
@@ -1553,30 +5340,13 @@ class BookwormApp(tk.Tk):
                 )
                 return
             self.cursor.execute("DELETE FROM users WHERE id=?", (user_id,))
-            self.conn.commit()
-            self.log_action(
-                self.get_user_id(self.username), f"demoted user_id={user_id} from admin"
-            )
-            refresh_users()
-
-        def delete_user():
-            selected = user_tree.selection()
-            if not selected:
-                return
-            user_id = user_tree.item(selected[0])["values"][0]
-            if user_id == self.get_user_id(self.username):
-                tk.messagebox.showwarning(
-                    "Warning" if self.lang == "EN" else "Ostrzeżenie",
-                    "You cannot delete your own account while logged in."
-                    if self.lang == "EN"
-                    else "Nie możesz usunąć własnego konta podczas zalogowania.",
-                )
-                return
-            self.cursor.execute("DELETE FROM users WHERE id=?", (user_id,))
-            self.conn.commit()
             self.log_action(
-                self.get_user_id(self.username), f"deleted user_id={user_id}"
+                self.user_id,
+                None,
+                "user_deleted",
+                target_user_id=user_id,
             )
+            self.flush_logs()
             refresh_users()
 
         btn_frame = tk.Frame(user_frame)
@@ -1614,10 +5384,13 @@ class BookwormApp(tk.Tk):
                 self.cursor.execute(
                     "UPDATE users SET privileges=? WHERE id=?", (privs, user_id)
                 )
-                self.conn.commit()
                 self.log_action(
-                    self.get_user_id(self.username), f"granted db to user_id={user_id}"
+                    self.user_id,
+                    "db",
+                    "privilege_granted",
+                    target_user_id=user_id,
                 )
+                self.flush_logs()
             refresh_users()
 
         def revoke_db():
@@ -1631,10 +5404,13 @@ class BookwormApp(tk.Tk):
             self.cursor.execute(
                 "UPDATE users SET privileges=? WHERE id=?", (privs, user_id)
             )
-            self.conn.commit()
             self.log_action(
-                self.get_user_id(self.username), f"revoked db from user_id={user_id}"
+                self.user_id,
+                "db",
+                "privilege_revoked",
+                target_user_id=user_id,
             )
+            self.flush_logs()
             refresh_users()
 
         def grant_reader():
@@ -1649,11 +5425,13 @@ class BookwormApp(tk.Tk):
                 self.cursor.execute(
                     "UPDATE users SET privileges=? WHERE id=?", (privs, user_id)
                 )
-                self.conn.commit()
                 self.log_action(
-                    self.get_user_id(self.username),
-                    f"granted reader to user_id={user_id}",
+                    self.user_id,
+                    "reader",
+                    "privilege_granted",
+                    target_user_id=user_id,
                 )
+                self.flush_logs()
             refresh_users()
 
         def revoke_reader():
@@ -1667,11 +5445,13 @@ class BookwormApp(tk.Tk):
             self.cursor.execute(
                 "UPDATE users SET privileges=? WHERE id=?", (privs, user_id)
             )
-            self.conn.commit()
             self.log_action(
-                self.get_user_id(self.username),
-                f"revoked reader from user_id={user_id}",
+                self.user_id,
+                "reader",
+                "privilege_revoked",
+                target_user_id=user_id,
             )
+            self.flush_logs()
             refresh_users()
 
         tk.Button(
@@ -1711,46 +5491,529 @@ class BookwormApp(tk.Tk):
         )
 
         def backup_db():
-            import shutil
+            import threading
             from tkinter import filedialog
 
-            db_path = self.db_path if hasattr(self, "db_path") else "bookworm.db"
             dest = filedialog.asksaveasfilename(
-                defaultextension=".db", filetypes=[("Database Files", "*.db")]
+                parent=admin_win,
+                defaultextension=".enc",
+                initialfile=f"bookworm-{datetime.date.today().isoformat()}.db.enc",
+                filetypes=[
+                    (
+                        "Encrypted backup" if self.lang == "EN" else "Kopia szyfrowana",
+                        "*.enc",
+                    )
+                ],
             )
-            if dest:
-                shutil.copyfile(db_path, dest)
-                tk.messagebox.showinfo("Backup", "Database backup successful.")
+            if not dest:
+                return
+            self.flush_logs()
+            key = self.user_key
+            btn_backup.config(state="disabled")
+            backup_progress.config(value=0, maximum=1)
+            state = {"copied": 0, "total": 0, "size": 0, "done": False, "error": None}
+
+            def progress(status, remaining, total):
+                state["copied"] = total - remaining
+                state["total"] = total
+
+            def worker():
+                try:
+                    state["size"] = backup_database(
+                        self.db_decrypted_path, dest, key, progress
+                    )
+                except Exception as e:
+                    state["error"] = e
+                state["done"] = True
+
+            def poll():
+                # Polled from the main window, so closing this one does not stop it
+                alive = admin_win.winfo_exists()
+                if alive and state["total"]:
+                    backup_progress.config(
+                        maximum=state["total"], value=state["copied"]
+                    )
+                if not state["done"]:
+                    if alive:
+                        backup_status_var.set(
+                            f"{state['copied']}/{state['total']} pages copied"
+                            if self.lang == "EN"
+                            else f"Skopiowano {state['copied']}/{state['total']} stron"
+                        )
+                    self.after(100, poll)
+                    return
+                if alive:
+                    btn_backup.config(state="normal")
+                if state["error"]:
+                    if not alive:
+                        return
+                    backup_status_var.set("")
+                    messagebox.showerror(
+                        "Error" if self.lang == "EN" else "Błąd",
+                        f"Backup failed: {state['error']}"
+                        if self.lang == "EN"
+                        else f"Kopia zapasowa nieudana: {state['error']}",
+                        parent=admin_win,
+                    )
+                    return
+                if alive:
+                    backup_status_var.set(
+                        f"Backup written to {dest}"
+                        if self.lang == "EN"
+                        else f"Zapisano kopię: {dest}"
+                    )
+                self.log_action(
+                    self.user_id,
+                    f"database backed up to {dest} ({state['size']} bytes)",
+                    "db_backup",
+                )
+
+            threading.Thread(target=worker, daemon=True).start()
+            poll()
 
         def restore_db():
-            import shutil
             from tkinter import filedialog
 
-            src = filedialog.askopenfilename(filetypes=[("Database Files", "*.db")])
-            db_path = self.db_path if hasattr(self, "db_path") else "bookworm.db"
+            src = filedialog.askopenfilename(
+                parent=admin_win, filetypes=[("Database Files", "*.enc *.db")]
+            )
             if src:
-                shutil.copyfile(src, db_path)
-                tk.messagebox.showinfo(
-                    "Restore", "Database restored. Please restart the application."
-                )
+                self.restore_database(src, parent=admin_win)
 
-        tk.Button(
+        btn_backup = tk.Button(
             db_frame,
             text="Backup Database" if self.lang == "EN" else "Utwórz kopię zapasową",
             command=backup_db,
-        ).pack(pady=10)
+        )
+        btn_backup.pack(pady=(10, 0))
+        backup_progress = ttk.Progressbar(db_frame, mode="determinate", length=300)
+        backup_progress.pack(pady=2)
+        backup_status_var = tk.StringVar()
+        tk.Label(db_frame, textvariable=backup_status_var).pack()
+        tk.Button(
+            db_frame,
+            text="Backup sets..." if self.lang == "EN" else "Zestawy kopii...",
+            command=lambda: self.open_backup_sets(parent=admin_win),
+        ).pack(pady=(0, 10))
         tk.Button(
             db_frame,
             text="Restore Database" if self.lang == "EN" else "Przywróć bazę danych",
             command=restore_db,
         ).pack(pady=10)
 
+        tk.Button(
+            db_frame,
+            text="Import Excel catalog (v100-v310)"
+            if self.lang == "EN"
+            else "Importuj katalog Excel (v100-v310)",
+            command=lambda: self.migrate_legacy_dialog(parent=admin_win),
+        ).pack(pady=10)
+
+        # --- Export ---
+        export_frame = tk.LabelFrame(
+            db_frame, text="Export data" if self.lang == "EN" else "Eksport danych"
+        )
+        export_frame.pack(fill="x", padx=10, pady=10)
+        export_dataset_labels = {
+            "books": "Books" if self.lang == "EN" else "Książki",
+            "readers": "Readers" if self.lang == "EN" else "Czytelnicy",
+            "loans": "Loans" if self.lang == "EN" else "Wypożyczenia",
+            "logs": "Logs" if self.lang == "EN" else "Dziennik zdarzeń",
+        }
+        export_dataset_var = tk.StringVar(value=export_dataset_labels["books"])
+        ttk.Combobox(
+            export_frame,
+            values=list(export_dataset_labels.values()),
+            state="readonly",
+            textvariable=export_dataset_var,
+            width=18,
+        ).grid(row=0, column=0, padx=5, pady=5)
+        export_format_var = tk.StringVar(value="csv")
+        ttk.Combobox(
+            export_frame,
+            values=["csv", "jsonl", "xlsx"],
+            state="readonly",
+            textvariable=export_format_var,
+            width=8,
+        ).grid(row=0, column=1, padx=5, pady=5)
+        export_progress = ttk.Progressbar(export_frame, mode="determinate")
+        export_progress.grid(row=1, column=0, columnspan=3, padx=5, pady=5, sticky="ew")
+        export_status_var = tk.StringVar()
+        tk.Label(export_frame, textvariable=export_status_var, anchor="w").grid(
+            row=2, column=0, columnspan=3, padx=5, sticky="w"
+        )
+        export_frame.grid_columnconfigure(2, weight=1)
+
+        def export_data():
+            import threading
+            from tkinter import filedialog
+
+            dataset = next(
+                key
+                for key, label in export_dataset_labels.items()
+                if label == export_dataset_var.get()
+            )
+            fmt = export_format_var.get()
+            dest = filedialog.asksaveasfilename(
+                parent=admin_win,
+                defaultextension=f".{fmt}",
+                initialfile=f"{dataset}.{fmt}",
+                filetypes=[(fmt.upper(), f"*.{fmt}")],
+            )
+            if not dest:
+                return
+            self.flush_logs()
+            export_progress.config(maximum=1, value=0)
+            btn_export.config(state="disabled")
+            state = {"written": 0, "total": None, "done": False, "error": None}
+
+            def progress(written):
+                state["written"] = written
+
+            def on_total(total):
+                state["total"] = total
+
+            def worker():
+                try:
+                    export_dataset(
+                        self.db_decrypted_path, dataset, dest, fmt, progress, on_total
+                    )
+                except Exception as e:
+                    state["error"] = e
+                state["done"] = True
+
+            def poll():
+                # Scheduled on the main window, which outlives this one
+                alive = admin_win.winfo_exists()
+                if alive:
+                    if state["total"] is not None:
+                        export_progress.config(maximum=max(state["total"], 1))
+                    export_progress.config(value=state["written"])
+                    export_status_var.set(
+                        f"{state['written']} rows written"
+                        if self.lang == "EN"
+                        else f"Zapisano {state['written']} wierszy"
+                    )
+                if not state["done"]:
+                    self.after(200, poll)
+                    return
+                if alive:
+                    btn_export.config(state="normal")
+                if state["error"]:
+                    if not alive:
+                        return
+                    messagebox.showerror(
+                        "Error" if self.lang == "EN" else "Błąd",
+                        f"Export failed: {state['error']}"
+                        if self.lang == "EN"
+                        else f"Eksport nieudany: {state['error']}",
+                        parent=admin_win,
+                    )
+                    return
+                self.log_action(
+                    self.user_id,
+                    f"{dataset} ({state['written']} rows) to {fmt}",
+                    "data_exported",
+                )
+
+            threading.Thread(target=worker, daemon=True).start()
+            poll()
+
+        btn_export = tk.Button(
+            export_frame,
+            text="Export" if self.lang == "EN" else "Eksportuj",
+            command=export_data,
+        )
+        btn_export.grid(row=0, column=2, padx=5, pady=5, sticky="w")
+
+        # --- Storage profile ---
+        storage_frame = tk.LabelFrame(
+            db_frame,
+            text="Storage profile" if self.lang == "EN" else "Profil przechowywania",
+        )
+        storage_frame.pack(fill="x", padx=10, pady=10)
+        profiles = storage_profiles(self.settings)
+        storage_profile_var = tk.StringVar(
+            value=self.settings.get("storage_profile", "desktop")
+            if self.settings.get("storage_profile") in profiles
+            else "desktop"
+        )
+        ttk.Combobox(
+            storage_frame,
+            values=list(profiles),
+            state="readonly",
+            textvariable=storage_profile_var,
+            width=18,
+        ).grid(row=0, column=0, padx=5, pady=5)
+        storage_status_var = tk.StringVar()
+        tk.Label(
+            storage_frame,
+            textvariable=storage_status_var,
+            anchor="w",
+            justify="left",
+            font=("Consolas", 9),
+        ).grid(row=1, column=0, columnspan=4, padx=5, sticky="w")
+        storage_frame.grid_columnconfigure(3, weight=1)
+
+        def apply_profile():
+            name = storage_profile_var.get()
+            self.flush_logs()
+            self.conn.commit()
+            # page_size stays as the file was created; the rest applies now
+            apply_storage_profile(self.conn, profiles[name])
+            self.settings["storage_profile"] = name
+            self.save_settings(self.settings)
+            storage_status_var.set(
+                f"Using the {name} profile."
+                if self.lang == "EN"
+                else f"Używany profil: {name}."
+            )
+            self.log_action(
+                self.user_id, name, "storage_changed"
+            )
+
+        def run_benchmark():
+            import threading
+
+            directory = os.path.dirname(os.path.abspath(self.db_decrypted_path))
+            btn_apply_profile.config(state="disabled")
+            btn_benchmark.config(state="disabled")
+            state = {"current": None, "result": None, "error": None, "done": False}
+
+            def progress(name):
+                state["current"] = name
+
+            def worker():
+                try:
+                    state["result"] = benchmark_storage_profiles(
+                        profiles, directory, progress
+                    )
+                except Exception as e:
+                    state["error"] = e
+                state["done"] = True
+
+            def poll():
+                if not state["done"]:
+                    if state["current"]:
+                        storage_status_var.set(
+                            f"Benchmarking {state['current']}..."
+                            if self.lang == "EN"
+                            else f"Test profilu {state['current']}..."
+                        )
+                    admin_win.after(200, poll)
+                    return
+                btn_apply_profile.config(state="normal")
+                btn_benchmark.config(state="normal")
+                if state["error"]:
+                    storage_status_var.set("")
+                    messagebox.showerror(
+                        "Error" if self.lang == "EN" else "Błąd",
+                        f"Benchmark failed: {state['error']}"
+                        if self.lang == "EN"
+                        else f"Test nieudany: {state['error']}",
+                        parent=admin_win,
+                    )
+                    return
+                results, best = state["result"]
+                lines = [
+                    f"{'':<14}{'load':>8}{'read':>8}{'write':>8}"
+                    if self.lang == "EN"
+                    else f"{'':<14}{'import':>8}{'odczyt':>8}{'zapis':>8}"
+                ]
+                for name, timings in results:
+                    lines.append(
+                        f"{name:<14}"
+                        + "".join(
+                            f"{timings[phase]:>7.2f}s"
+                            for phase in ("load", "read", "write")
+                        )
+                    )
+                lines.append(
+                    f"Recommended: {best}" if self.lang == "EN" else f"Zalecany: {best}"
+                )
+                storage_status_var.set("\n".join(lines))
+                storage_profile_var.set(best)
+
+            threading.Thread(target=worker, daemon=True).start()
+            poll()
+
+        btn_apply_profile = tk.Button(
+            storage_frame,
+            text="Apply" if self.lang == "EN" else "Zastosuj",
+            command=apply_profile,
+        )
+        btn_apply_profile.grid(row=0, column=1, padx=5, pady=5, sticky="w")
+        btn_benchmark = tk.Button(
+            storage_frame,
+            text="Run benchmark" if self.lang == "EN" else "Uruchom test",
+            command=run_benchmark,
+        )
+        btn_benchmark.grid(row=0, column=2, padx=5, pady=5, sticky="w")
+
+        # --- Maintenance ---
+        maintenance_frame = tk.LabelFrame(
+            db_frame, text="Maintenance" if self.lang == "EN" else "Konserwacja"
+        )
+        maintenance_frame.pack(fill="x", padx=10, pady=10)
+        maintenance_columns = ("task", "at", "status", "seconds", "detail")
+        maintenance_tree = ttk.Treeview(
+            maintenance_frame,
+            columns=maintenance_columns,
+            show="headings",
+            height=len(MAINTENANCE_TASKS),
+        )
+        for col, en, pl, width in (
+            ("task", "Task", "Zadanie", 130),
+            ("at", "Last run", "Ostatnio", 140),
+            ("status", "Result", "Wynik", 90),
+            ("seconds", "Time (s)", "Czas (s)", 70),
+            ("detail", "Details", "Szczegóły", 260),
+        ):
+            maintenance_tree.heading(col, text=en if self.lang == "EN" else pl)
+            maintenance_tree.column(col, width=width, stretch=col == "detail")
+        maintenance_tree.grid(
+            row=0, column=0, columnspan=2, padx=5, pady=5, sticky="ew"
+        )
+        maintenance_frame.grid_columnconfigure(0, weight=1)
+        maintenance_status_labels = {
+            "ok": ("OK", "OK"),
+            "failed": ("FAILED", "BŁĄD"),
+            "interrupted": ("Over budget", "Przerwane"),
+            "skipped": ("Skipped", "Pominięte"),
+            "partial": ("In progress", "W toku"),
+            "error": ("Error", "Błąd"),
+        }
+
+        def load_maintenance():
+            maintenance_tree.delete(*maintenance_tree.get_children())
+            results = maintenance_results(self.conn)
+            for task in MAINTENANCE_TASKS:
+                record = results.get(task)
+                if record is None:
+                    maintenance_tree.insert("", "end", values=(task, "-", "", "", ""))
+                    continue
+                en, pl = maintenance_status_labels.get(
+                    record["status"], (record["status"],) * 2
+                )
+                maintenance_tree.insert(
+                    "",
+                    "end",
+                    values=(
+                        task,
+                        record["at"].replace("T", " "),
+                        en if self.lang == "EN" else pl,
+                        record["seconds"],
+                        record["detail"],
+                    ),
+                )
+
+        def run_maintenance_now():
+            pending = list(MAINTENANCE_TASKS)
+            skipped = {}
+            run_button.config(state="disabled")
+            admin_win.config(cursor="watch")
+
+            def step():
+                if not admin_win.winfo_exists():
+                    return
+                if pending:
+                    for task, record in self.run_maintenance([pending.pop(0)]):
+                        if record["status"] == "skipped":
+                            skipped[task] = record["detail"]
+                    admin_win.after(1, step)
+                else:
+                    run_button.config(state="normal")
+                    admin_win.config(cursor="")
+                load_maintenance()
+                # A skipped task keeps its stored row; show why it was skipped
+                for item in maintenance_tree.get_children():
+                    task = maintenance_tree.set(item, "task")
+                    if task in skipped:
+                        maintenance_tree.set(item, "detail", skipped[task])
+
+            admin_win.after(1, step)
+
+        run_button = tk.Button(
+            maintenance_frame,
+            text="Run now" if self.lang == "EN" else "Uruchom teraz",
+            command=run_maintenance_now,
+        )
+        run_button.grid(row=1, column=0, padx=5, pady=5, sticky="w")
+        tk.Button(
+            maintenance_frame,
+            text="Consistency..." if self.lang == "EN" else "Spójność...",
+            command=lambda: self.open_consistency_report(admin_win),
+        ).grid(row=1, column=1, padx=5, pady=5, sticky="w")
+        load_maintenance()
+
         # --- Logs Tab ---
         logs_frame = tk.Frame(notebook)
         notebook.add(
             logs_frame, text="Logs" if self.lang == "EN" else "Dziennik zdarzeń"
         )
 
+        logs_filter_frame = tk.Frame(logs_frame)
+        logs_filter_frame.pack(fill="x", padx=10, pady=(10, 0))
+        any_label = "(any)" if self.lang == "EN" else "(dowolny)"
+        log_user_var = tk.StringVar(value=any_label)
+        log_kind_var = tk.StringVar(value=any_label)
+        log_start_var = tk.StringVar()
+        log_end_var = tk.StringVar()
+        log_kind_labels = {
+            (en if self.lang == "EN" else pl): prefix
+            for prefix, (en, pl) in LOG_ACTION_KINDS.items()
+        }
+        tk.Label(
+            logs_filter_frame, text="User:" if self.lang == "EN" else "Użytkownik:"
+        ).grid(row=0, column=0, sticky="w")
+        log_user_cb = ttk.Combobox(
+            logs_filter_frame, textvariable=log_user_var, state="readonly", width=14
+        )
+        log_user_cb.grid(row=0, column=1, padx=(0, 10))
+        tk.Label(
+            logs_filter_frame, text="Action:" if self.lang == "EN" else "Akcja:"
+        ).grid(row=0, column=2, sticky="w")
+        ttk.Combobox(
+            logs_filter_frame,
+            textvariable=log_kind_var,
+            values=[any_label] + list(log_kind_labels),
+            state="readonly",
+            width=20,
+        ).grid(row=0, column=3, padx=(0, 10))
+        tk.Label(
+            logs_filter_frame,
+            text="From (YYYY-MM-DD):" if self.lang == "EN" else "Od (RRRR-MM-DD):",
+        ).grid(row=1, column=0, sticky="w")
+        tk.Entry(logs_filter_frame, textvariable=log_start_var, width=14).grid(
+            row=1, column=1, padx=(0, 10)
+        )
+        tk.Label(
+            logs_filter_frame,
+            text="To (YYYY-MM-DD):" if self.lang == "EN" else "Do (RRRR-MM-DD):",
+        ).grid(row=1, column=2, sticky="w")
+        tk.Entry(logs_filter_frame, textvariable=log_end_var, width=14).grid(
+            row=1, column=3, padx=(0, 10), sticky="w"
+        )
+        log_book_var = tk.StringVar()
+        log_reader_var = tk.StringVar()
+        tk.Label(
+            logs_filter_frame, text="Book ID:" if self.lang == "EN" else "ID książki:"
+        ).grid(row=2, column=0, sticky="w")
+        tk.Entry(logs_filter_frame, textvariable=log_book_var, width=14).grid(
+            row=2, column=1, padx=(0, 10)
+        )
+        tk.Label(
+            logs_filter_frame,
+            text="Reader ID:" if self.lang == "EN" else "ID czytelnika:",
+        ).grid(row=2, column=2, sticky="w")
+        tk.Entry(logs_filter_frame, textvariable=log_reader_var, width=14).grid(
+            row=2, column=3, padx=(0, 10), sticky="w"
+        )
+        logs_count_var = tk.StringVar()
+        tk.Label(logs_filter_frame, textvariable=logs_count_var).grid(
+            row=1, column=5, padx=10, sticky="w"
+        )
+
         logs_tree = ttk.Treeview(
             logs_frame,
             columns=("id", "user_id", "action", "timestamp"),
@@ -1761,21 +6024,127 @@ class BookwormApp(tk.Tk):
         logs_tree.heading("action", text="Action")
         logs_tree.heading("timestamp", text="Timestamp")
         logs_tree.pack(fill="both", expand=True, padx=10, pady=10)
+        log_user_ids = {}
+
+        def load_log_users():
+            log_user_ids.clear()
+            self.cursor.execute("SELECT id, username FROM users ORDER BY username")
+            for user_id, username in self.cursor.fetchall():
+                log_user_ids[username] = user_id
+            log_user_cb.config(values=[any_label] + list(log_user_ids))
 
         def refresh_logs():
-            for row in logs_tree.get_children():
-                logs_tree.delete(row)
-            self.cursor.execute(
-                "SELECT id, user_id, action, timestamp FROM logs ORDER BY id DESC"
+            self.flush_logs()
+            start = log_start_var.get().strip()
+            end = log_end_var.get().strip()
+            try:
+                for value in (start, end):
+                    if value:
+                        datetime.date.fromisoformat(value)
+            except ValueError:
+                messagebox.showerror(
+                    "Error" if self.lang == "EN" else "Błąd",
+                    "Dates must be YYYY-MM-DD"
+                    if self.lang == "EN"
+                    else "Daty muszą mieć format RRRR-MM-DD",
+                    parent=admin_win,
+                )
+                return
+            try:
+                book_ref = int(log_book_var.get()) if log_book_var.get().strip() else None
+                reader_ref = (
+                    int(log_reader_var.get()) if log_reader_var.get().strip() else None
+                )
+            except ValueError:
+                messagebox.showerror(
+                    "Error" if self.lang == "EN" else "Błąd",
+                    "IDs must be numbers" if self.lang == "EN" else "ID muszą być liczbami",
+                    parent=admin_win,
+                )
+                return
+            where, params = logs_filter_sql(
+                user_id=log_user_ids.get(log_user_var.get()),
+                kind=log_kind_labels.get(log_kind_var.get()),
+                start=start or None,
+                end=f"{end}T23:59:59.999999" if end else None,
+                book_id=book_ref,
+                reader_id=reader_ref,
+            )
+            count_query = "SELECT COUNT(*) FROM logs"
+            if where:
+                count_query += " WHERE " + " AND ".join(where)
+            self.cursor.execute(count_query, params)
+            total = self.cursor.fetchone()[0]
+            logs_count_var.set(
+                f"{total} entries" if self.lang == "EN" else f"{total} wpisów"
+            )
+            self.attach_pager(
+                logs_tree,
+                lambda token: keyset_page(
+                    self.conn,
+                    "logs",
+                    "id, user_id, action, timestamp, action_code, "
+                    + ", ".join(LOG_REF_COLUMNS),
+                    "id",
+                    ascending=False,
+                    where=where,
+                    params=params,
+                    token=token,
+                ),
+                render_row=lambda row: render_log_row(row)[:4],
+            )()
+
+        def clear_log_filters():
+            log_user_var.set(any_label)
+            log_kind_var.set(any_label)
+            log_start_var.set("")
+            log_end_var.set("")
+            log_book_var.set("")
+            log_reader_var.set("")
+            refresh_logs()
+
+        tk.Button(
+            logs_filter_frame,
+            text="Filter" if self.lang == "EN" else "Filtruj",
+            command=refresh_logs,
+        ).grid(row=0, column=4, padx=5)
+        tk.Button(
+            logs_filter_frame,
+            text="Clear" if self.lang == "EN" else "Wyczyść",
+            command=clear_log_filters,
+        ).grid(row=1, column=4, padx=5)
+        load_log_users()
+
+        def archive_logs_now():
+            moved = self.apply_log_retention(parent=admin_win)
+            if moved is None:
+                return
+            self._show_info_popup(
+                "Logs archived" if self.lang == "EN" else "Zarchiwizowano dziennik",
+                f"{moved} log entries moved to the archive."
+                if self.lang == "EN"
+                else f"Przeniesiono {moved} wpisów do archiwum.",
+                parent=admin_win,
             )
-            for row in self.cursor.fetchall():
-                logs_tree.insert("", "end", values=row)
+            refresh_logs()
 
+        logs_btn_frame = tk.Frame(logs_frame)
+        logs_btn_frame.pack(pady=5)
         tk.Button(
-            logs_frame,
+            logs_btn_frame,
             text="Refresh Logs" if self.lang == "EN" else "Odśwież dziennik",
             command=refresh_logs,
-        ).pack(pady=5)
+        ).pack(side="left", padx=5)
+        tk.Button(
+            logs_btn_frame,
+            text="Archive Old Logs" if self.lang == "EN" else "Archiwizuj stare wpisy",
+            command=archive_logs_now,
+        ).pack(side="left", padx=5)
+        tk.Button(
+            logs_btn_frame,
+            text="Search Archive" if self.lang == "EN" else "Przeszukaj archiwum",
+            command=lambda: self.open_log_archive(parent=admin_win),
+        ).pack(side="left", padx=5)
         refresh_logs()
 
         # --- Close Button ---
@@ -1785,6 +6154,271 @@ class BookwormApp(tk.Tk):
             command=admin_win.destroy,
         ).pack(side="bottom", pady=8)
 
+    def log_archive_folder(self):
+        folder = log_archive_folder(self.db_decrypted_path)
+        legacy = os.path.abspath(LOG_ARCHIVE_FOLDER)
+        if not os.path.exists(folder) and os.path.exists(
+            os.path.join(legacy, LOG_ARCHIVE_INDEX)
+        ):
+            import shutil
+            from cryptography.fernet import Fernet
+
+            fernet = Fernet(get_log_archive_key(self.conn))
+            try:
+                claim_log_archive(
+                    self.conn, legacy, load_log_archive_index(legacy), fernet
+                )
+                shutil.move(legacy, folder)
+            except (OSError, ValueError):
+                pass
+        return folder
+
+    def apply_log_retention(self, parent=None, quiet=False):
+        days = self.settings.get("log_retention_days", 365)
+        if not days:
+            return 0
+        self.flush_logs()
+        try:
+            return archive_old_logs(self.conn, int(days), self.log_archive_folder())
+        except Exception as e:
+            if not quiet:
+                messagebox.showerror(
+                    "Error" if self.lang == "EN" else "Błąd",
+                    f"Failed to archive logs: {e}"
+                    if self.lang == "EN"
+                    else f"Nie udało się zarchiwizować dziennika: {e}",
+                    parent=parent,
+                )
+            return None
+
+    def open_removed_books(self, parent=None, on_restore=None):
+        win = tk.Toplevel(parent or self)
+        win.title("Removed Books" if self.lang == "EN" else "Usunięte książki")
+        win.geometry("820x420")
+        columns = ("ID", "Title", "Author", "Year", "BookRow", "deleted_at")
+        if self.lang == "EN":
+            headings = ["ID", "Title", "Author", "Year", "Book Row", "Removed"]
+        else:
+            headings = [
+                "ID",
+                "Tytuł",
+                "Autor",
+                "Rok",
+                "Regał książkowy",
+                "Usunięto",
+            ]
+        removed_tree = ttk.Treeview(win, columns=columns, show="headings")
+        for col, heading in zip(columns, headings):
+            removed_tree.heading(col, text=heading)
+            removed_tree.column(col, width=200 if col == "Title" else 110)
+        removed_tree.pack(fill="both", expand=True, padx=10, pady=10)
+        reload = self.attach_pager(
+            removed_tree,
+            lambda token: keyset_page(
+                self.conn,
+                "book_catalog",
+                "ID, Title, Author, Year, BookRow, deleted_at",
+                "ID",
+                sort_col="deleted_at",
+                ascending=False,
+                where=["deleted_at IS NOT NULL"],
+                token=token,
+            ),
+        )
+
+        def restore():
+            selected = removed_tree.selection()
+            if not selected:
+                return
+            for item in selected:
+                restore_book(self.conn, removed_tree.item(item)["values"][0])
+            self.conn.commit()
+            for item in selected:
+                removed_tree.delete(item)
+            if on_restore:
+                on_restore()
+
+        tk.Button(
+            win,
+            text="Restore Selected" if self.lang == "EN" else "Przywróć zaznaczone",
+            command=restore,
+        ).pack(side="left", padx=10, pady=8)
+        tk.Button(
+            win,
+            text="Close" if self.lang == "EN" else "Zamknij",
+            command=win.destroy,
+        ).pack(side="right", padx=10, pady=8)
+        reload()
+
+    def purge_removed_books(self):
+        days = self.settings.get("deleted_book_retention_days", 365)
+        if not days:
+            return 0
+        try:
+            return purge_deleted_books(self.conn, int(days))
+        except sqlite3.Error:
+            self.conn.rollback()
+            return None
+
+    def show_loan_history(self, parent, reader_id=None, book_id=None, subject=""):
+        if reader_id is not None:
+            history = LOAN_HISTORY_BY_READER
+            where, params = ["b.reader_id = ?"], [reader_id]
+            title = "Reader history" if self.lang == "EN" else "Historia czytelnika"
+        else:
+            history = LOAN_HISTORY_BY_BOOK
+            where, params = ["b.book_id = ?"], [book_id]
+            title = "Book history" if self.lang == "EN" else "Historia książki"
+        win = tk.Toplevel(parent or self)
+        win.title(f"{title}: {subject}" if subject else title)
+        win.geometry("820x420")
+        columns = (
+            "id",
+            "ref_id",
+            "name",
+            "borrow_date",
+            "return_date",
+            "status",
+            "due",
+        )
+        if self.lang == "EN":
+            headings = [
+                "Loan ID",
+                "ID",
+                "Reader",
+                "Borrowed",
+                "Returned",
+                "Status",
+                "Due",
+            ]
+            if reader_id is not None:
+                headings[2] = "Title"
+        else:
+            headings = [
+                "ID wypożyczenia",
+                "ID",
+                "Czytelnik",
+                "Wypożyczono",
+                "Zwrócono",
+                "Status",
+                "Termin",
+            ]
+            if reader_id is not None:
+                headings[2] = "Tytuł"
+        history_tree = ttk.Treeview(win, columns=columns, show="headings")
+        for col, heading in zip(columns, headings):
+            history_tree.heading(col, text=heading)
+            history_tree.column(col, width=200 if col == "name" else 90)
+        history_tree.pack(fill="both", expand=True, padx=10, pady=10)
+
+        def render_row(row):
+            return list(row[:6]) + [epoch_day_to_date(row[6])]
+
+        self.attach_pager(
+            history_tree,
+            lambda token: keyset_page(
+                self.conn,
+                history[0],
+                history[1],
+                "b.id",
+                sort_col="b.borrow_date",
+                ascending=False,
+                where=where,
+                params=params,
+                token=token,
+            ),
+            render_row=render_row,
+        )()
+        tk.Button(
+            win,
+            text="Close" if self.lang == "EN" else "Zamknij",
+            command=win.destroy,
+        ).pack(side="bottom", pady=8)
+
+    def open_log_archive(self, parent=None):
+        win = tk.Toplevel(parent or self)
+        win.title("Log Archive" if self.lang == "EN" else "Archiwum dziennika")
+        win.geometry("760x460")
+        filter_frame = tk.Frame(win)
+        filter_frame.pack(fill="x", padx=10, pady=5)
+        start_var = tk.StringVar()
+        end_var = tk.StringVar()
+        text_var = tk.StringVar()
+        for col, (label, var) in enumerate(
+            [
+                (
+                    "From (YYYY-MM-DD):" if self.lang == "EN" else "Od (RRRR-MM-DD):",
+                    start_var,
+                ),
+                (
+                    "To (YYYY-MM-DD):" if self.lang == "EN" else "Do (RRRR-MM-DD):",
+                    end_var,
+                ),
+                (
+                    "Action contains:" if self.lang == "EN" else "Akcja zawiera:",
+                    text_var,
+                ),
+            ]
+        ):
+            tk.Label(filter_frame, text=label).grid(row=0, column=col * 2, sticky="w")
+            tk.Entry(filter_frame, textvariable=var, width=14).grid(
+                row=0, column=col * 2 + 1, padx=(0, 10)
+            )
+        archive_tree = ttk.Treeview(
+            win, columns=("id", "user_id", "action", "timestamp"), show="headings"
+        )
+        archive_tree.heading("id", text="ID")
+        archive_tree.heading("user_id", text="User ID")
+        archive_tree.heading("action", text="Action")
+        archive_tree.heading("timestamp", text="Timestamp")
+        archive_tree.pack(fill="both", expand=True, padx=10, pady=5)
+
+        def run_search():
+            start = start_var.get().strip()
+            end = end_var.get().strip()
+            try:
+                for value in (start, end):
+                    if value:
+                        datetime.date.fromisoformat(value)
+            except ValueError:
+                messagebox.showerror(
+                    "Error" if self.lang == "EN" else "Błąd",
+                    "Dates must be YYYY-MM-DD"
+                    if self.lang == "EN"
+                    else "Daty muszą mieć format RRRR-MM-DD",
+                    parent=win,
+                )
+                return
+            archive_tree.delete(*archive_tree.get_children())
+            try:
+                for row in search_log_archive(
+                    self.conn,
+                    self.log_archive_folder(),
+                    start=start or None,
+                    end=f"{end}T23:59:59.999999" if end else None,
+                    text=text_var.get().strip() or None,
+                ):
+                    archive_tree.insert("", "end", values=row)
+            except Exception as e:
+                messagebox.showerror(
+                    "Error" if self.lang == "EN" else "Błąd",
+                    f"Failed to read archive: {e}"
+                    if self.lang == "EN"
+                    else f"Nie udało się odczytać archiwum: {e}",
+                    parent=win,
+                )
+
+        tk.Button(
+            filter_frame,
+            text="Search" if self.lang == "EN" else "Szukaj",
+            command=run_search,
+        ).grid(row=0, column=6)
+        tk.Button(
+            win,
+            text="Close" if self.lang == "EN" else "Zamknij",
+            command=win.destroy,
+        ).pack(side="bottom", pady=8)
+
     def open_reader_panel(self):
         import tkinter.ttk as ttk
         import platform
@@ -1840,11 +6474,13 @@ class BookwormApp(tk.Tk):
                 "INSERT INTO readers (name, surname, grade) VALUES (?, ?, ?)",
                 (name, surname, grade),
             )
-            self.conn.commit()
             self.log_action(
-                self.get_user_id(self.username),
-                f"added reader: {name} {surname}, grade: {grade}",
+                self.user_id,
+                f"{name} {surname}, grade: {grade}",
+                "reader_added",
+                reader_id=self.cursor.lastrowid,
             )
+            self.flush_logs()
             self._show_info_popup(
                 "Reader Added" if self.lang == "EN" else "Dodano czytelnika",
                 "Reader has been added."
@@ -1873,31 +6509,65 @@ class BookwormApp(tk.Tk):
         search_entry.grid(row=4, column=1, padx=5, pady=5, sticky="w")
 
         # Readers List
-        readers_tree = ttk.Treeview(
+        readers_list_tree = ttk.Treeview(
             add_reader_frame,
             columns=("id", "name", "surname", "grade"),
             show="headings",
         )
-        readers_tree.heading("id", text="ID")
-        readers_tree.heading("name", text="Name" if self.lang == "EN" else "Imię")
-        readers_tree.heading(
+        readers_list_tree.heading("id", text="ID")
+        readers_list_tree.heading(
+            "name", text="Name" if self.lang == "EN" else "Imię"
+        )
+        readers_list_tree.heading(
             "surname", text="Surname" if self.lang == "EN" else "Nazwisko"
         )
-        readers_tree.heading("grade", text="Grade" if self.lang == "EN" else "Klasa")
-        readers_tree.grid(row=5, column=0, columnspan=2, padx=5, pady=5, sticky="nsew")
+        readers_list_tree.heading(
+            "grade", text="Grade" if self.lang == "EN" else "Klasa"
+        )
+        readers_list_tree.grid(
+            row=5, column=0, columnspan=2, padx=5, pady=5, sticky="nsew"
+        )
         add_reader_frame.grid_rowconfigure(5, weight=1)
         add_reader_frame.grid_columnconfigure(1, weight=1)
 
+        def show_reader_history(tree):
+            selected = tree.selection()
+            if not selected:
+                return
+            values = tree.item(selected[0])["values"]
+            self.show_loan_history(
+                reader_win, reader_id=values[0], subject=f"{values[1]} {values[2]}"
+            )
+
+        readers_list_tree.bind(
+            "<Double-1>", lambda e: show_reader_history(readers_list_tree)
+        )
+        tk.Button(
+            add_reader_frame,
+            text="Loan History" if self.lang == "EN" else "Historia wypożyczeń",
+            command=lambda: show_reader_history(readers_list_tree),
+        ).grid(row=6, column=0, columnspan=2, pady=5)
+
         def refresh_readers_list(filter_text=""):
-            readers_tree.delete(*readers_tree.get_children())
-            self.cursor.execute("SELECT id, name, surname, grade FROM readers")
-            all_readers = self.cursor.fetchall()
-            filter_text = filter_text.lower()
-            for r in all_readers:
+            where = []
+            params = []
+            if filter_text:
                 # Allow search in both EN and PL fields
-                values = [str(x).lower() for x in r]
-                if filter_text in "".join(values):
-                    readers_tree.insert("", "end", values=r)
+                where.append("(id || name || surname || grade) LIKE ?")
+                params.append(f"%{filter_text}%")
+
+            def fetch_page(token):
+                return keyset_page(
+                    self.conn,
+                    "readers",
+                    "id, name, surname, grade",
+                    "id",
+                    where=where,
+                    params=params,
+                    token=token,
+                )
+
+            self.attach_pager(readers_list_tree, fetch_page)()
 
         def on_search_readers(*args):
             refresh_readers_list(search_var.get())
@@ -1937,9 +6607,7 @@ class BookwormApp(tk.Tk):
         for col in ("ID", "Name", "Surname", "Grade"):
             readers_tree.column(col, width=120)
         readers_tree.grid(row=0, column=1, padx=5, pady=5, sticky="w")
-        self.cursor.execute("SELECT id, name, surname, grade FROM readers")
-        for row in self.cursor.fetchall():
-            readers_tree.insert("", "end", values=row)
+        readers_tree.bind("<Double-1>", lambda e: show_reader_history(readers_tree))
 
         # Books dropdown
         tk.Label(
@@ -1970,31 +6638,30 @@ class BookwormApp(tk.Tk):
         for col in ("ID", "Title", "Author", "Year", "Genre", "Status"):
             books_tree.column(col, width=100)
         books_tree.grid(row=1, column=1, padx=5, pady=5, sticky="w")
-        self.cursor.execute("SELECT ID, Title, Author, Year, Genre, Status FROM Books")
-        for row in self.cursor.fetchall():
+
+        def localize_status_row(row, status_index=5):
             # Localize status for Polish
-            if self.lang == "PL":
-                status_map = {
-                    "borrowed": "pożyczone",
-                    "returned": "zwrócone",
-                    "missing": "brak",
-                    "available": "dostępna",
-                    "lost": "zagubione",
-                    "other": "inne",
-                }
-                localized_row = list(row)
-                status_val = str(localized_row[5]).lower()
-                localized_row[5] = status_map.get(status_val, localized_row[5])
-                books_tree.insert("", "end", values=localized_row)
-            else:
-                books_tree.insert("", "end", values=row)
+            if self.lang != "PL":
+                return row
+            localized_row = list(row)
+            status_val = str(localized_row[status_index]).lower()
+            localized_row[status_index] = BOOK_STATUS_LABELS.get(
+                status_val, localized_row[status_index]
+            )
+            return localized_row
 
         def load_readers_books():
             # Refresh tables for readers and books
-            readers_tree.delete(*readers_tree.get_children())
-            self.cursor.execute("SELECT id, name, surname, grade FROM readers")
-            for row in self.cursor.fetchall():
-                readers_tree.insert("", "end", values=row)
+            self.attach_pager(
+                readers_tree,
+                lambda token: keyset_page(
+                    self.conn,
+                    "readers",
+                    "id, name, surname, grade",
+                    "id",
+                    token=token,
+                ),
+            )()
             # Localize book table headers
             if self.lang == "PL":
                 books_tree.heading("ID", text="ID")
@@ -2010,12 +6677,18 @@ class BookwormApp(tk.Tk):
                 books_tree.heading("Year", text="Year")
                 books_tree.heading("Genre", text="Genre")
                 books_tree.heading("Status", text="Status")
-            books_tree.delete(*books_tree.get_children())
-            self.cursor.execute(
-                "SELECT ID, Title, Author, Year, Genre, Status FROM Books"
-            )
-            for row in self.cursor.fetchall():
-                books_tree.insert("", "end", values=row)
+            self.attach_pager(
+                books_tree,
+                lambda token: keyset_page(
+                    self.conn,
+                    "book_catalog",
+                    "ID, Title, Author, Year, Genre, Status",
+                    "ID",
+                    where=AVAILABLE_BOOKS_WHERE,
+                    token=token,
+                ),
+                render_row=localize_status_row,
+            )()
             # Also refresh readers list in add_reader tab
             if (
                 "refresh_readers_list" in locals()
@@ -2036,16 +6709,33 @@ class BookwormApp(tk.Tk):
                 return
             reader_id = readers_tree.item(selected_reader[0])["values"][0]
             book_id = books_tree.item(selected_book[0])["values"][0]
-            now = datetime.datetime.now().isoformat()
-            self.cursor.execute(
-                "INSERT INTO borrowed_books (book_id, reader_id, borrow_date, status) VALUES (?, ?, ?, ?)",
-                (book_id, reader_id, now, "borrowed"),
-            )
-            self.conn.commit()
+            try:
+                loan_id = checkout_book(
+                    self.conn,
+                    book_id,
+                    reader_id,
+                    loan_periods=self.settings.get("loan_periods"),
+                )
+            except LoanError:
+                self.conn.rollback()
+                tk.messagebox.showerror(
+                    "Error" if self.lang == "EN" else "Błąd",
+                    "This book is not available for lending."
+                    if self.lang == "EN"
+                    else "Ta książka nie jest dostępna do wypożyczenia.",
+                    parent=reader_win,
+                )
+                return
             self.log_action(
-                self.get_user_id(self.username),
-                f"assigned book_id={book_id} to reader_id={reader_id}",
+                self.user_id,
+                None,
+                "book_assigned",
+                book_id=book_id,
+                reader_id=reader_id,
+                loan_id=loan_id,
             )
+            self.flush_logs()
+            books_tree.delete(selected_book[0])
             self._show_info_popup(
                 "Assigned" if self.lang == "EN" else "Przypisano",
                 "Book assigned to reader."
@@ -2074,95 +6764,150 @@ class BookwormApp(tk.Tk):
             text="Manage Loans" if self.lang == "EN" else "Zarządzaj wypożyczeniami",
         )
 
-        loans_tree = ttk.Treeview(
-            loans_frame,
-            columns=(
-                "id",
-                "book_id",
-                "reader_id",
-                "borrow_date",
-                "return_date",
-                "status",
-            ),
-            show="headings",
+        filter_frame = tk.Frame(loans_frame)
+        filter_frame.pack(fill="x", padx=10, pady=(10, 0))
+        active_only_var = tk.BooleanVar(value=True)
+        tk.Checkbutton(
+            filter_frame,
+            text="Active only" if self.lang == "EN" else "Tylko aktywne",
+            variable=active_only_var,
+            command=lambda: refresh_loans(),
+        ).pack(side="left")
+        overdue_only_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(
+            filter_frame,
+            text="Overdue only" if self.lang == "EN" else "Tylko przeterminowane",
+            variable=overdue_only_var,
+            command=lambda: refresh_loans(),
+        ).pack(side="left", padx=(10, 0))
+        tk.Label(
+            filter_frame,
+            text="Reader or title:" if self.lang == "EN" else "Czytelnik lub tytuł:",
+        ).pack(side="left", padx=(20, 5))
+        loan_search_var = tk.StringVar()
+        loan_search_entry = tk.Entry(filter_frame, textvariable=loan_search_var)
+        loan_search_entry.pack(side="left", fill="x", expand=True)
+        loan_search_entry.bind("<Return>", lambda event: refresh_loans())
+        tk.Button(
+            filter_frame,
+            text="Search" if self.lang == "EN" else "Szukaj",
+            command=lambda: refresh_loans(),
+        ).pack(side="left", padx=5)
+
+        loan_columns = (
+            "id",
+            "book_id",
+            "title",
+            "reader_id",
+            "reader",
+            "borrow_date",
+            "return_date",
+            "status",
+            "due_date",
         )
+        loans_tree = ttk.Treeview(loans_frame, columns=loan_columns, show="headings")
         col_titles = {
             "id": "ID",
             "book_id": "Book ID" if self.lang == "EN" else "ID książki",
+            "title": "Title" if self.lang == "EN" else "Tytuł",
             "reader_id": "Reader ID" if self.lang == "EN" else "ID czytelnika",
+            "reader": "Reader" if self.lang == "EN" else "Czytelnik",
             "borrow_date": "Borrow Date" if self.lang == "EN" else "Data wypożyczenia",
             "return_date": "Return Date" if self.lang == "EN" else "Data zwrotu",
             "status": "Status" if self.lang == "EN" else "Status",
+            "due_date": "Due Date" if self.lang == "EN" else "Termin zwrotu",
         }
-        for col in (
-            "id",
-            "book_id",
-            "reader_id",
-            "borrow_date",
-            "return_date",
-            "status",
-        ):
+        for col in loan_columns:
             loans_tree.heading(col, text=col_titles[col])
+            loans_tree.column(col, width=160 if col in ("title", "reader") else 90)
         loans_tree.pack(fill="both", expand=True, padx=10, pady=10)
 
+        def render_loan_row(row):
+            row = localize_status_row(row, status_index=7)
+            return list(row[:8]) + [epoch_day_to_date(row[8])]
+
         def refresh_loans():
-            for row in loans_tree.get_children():
-                loans_tree.delete(row)
-            self.cursor.execute(
-                "SELECT id, book_id, reader_id, borrow_date, return_date, status FROM borrowed_books ORDER BY id DESC"
+            where, params = loans_filter_sql(
+                active_only=active_only_var.get(),
+                overdue_only=overdue_only_var.get(),
+                text=loan_search_var.get(),
             )
-            for row in self.cursor.fetchall():
-                # Localize status for Polish
-                if self.lang == "PL":
-                    status_map = {
-                        "borrowed": "pożyczone",
-                        "returned": "zwrócone",
-                        "missing": "brak",
-                        "available": "dostępna",
-                        "lost": "zagubione",
-                        "other": "inne",
-                    }
-                    localized_row = list(row)
-                    status_val = str(localized_row[5]).lower()
-                    localized_row[5] = status_map.get(status_val, localized_row[5])
-                    loans_tree.insert("", "end", values=localized_row)
-                else:
-                    loans_tree.insert("", "end", values=row)
+            if overdue_only_var.get():
+                fetch_page = lambda token: keyset_page(
+                    self.conn,
+                    LOANS_VIEW_TABLES,
+                    LOANS_VIEW_COLUMNS,
+                    "b.id",
+                    sort_col="b.due_day",
+                    where=where,
+                    params=params,
+                    token=token,
+                )
+            else:
+                fetch_page = lambda token: keyset_page(
+                    self.conn,
+                    LOANS_VIEW_TABLES,
+                    LOANS_VIEW_COLUMNS,
+                    "b.id",
+                    ascending=False,
+                    where=where,
+                    params=params,
+                    token=token,
+                )
+            self.attach_pager(loans_tree, fetch_page, render_row=render_loan_row)()
 
         def mark_returned():
             selected = loans_tree.selection()
             if not selected:
                 return
             loan_id = loans_tree.item(selected[0])["values"][0]
-            import datetime
-
-            now = datetime.datetime.now().isoformat()
-            status_returned = "returned" if self.lang == "EN" else "zwrócona"
-            self.cursor.execute(
-                "UPDATE borrowed_books SET status=?, return_date=? WHERE id=?",
-                (status_returned, now, loan_id),
-            )
-            self.conn.commit()
+            try:
+                book_id = checkin_book(self.conn, loan_id)
+            except LoanError:
+                self.conn.rollback()
+                show_loan_closed()
+                return
             self.log_action(
-                self.get_user_id(self.username), f"marked loan_id={loan_id} as returned"
+                self.user_id,
+                None,
+                "loan_returned",
+                loan_id=loan_id,
+                book_id=book_id,
             )
+            self.flush_logs()
             refresh_loans()
+            load_readers_books()
 
         def mark_lost():
             selected = loans_tree.selection()
             if not selected:
                 return
             loan_id = loans_tree.item(selected[0])["values"][0]
-            self.cursor.execute(
-                "UPDATE borrowed_books SET status=? WHERE id=?",
-                ("lost", loan_id),
-            )
-            self.conn.commit()
+            try:
+                book_id = mark_loan_lost(self.conn, loan_id)
+            except LoanError:
+                self.conn.rollback()
+                show_loan_closed()
+                return
             self.log_action(
-                self.get_user_id(self.username), f"marked loan_id={loan_id} as lost"
+                self.user_id,
+                None,
+                "loan_lost",
+                loan_id=loan_id,
+                book_id=book_id,
             )
+            self.flush_logs()
             refresh_loans()
 
+        def show_loan_closed():
+            tk.messagebox.showerror(
+                "Error" if self.lang == "EN" else "Błąd",
+                "This loan is already closed."
+                if self.lang == "EN"
+                else "To wypożyczenie jest już zamknięte.",
+                parent=reader_win,
+            )
+
         btn_frame = tk.Frame(loans_frame)
         btn_frame.pack(pady=5)
         tk.Button(
@@ -2182,6 +6927,213 @@ class BookwormApp(tk.Tk):
         ).pack(side="left", padx=5)
         refresh_loans()
 
+        # --- Circulation Tab ---
+        circ_frame = tk.Frame(notebook)
+        notebook.add(
+            circ_frame, text="Circulation" if self.lang == "EN" else "Obieg"
+        )
+        circ_mode_var = tk.StringVar(value="checkout")
+        mode_frame = tk.Frame(circ_frame)
+        mode_frame.grid(row=0, column=0, columnspan=3, padx=5, pady=5, sticky="w")
+        for value, label in (
+            ("checkout", "Check out" if self.lang == "EN" else "Wypożycz"),
+            ("checkin", "Check in" if self.lang == "EN" else "Przyjmij zwrot"),
+        ):
+            tk.Radiobutton(
+                mode_frame, text=label, variable=circ_mode_var, value=value
+            ).pack(side="left", padx=5)
+
+        tk.Label(
+            circ_frame, text="Reader ID:" if self.lang == "EN" else "ID czytelnika:"
+        ).grid(row=1, column=0, padx=5, pady=5, sticky="e")
+        circ_reader_var = tk.StringVar()
+        circ_reader_entry = tk.Entry(circ_frame, textvariable=circ_reader_var)
+        circ_reader_entry.grid(row=1, column=1, padx=5, pady=5, sticky="w")
+        circ_reader_label = tk.Label(circ_frame, text="")
+        circ_reader_label.grid(row=1, column=2, padx=5, pady=5, sticky="w")
+
+        tk.Label(
+            circ_frame,
+            text="Book ID / ISBN / barcode:"
+            if self.lang == "EN"
+            else "ID książki / ISBN / kod kreskowy:",
+        ).grid(row=2, column=0, padx=5, pady=5, sticky="e")
+        circ_book_var = tk.StringVar()
+        circ_book_entry = tk.Entry(circ_frame, textvariable=circ_book_var)
+        circ_book_entry.grid(row=2, column=1, padx=5, pady=5, sticky="w")
+        circ_note_label = tk.Label(circ_frame, text="")
+        circ_note_label.grid(row=2, column=2, padx=5, pady=5, sticky="w")
+
+        queue_tree = ttk.Treeview(
+            circ_frame, columns=("book_id", "title", "note"), show="headings"
+        )
+        queue_tree.heading(
+            "book_id", text="Book ID" if self.lang == "EN" else "ID książki"
+        )
+        queue_tree.heading("title", text="Title" if self.lang == "EN" else "Tytuł")
+        queue_tree.heading("note", text="Note" if self.lang == "EN" else "Uwagi")
+        queue_tree.grid(row=3, column=0, columnspan=3, padx=5, pady=5, sticky="nsew")
+        circ_frame.grid_rowconfigure(3, weight=1)
+        circ_frame.grid_columnconfigure(2, weight=1)
+
+        def lookup_reader(*args):
+            try:
+                reader_id = int(circ_reader_var.get().strip())
+            except ValueError:
+                circ_reader_label.config(text="")
+                return None
+            cur = self.conn.cursor()
+            cur.execute("SELECT name, surname FROM readers WHERE id=?", (reader_id,))
+            row = cur.fetchone()
+            circ_reader_label.config(
+                text=f"{row[0]} {row[1]}"
+                if row
+                else ("Unknown reader" if self.lang == "EN" else "Nieznany czytelnik")
+            )
+            return reader_id if row else None
+
+        circ_reader_var.trace_add("write", lookup_reader)
+        circ_reader_entry.bind("<Return>", lambda e: circ_book_entry.focus_set())
+
+        def queue_book(event=None):
+            value = circ_book_var.get().strip()
+            circ_book_var.set("")
+            circ_book_entry.focus_set()
+            if not value:
+                return
+            row = find_book_by_code(self.conn, value)
+            if not row:
+                circ_note_label.config(
+                    text=f"{value}: "
+                    + ("no such book" if self.lang == "EN" else "brak takiej książki")
+                )
+                return
+            book_id = row[0]
+            if any(
+                queue_tree.item(item)["values"][0] == book_id
+                for item in queue_tree.get_children()
+            ):
+                circ_note_label.config(
+                    text=f"{book_id}: "
+                    + ("already queued" if self.lang == "EN" else "już w kolejce")
+                )
+                return
+            circ_note_label.config(text="")
+            queue_tree.insert("", "end", values=(book_id, row[1], ""))
+
+        circ_book_entry.bind("<Return>", queue_book)
+
+        def update_loan_rows(loan_ids):
+            if not loan_ids:
+                return
+            placeholders = ", ".join("?" * len(loan_ids))
+            cur = self.conn.cursor()
+            cur.execute(
+                f"SELECT {LOANS_VIEW_COLUMNS} FROM {LOANS_VIEW_TABLES} "
+                f"WHERE b.id IN ({placeholders}) ORDER BY b.id",
+                list(loan_ids),
+            )
+            items = {
+                loans_tree.item(item)["values"][0]: item
+                for item in loans_tree.get_children()
+            }
+            show_new = not overdue_only_var.get() and not loan_search_var.get().strip()
+            for row in cur.fetchall():
+                item = items.get(row[0])
+                if item is not None:
+                    if active_only_var.get() and row[7] != "borrowed":
+                        loans_tree.delete(item)
+                    else:
+                        loans_tree.item(item, values=render_loan_row(row))
+                elif show_new:
+                    loans_tree.insert("", 0, values=render_loan_row(row))
+
+        def process_queue():
+            queued = {
+                queue_tree.item(item)["values"][0]: item
+                for item in queue_tree.get_children()
+            }
+            if not queued:
+                return
+            checkout = circ_mode_var.get() == "checkout"
+            if checkout:
+                reader_id = lookup_reader()
+                if reader_id is None:
+                    tk.messagebox.showerror(
+                        "Error" if self.lang == "EN" else "Błąd",
+                        "Enter a valid reader ID."
+                        if self.lang == "EN"
+                        else "Podaj poprawne ID czytelnika.",
+                        parent=reader_win,
+                    )
+                    return
+                done, failed = checkout_books(
+                    self.conn,
+                    reader_id,
+                    list(queued),
+                    loan_periods=self.settings.get("loan_periods"),
+                )
+                entries = [
+                    (
+                        None,
+                        "book_assigned",
+                        {
+                            "book_id": book_id,
+                            "reader_id": reader_id,
+                            "loan_id": loan_id,
+                        },
+                    )
+                    for book_id, loan_id in done
+                ]
+            else:
+                done, failed = checkin_books(self.conn, list(queued))
+                entries = [
+                    (
+                        None,
+                        "loan_returned",
+                        {"book_id": book_id, "loan_id": loan_id},
+                    )
+                    for book_id, loan_id in done
+                ]
+            self.log_actions(self.user_id, entries)
+            for book_id, loan_id in done:
+                queue_tree.delete(queued[book_id])
+            for book_id, reason in failed:
+                item = queued[book_id]
+                values = queue_tree.item(item)["values"][:2] + [reason]
+                queue_tree.item(item, values=values)
+            update_loan_rows([loan_id for book_id, loan_id in done])
+            if checkout:
+                lent = {book_id for book_id, loan_id in done}
+                for item in books_tree.get_children():
+                    if books_tree.item(item)["values"][0] in lent:
+                        books_tree.delete(item)
+            self._show_info_popup(
+                "Circulation" if self.lang == "EN" else "Obieg",
+                f"Processed: {len(done)}, failed: {len(failed)}"
+                if self.lang == "EN"
+                else f"Przetworzono: {len(done)}, błędy: {len(failed)}",
+                parent=reader_win,
+            )
+
+        circ_btn_frame = tk.Frame(circ_frame)
+        circ_btn_frame.grid(row=4, column=0, columnspan=3, pady=5)
+        tk.Button(
+            circ_btn_frame,
+            text="Process Queue" if self.lang == "EN" else "Przetwórz kolejkę",
+            command=process_queue,
+        ).pack(side="left", padx=5)
+        tk.Button(
+            circ_btn_frame,
+            text="Remove Selected" if self.lang == "EN" else "Usuń zaznaczone",
+            command=lambda: queue_tree.delete(*queue_tree.selection()),
+        ).pack(side="left", padx=5)
+        tk.Button(
+            circ_btn_frame,
+            text="Clear Queue" if self.lang == "EN" else "Wyczyść kolejkę",
+            command=lambda: queue_tree.delete(*queue_tree.get_children()),
+        ).pack(side="left", padx=5)
+
         # --- Close Button ---
         tk.Button(
             reader_win,
@@ -2234,32 +7186,38 @@ class BookwormApp(tk.Tk):
 
         # Add database import button
         def import_db():
-            import shutil
             from tkinter import filedialog
-            import os
 
             desktop = os.path.join(os.path.expanduser("~"), "Desktop")
             src = filedialog.askopenfilename(
+                parent=win,
                 initialdir=desktop,
                 filetypes=[("Encrypted Database Files", "*.db.enc")],
                 title="Import encrypted database file",
             )
-            db_path = (
-                self.db_decrypted_path
-                if hasattr(self, "db_decrypted_path")
-                else "bookworm.db"
-            )
             if src:
-                shutil.copyfile(src, db_path)
-                tk.messagebox.showinfo(
-                    "Restore", "Database imported. Please restart the application."
-                )
+                self.restore_database(src, parent=win)
 
         tk.Button(
             win,
             text="Import Database" if self.lang == "EN" else "Importuj bazę danych",
             command=import_db,
-        ).grid(row=5, column=0, columnspan=2, pady=10, sticky="ew")
+        ).grid(row=6, column=0, columnspan=2, pady=10, sticky="ew")
+
+        lbl_loan_days = tk.Label(
+            win,
+            text="Default loan period (days):"
+            if self.lang == "EN"
+            else "Domyślny okres wypożyczenia (dni):",
+        )
+        lbl_loan_days.grid(row=3, column=0, padx=10, pady=10, sticky="w")
+        loan_periods = self.settings.get(
+            "loan_periods", DEFAULT_SETTINGS["loan_periods"]
+        )
+        loan_days_var = tk.IntVar(value=loan_period_days(loan_periods))
+        tk.Spinbox(win, from_=1, to=365, textvariable=loan_days_var, width=5).grid(
+            row=3, column=1, padx=10, pady=10, sticky="w"
+        )
 
         # Popups toggle for Linux
         import platform
@@ -2282,6 +7240,11 @@ class BookwormApp(tk.Tk):
             self.settings["default_language"] = lang_var.get()
             if is_linux:
                 self.settings["popups"] = popups_var.get()
+            try:
+                loan_days = max(1, int(loan_days_var.get()))
+            except (tk.TclError, ValueError):
+                loan_days = loan_period_days(loan_periods)
+            self.settings["loan_periods"] = dict(loan_periods, default=loan_days)
             self.save_settings(self.settings)
             self.load_custom_themes()
             self.set_theme(self.settings["theme"])
@@ -2323,7 +7286,7 @@ class BookwormApp(tk.Tk):
             font=("Segoe UI", 12, "bold"),
             command=save_settings,
         )
-        btn_save.grid(row=3, column=0, columnspan=2, pady=30, sticky="ew")
+        btn_save.grid(row=4, column=0, columnspan=2, pady=30, sticky="ew")
 
         btn_theme_creator = tk.Button(
             win,
@@ -2335,11 +7298,259 @@ class BookwormApp(tk.Tk):
             font=("Segoe UI", 11, "bold"),
             command=run_theme_creator,
         )
-        btn_theme_creator.grid(row=4, column=0, columnspan=2, pady=0, sticky="ew")
+        btn_theme_creator.grid(row=5, column=0, columnspan=2, pady=0, sticky="ew")
 
         win.grid_columnconfigure(1, weight=1)
 
 
+def storage_profiles(settings):
+    profiles = {name: dict(pragmas) for name, pragmas in STORAGE_PROFILES.items()}
+    for name, pragmas in (settings.get("storage_profiles") or {}).items():
+        profiles[name] = dict(profiles.get(name, {}), **pragmas)
+    return profiles
+
+
+def storage_profile_pragmas(settings):
+    profiles = storage_profiles(settings)
+    return profiles.get(settings.get("storage_profile"), profiles["desktop"])
+
+
+def apply_storage_profile(conn, pragmas):
+    # PRAGMA values cannot be bound, so only known names and plain values pass
+    cur = conn.cursor()
+    # Incremental auto_vacuum; only sticks on a new file, before journal_mode
+    cur.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    for name in STORAGE_PRAGMAS:
+        value = pragmas.get(name)
+        if value is None or not re.fullmatch(r"-?\w+", str(value)):
+            continue
+        cur.execute(f"PRAGMA {name} = {value}")
+        cur.fetchall()
+
+
+def remove_database_files(path):
+    for suffix in ("", "-journal", "-wal", "-shm"):
+        try:
+            os.remove(path + suffix)
+        except OSError:
+            pass
+
+
+def benchmark_storage_profile(pragmas, directory, scale=None):
+    import tempfile
+
+    fd, path = tempfile.mkstemp(suffix=".db", prefix="bookworm-bench-", dir=directory)
+    os.close(fd)
+    os.remove(path)
+    timings = {}
+    try:
+        conn = sqlite3.connect(path)
+        apply_storage_profile(conn, pragmas)
+        started = time.perf_counter()
+        seed_sample_db(conn, **(scale or STORAGE_BENCHMARK_SCALE))
+        timings["load"] = time.perf_counter() - started
+        conn.close()
+
+        conn = sqlite3.connect(path)
+        apply_storage_profile(conn, pragmas)
+        cur = conn.cursor()
+        queries = hot_queries()
+        started = time.perf_counter()
+        for _ in range(STORAGE_BENCHMARK_READ_ROUNDS):
+            for name, sql, args, index in queries:
+                cur.execute(sql, args)
+                cur.fetchall()
+        timings["read"] = time.perf_counter() - started
+
+        cur.execute(
+            "SELECT ID FROM Books WHERE "
+            + " AND ".join(AVAILABLE_BOOKS_WHERE)
+            + " ORDER BY ID LIMIT ?",
+            (STORAGE_BENCHMARK_LOANS,),
+        )
+        book_ids = [row[0] for row in cur.fetchall()]
+        cur.execute("SELECT MIN(id) FROM readers")
+        reader_id = cur.fetchone()[0]
+        started = time.perf_counter()
+        loan_ids = []
+        for book_id in book_ids:
+            loan_ids.append(checkout_book(conn, book_id, reader_id))
+            conn.commit()
+        for loan_id in loan_ids:
+            checkin_book(conn, loan_id)
+            conn.commit()
+        timings["write"] = time.perf_counter() - started
+        conn.close()
+    finally:
+        remove_database_files(path)
+    return timings
+
+
+def benchmark_storage_profiles(profiles, directory, progress=None, scale=None):
+    results = []
+    for name, pragmas in profiles.items():
+        if progress:
+            progress(name)
+        results.append((name, benchmark_storage_profile(pragmas, directory, scale)))
+    best = min(results, key=lambda result: sum(result[1].values()))
+    return results, best[0]
+
+
+def run_storage_benchmark(directory):
+    settings = {}
+    if os.path.exists(SETTINGS_FILE):
+        with open(SETTINGS_FILE, "r", encoding="utf-8") as f:
+            settings = json.load(f)
+    results, best = benchmark_storage_profiles(
+        storage_profiles(settings),
+        directory,
+        progress=lambda name: print(f"benchmarking {name}...", flush=True),
+    )
+    print(f"{'profile':<16}{'load':>9}{'read':>9}{'write':>9}{'total':>9}")
+    for name, timings in results:
+        print(
+            f"{name:<16}"
+            + "".join(f"{timings[phase]:>8.2f}s" for phase in ("load", "read", "write"))
+            + f"{sum(timings.values()):>8.2f}s"
+        )
+    print(f"recommended: {best}")
+    return 0
+
+
+def maintenance_tasks(settings):
+    overrides = settings.get("maintenance") or {}
+    return {
+        task: dict(config, **overrides.get(task, {}))
+        for task, config in MAINTENANCE_TASKS.items()
+    }
+
+
+def maintenance_results(conn):
+    results = {}
+    for task in MAINTENANCE_TASKS:
+        value = get_meta_value(conn, f"maintenance:{task}")
+        if value:
+            results[task] = json.loads(value)
+    return results
+
+
+def due_maintenance_tasks(conn, tasks, now=None):
+    now = now or datetime.datetime.now()
+    results = maintenance_results(conn)
+    due = []
+    for task, config in tasks.items():
+        last = results.get(task)
+        if last is None or last["status"] == "partial":
+            due.append(task)
+        elif now - datetime.datetime.fromisoformat(
+            last["at"]
+        ) >= datetime.timedelta(hours=config["interval_hours"]):
+            due.append(task)
+    return due
+
+
+def run_maintenance_task(conn, task, budget_seconds, at_close=False):
+    # Returns (status, detail); status is "ok", "failed", "interrupted",
+    # "partial", "skipped" or "error"
+    deadline = time.monotonic() + budget_seconds
+    conn.commit()
+    conn.set_progress_handler(lambda: time.monotonic() > deadline, 1000)
+    cur = conn.cursor()
+    try:
+        if task == "optimize":
+            cur.execute(f"PRAGMA analysis_limit = {MAINTENANCE_ANALYSIS_LIMIT}")
+            cur.execute("PRAGMA optimize")
+            return "ok", ""
+        if task == "analyze":
+            cur.execute(f"PRAGMA analysis_limit = {MAINTENANCE_ANALYSIS_LIMIT}")
+            cur.execute("ANALYZE")
+            conn.commit()
+            cur.execute("SELECT COUNT(*) FROM sqlite_stat1")
+            return "ok", f"{cur.fetchone()[0]} statistics rows"
+        if task == "incremental_vacuum":
+            cur.execute("PRAGMA auto_vacuum")
+            if cur.fetchone()[0] != 2:
+                if not at_close:
+                    return "skipped", "auto_vacuum conversion waits for close"
+                # Older files: one full VACUUM to incremental mode, without the budget
+                conn.set_progress_handler(None, 0)
+                try:
+                    cur.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                    cur.execute("VACUUM")
+                except sqlite3.DatabaseError as e:
+                    conn.rollback()
+                    return "skipped", f"auto_vacuum conversion failed: {e}"
+                return "ok", "converted to incremental auto_vacuum"
+            cur.execute("PRAGMA freelist_count")
+            free = start = cur.fetchone()[0]
+            while free and time.monotonic() < deadline:
+                # executescript steps the PRAGMA to completion
+                conn.executescript(f"PRAGMA incremental_vacuum({VACUUM_STEP_PAGES})")
+                cur.execute("PRAGMA freelist_count")
+                free = cur.fetchone()[0]
+            detail = f"{start - free} pages freed, {free} left"
+            return ("interrupted" if free else "ok"), detail
+        if task == "quick_check":
+            cur.execute("PRAGMA quick_check(20)")
+            problems = [row[0] for row in cur.fetchall()]
+            if problems == ["ok"]:
+                return "ok", ""
+            return "failed", "; ".join(problems)
+        if task == "consistency_check":
+            conn.set_progress_handler(None, 0)
+            report, step, steps = consistency_check_slice(conn, budget_seconds)
+            if report is None:
+                return "partial", f"step {step} of {steps}"
+            findings = report["problems"] + [
+                f"{count} orphaned {name}" for name, count in report["orphans"].items()
+            ]
+            return ("failed" if findings else "ok"), "; ".join(findings)
+        return "skipped", f"unknown task {task}"
+    except sqlite3.OperationalError as e:
+        conn.rollback()
+        if "interrupt" in str(e):
+            return "interrupted", f"over the {budget_seconds}s budget"
+        return "error", str(e)
+    except sqlite3.DatabaseError as e:
+        conn.rollback()
+        return "error", str(e)
+    finally:
+        conn.set_progress_handler(None, 0)
+
+
+def run_maintenance(conn, tasks, names=None, at_close=False):
+    results = []
+    if names is None:
+        names = due_maintenance_tasks(conn, tasks)
+        if (
+            at_close
+            and "incremental_vacuum" not in names
+            and conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2
+        ):
+            # The auto_vacuum conversion is due at every close until it is done
+            names.append("incremental_vacuum")
+    for task in names:
+        started = time.monotonic()
+        status, detail = run_maintenance_task(
+            conn, task, tasks[task]["budget_seconds"], at_close
+        )
+        record = {
+            "at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "status": status,
+            "seconds": round(time.monotonic() - started, 2),
+            "detail": detail,
+        }
+        if status != "skipped":
+            set_meta_value(conn, f"maintenance:{task}", json.dumps(record))
+            conn.commit()
+        results.append((task, record))
+    return results
+
+
 if __name__ == "__main__":
+    if "--benchmark-storage" in sys.argv[1:]:
+        # Optional directory argument: where the database will live
+        args = sys.argv[sys.argv.index("--benchmark-storage") + 1 :]
+        sys.exit(run_storage_benchmark(args[0] if args else "."))
     app = BookwormApp()
     app.mainloop()
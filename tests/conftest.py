@@ -0,0 +1,106 @@
+import os
+import sqlite3
+import sys
+import tkinter as tk
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "source"))
+
+import bookworm_gui_v420 as bookworm  # noqa: E402
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    # BookwormApp without a display: the Tk calls the session makes are no-ops
+    # and the screens are not drawn
+    monkeypatch.chdir(tmp_path)
+    for name in ("title", "geometry", "protocol", "bind_all", "after_cancel"):
+        monkeypatch.setattr(tk.Tk, name, lambda self, *a, **kw: None)
+    monkeypatch.setattr(tk.Tk, "__init__", lambda self: None)
+    monkeypatch.setattr(tk.Tk, "after", lambda self, ms, func=None, *a: "job")
+    for name in ("create_language_selection", "create_main_menu"):
+        monkeypatch.setattr(bookworm.BookwormApp, name, lambda self: None)
+    messages = []
+    for name in ("showinfo", "showerror"):
+        monkeypatch.setattr(
+            bookworm.messagebox,
+            name,
+            lambda title, text, _kind=name, **kw: messages.append((_kind, text)),
+        )
+    app = bookworm.BookwormApp()
+    app.messages = messages
+    return app
+
+
+@pytest.fixture
+def session(app):
+    # Logged in as an admin the way try_login leaves the app
+    app.load_or_create_encrypted_db()
+    bookworm.seed_sample_db(app.conn, books=200, readers=20, loans=100, logs=100)
+    app.cursor.execute(
+        "INSERT INTO users (username, password, is_admin) VALUES (?, ?, 1)",
+        ("admin", "secret"),
+    )
+    app.conn.commit()
+    app.username = "admin"
+    app.user_id = app.cursor.lastrowid
+    app.is_admin = True
+    app.user_key = bookworm.generate_key("admin", "secret")
+    return app
+
+
+BASELINE_SCHEMA = """
+CREATE TABLE Books (
+    ID INTEGER PRIMARY KEY, Title TEXT, Author TEXT, Year INTEGER, Genre TEXT,
+    Status TEXT, BookRow TEXT
+);
+CREATE TABLE RemovedBooks (
+    ID INTEGER PRIMARY KEY, Title TEXT, Author TEXT, Year INTEGER, Genre TEXT,
+    Status TEXT
+);
+CREATE TABLE users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT UNIQUE NOT NULL,
+    password TEXT NOT NULL, is_admin INTEGER DEFAULT 0,
+    is_superadmin INTEGER DEFAULT 0, privileges TEXT DEFAULT ''
+);
+CREATE TABLE readers (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL,
+    surname TEXT NOT NULL, grade TEXT NOT NULL
+);
+CREATE TABLE borrowed_books (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, book_id INTEGER NOT NULL,
+    reader_id INTEGER NOT NULL, borrow_date TEXT NOT NULL, return_date TEXT,
+    status TEXT NOT NULL,
+    FOREIGN KEY (book_id) REFERENCES Books (ID),
+    FOREIGN KEY (reader_id) REFERENCES readers (id)
+);
+CREATE TABLE logs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, action TEXT,
+    timestamp TEXT, FOREIGN KEY (user_id) REFERENCES users (id)
+);
+INSERT INTO users VALUES (1, 'admin', 'pw', 1, 1, ''), (2, 'bob', 'pw', 0, 0, '');
+INSERT INTO readers VALUES (1, 'Ann', 'Kowal', '3a'), (2, 'Tom', 'Lis', '2b');
+INSERT INTO Books VALUES
+    (1, 'Solaris', 'Lem', 1961, 'sf', 'Available', 'A1'),
+    (2, 'Eden', 'Lem', 1959, 'sf', 'borrowed', 'A1'),
+    (3, 'Solaris', 'Lem', 1961, 'sf', 'available', 'A2'),
+    (4, 'Pan Tadeusz', 'Mickiewicz', 1834, 'poem', 'Lost', NULL);
+INSERT INTO borrowed_books VALUES
+    (1, 2, 1, '2024-01-01', NULL, 'borrowed'),
+    (2, 1, 2, '2023-01-01', '2023-02-01', 'zwrócona');
+INSERT INTO logs VALUES
+    (1, 1, 'login (user: admin)', '2024-01-01T00:00:00'),
+    (2, 1, 'assigned book_id=2 to reader_id=1', '2024-01-01T00:00:01'),
+    (3, 1, 'demoted user_id=2 from admin', '2024-01-02T00:00:00'),
+    (4, 1, 'something custom', '2024-01-03T00:00:00');
+"""
+
+
+@pytest.fixture
+def baseline_db():
+    # A database written by the last released version, before any migration
+    conn = sqlite3.connect(":memory:")
+    conn.executescript(BASELINE_SCHEMA)
+    yield conn
+    conn.close()
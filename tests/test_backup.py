@@ -0,0 +1,67 @@
+import sqlite3
+
+import bookworm_gui_v420 as bookworm
+
+
+def book_count(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM Books").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_backup_then_restore(session, tmp_path):
+    dest = str(tmp_path / "backup.db.enc")
+    size = bookworm.backup_database(session.db_decrypted_path, dest, session.user_key)
+    assert size > 0
+    session.cursor.execute("DELETE FROM Books WHERE ID > 100")
+    session.conn.commit()
+
+    assert session.restore_database(dest)
+    assert session.messages[-1] == ("showinfo", "Database restored.")
+    assert book_count(session.db_decrypted_path) == 200
+    assert session.user_id is not None
+
+
+def test_restore_refuses_another_users_backup(session, tmp_path):
+    dest = str(tmp_path / "backup.db.enc")
+    key = bookworm.generate_key("someone", "else")
+    bookworm.backup_database(session.db_decrypted_path, dest, key)
+
+    assert not session.restore_database(dest)
+    assert session.messages[-1][0] == "showerror"
+    assert book_count(session.db_decrypted_path) == 200
+
+
+def close_with_daily_set(session, store_dir):
+    session.settings["backup_store"] = {"dir": str(store_dir), "daily_at_close": True}
+    path = session.db_decrypted_path
+    session.close_db()
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute(
+            "SELECT action FROM logs WHERE action_code='db_backup'"
+        ).fetchall()
+    finally:
+        conn.close()
+
+
+def test_daily_set_at_close(session, tmp_path):
+    store = tmp_path / "store"
+    store.mkdir()
+    logged = close_with_daily_set(session, store)
+
+    assert [row[0].startswith("backup set ") for row in logged] == [True]
+    session.load_or_create_encrypted_db()
+    keys = bookworm.open_backup_store(session.conn, str(store), session.user_key)
+    assert len(bookworm.read_backup_manifests(str(store), keys)[0]) == 1
+
+
+def test_failed_daily_set_does_not_block_closing(session, tmp_path):
+    store = tmp_path / "not-a-folder"
+    store.write_text("")
+    logged = close_with_daily_set(session, store)
+
+    assert session.conn is None
+    assert [row[0].startswith("daily backup set failed") for row in logged] == [True]
@@ -0,0 +1,101 @@
+import sqlite3
+
+import pytest
+
+import bookworm_gui_v420 as bookworm
+
+
+@pytest.fixture
+def migrated(baseline_db):
+    bookworm.init_schema(baseline_db, bookworm.DEFAULT_SETTINGS)
+    baseline_db.commit()
+    return baseline_db
+
+
+def schema_objects(conn):
+    return conn.execute(
+        "SELECT type, name FROM sqlite_master WHERE name NOT LIKE 'sqlite_%' "
+        "ORDER BY type, name"
+    ).fetchall()
+
+
+def test_migration_matches_new_schema(migrated):
+    new = sqlite3.connect(":memory:")
+    bookworm.init_schema(new, bookworm.DEFAULT_SETTINGS)
+
+    assert schema_objects(migrated) == schema_objects(new)
+    assert bookworm.foreign_keys(migrated) == bookworm.foreign_keys(new)
+    bookworm.init_schema(migrated, bookworm.DEFAULT_SETTINGS)
+    assert schema_objects(migrated) == schema_objects(new)
+
+
+def test_migration_lower_cases_statuses(migrated):
+    statuses = dict(migrated.execute("SELECT ID, Status FROM Books"))
+    assert statuses == {1: "available", 2: "borrowed", 3: "available", 4: "lost"}
+
+
+def test_capitalised_status_is_lendable(migrated):
+    bookworm.checkout_book(migrated, 1, 2)
+    bookworm.add_copy(migrated, (None, "Eden", "Lem", 1959, "sf", "Available", None))
+    new_id = migrated.execute("SELECT MAX(ID) FROM Books").fetchone()[0]
+    bookworm.checkout_book(migrated, new_id, 1)
+    migrated.commit()
+
+    borrowed = migrated.execute(
+        "SELECT COUNT(*) FROM Books WHERE Status = 'borrowed'"
+    ).fetchone()[0]
+    assert borrowed == 3
+
+
+def test_import_shares_titles_and_keeps_stats_exact(migrated, tmp_path):
+    path = tmp_path / "books.csv"
+    lines = ["Title,Author,Year,Genre,Status"]
+    lines += [f"Title {i % 7},Author,{1990 + i % 7},,Lost" for i in range(30)]
+    lines += ["Solaris,Lem,1961,sf,available", "Solaris,Lem,1961.0,sf,borrowed"]
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    columns = {"Title": 0, "Author": 1, "Year": 2, "Genre": 3, "Status": 4}
+
+    imported, rejects = bookworm.import_books(migrated, str(path), columns)
+
+    assert (imported, rejects) == (32, [])
+    assert migrated.execute("SELECT COUNT(*) FROM titles").fetchone()[0] == 3 + 7
+    solaris = migrated.execute(
+        "SELECT COUNT(*) FROM book_catalog WHERE Title = 'Solaris'"
+    ).fetchone()[0]
+    assert solaris == 4
+    counters = dict(migrated.execute("SELECT name, value FROM stats"))
+    bookworm.rebuild_stats(migrated)
+    assert dict(migrated.execute("SELECT name, value FROM stats")) == counters
+    assert counters["books_lost"] == 31
+
+
+def test_removed_book_with_reused_id_is_kept(baseline_db):
+    baseline_db.execute(
+        "INSERT INTO RemovedBooks VALUES (3, 'Eden', 'Lem', 1959, 'sf', 'available'), "
+        "(9, 'Ikar', 'Nowak', 2001, 'sf', 'Lost')"
+    )
+    bookworm.init_schema(baseline_db, bookworm.DEFAULT_SETTINGS)
+
+    removed = baseline_db.execute(
+        "SELECT ID, Title, Status FROM book_catalog WHERE deleted_at IS NOT NULL "
+        "ORDER BY ID"
+    ).fetchall()
+    assert removed == [(9, "Ikar", "lost"), (10, "Eden", "available")]
+    assert baseline_db.execute(
+        "SELECT action FROM logs WHERE book_id = 10"
+    ).fetchall() == [("removed book ID 3 kept as ID 10, its ID was reused",)]
+    assert not baseline_db.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'RemovedBooks'"
+    ).fetchall()
+
+
+def test_import_skips_reserved_ids(migrated, tmp_path):
+    _, first_id, last_id = bookworm.reserve_book_ids(migrated, 10)
+    path = tmp_path / "books.csv"
+    path.write_text("ID,Title\n,Dune\n20,Emma\n,Ulysses\n", encoding="utf-8")
+
+    bookworm.import_books(migrated, str(path), {"ID": 0, "Title": 1})
+
+    ids = dict(migrated.execute("SELECT Title, ID FROM book_catalog"))
+    assert (first_id, last_id) == (5, 14)
+    assert (ids["Dune"], ids["Emma"], ids["Ulysses"]) == (21, 20, 22)
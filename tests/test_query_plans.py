@@ -0,0 +1,34 @@
+import sqlite3
+
+import pytest
+
+import bookworm_gui_v420 as bookworm
+
+QUERIES = bookworm.hot_queries()
+
+
+@pytest.fixture(scope="module", params=[False, True], ids=["plain", "analyzed"])
+def seeded(request):
+    # The plans must hold both before and after ANALYZE has run
+    conn = sqlite3.connect(":memory:")
+    bookworm.seed_sample_db(conn)
+    if request.param:
+        conn.execute("ANALYZE")
+    yield conn
+    conn.close()
+
+
+@pytest.mark.parametrize(
+    "sql, args, indexes", [q[1:] for q in QUERIES], ids=[q[0] for q in QUERIES]
+)
+def test_hot_query_seeks_its_index(seeded, sql, args, indexes):
+    if isinstance(indexes, str):
+        indexes = (indexes,)
+    plan = [row[3] for row in seeded.execute("EXPLAIN QUERY PLAN " + sql, args)]
+
+    assert any(index in step for index in indexes for step in plan), plan
+    assert not [
+        step
+        for step in plan
+        if step.startswith("SCAN ") and step != "SCAN CONSTANT ROW"
+    ], plan